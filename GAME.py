@@ -3,16 +3,108 @@
 Исправления: увеличены враги на локациях, добавлен функционал для оружия, оптимизация кода
 """
 
+import argparse
+import bisect
 import random
 import time
 import json
+import marshal
 import os
 import copy
+import gc
+import hashlib
+import heapq
+import itertools
+import atexit
+import queue
+import shutil
+import threading
+from collections import deque
 from datetime import datetime, timedelta
 from enum import Enum
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 import sys
 
+try:
+    import numpy as np
+except ImportError:  # NumPy необязателен: без него оценка боя идет через CombatEngine
+    np = None
+
+class RandomStreams:
+    """Центральный источник случайности: независимые потоки подсистем от одного зерна
+    
+    Каждая подсистема тянет числа только из своего потока, поэтому лишний бросок
+    в казино не сдвигает бои и добычу, а одно зерно и один сценарий ввода
+    воспроизводят сессию целиком.
+    """
+    STREAMS = ("combat", "loot", "world", "casino", "events", "analysis")
+    
+    def __init__(self, seed: int = None):
+        for name in self.STREAMS:
+            setattr(self, name, random.Random())
+        self.generators = {}  # Генераторы NumPy потоков, создаются при первом обращении
+        self.seed = None
+        self.reseed(seed)
+    
+    def reseed(self, seed: int = None):
+        """Пересев всех потоков на месте: ранее взятые ссылки на потоки остаются верными"""
+        if seed is None:
+            seed = int.from_bytes(os.urandom(4), "big")
+        self.seed = seed
+        for name in self.STREAMS:
+            getattr(self, name).seed(f"{seed}:{name}")
+        self.generators.clear()
+    
+    def stream(self, name: str) -> random.Random:
+        """Поток подсистемы по имени"""
+        if name not in self.STREAMS:
+            raise KeyError(f"Неизвестный поток случайности: {name}")
+        return getattr(self, name)
+    
+    def getstate(self) -> Tuple:
+        """Состояние всех потоков (генераторы NumPy не сохраняются и создаются заново)"""
+        return self.seed, tuple(getattr(self, name).getstate() for name in self.STREAMS)
+    
+    def setstate(self, state: Tuple):
+        """Восстановление состояния, полученного из getstate"""
+        self.seed, states = state
+        for name, stream_state in zip(self.STREAMS, states):
+            getattr(self, name).setstate(stream_state)
+        self.generators.clear()
+    
+    def numpy(self, name: str):
+        """Генератор NumPy потока подсистемы для векторных горячих путей"""
+        generator = self.generators.get(name)
+        if generator is None:
+            generator = self.generators[name] = np.random.default_rng(self.stream(name).getrandbits(64))
+        return generator
+    
+    def predraw(self, name: str, count: int):
+        """Блок из count равномерных чисел [0, 1) одним вызовом (массив NumPy или список)"""
+        if np is not None:
+            return self.numpy(name).random(count)
+        rand = self.stream(name).random
+        return [rand() for _ in range(count)]
+
+RNG = RandomStreams()
+
+def roll_below(rng: random.Random, n: int) -> int:
+    """Равномерное целое из [0, n): getrandbits по числу бит n с отбрасыванием
+    
+    Единственный способ целых бросков боя: им пользуются и CombatEngine.run,
+    и CombatEngine.resolve_plan, поэтому оба пути тянут из потока одни и те же биты.
+    В двух самых частых бросках resolve_plan этот же цикл развернут на месте.
+    """
+    bits = n.bit_length()
+    roll = rng.getrandbits(bits)
+    while roll >= n:
+        roll = rng.getrandbits(bits)
+    return roll
+
+def roll_int(rng: random.Random, low: int, high: int) -> int:
+    """Равномерное целое из [low, high] через roll_below"""
+    return low + roll_below(rng, high - low + 1)
+
 class Color:
     """Класс для цветного вывода в терминале"""
     RED = '\033[91m'
@@ -123,7 +215,7 @@ class Deck:
             for rank, value in ranks.items():
                 self.cards.append(Card(rank, suit, value))
         
-        random.shuffle(self.cards)
+        RNG.casino.shuffle(self.cards)
     
     def draw(self):
         """Взять карту из колоды"""
@@ -131,15 +223,370 @@ class Deck:
             self.reset()
         return self.cards.pop()
 
+class StatusEffect:
+    """Активный эффект состояния: сила и оставшаяся длительность в раундах"""
+    __slots__ = ("name", "power", "duration")
+    
+    def __init__(self, name: str, power: float, duration: int):
+        self.name = name
+        self.power = power
+        self.duration = duration
+    
+    def to_dict(self) -> Dict:
+        """Сериализация эффекта"""
+        return {"name": self.name, "power": self.power, "duration": self.duration}
+
+class StatusEffects:
+    """Индексированное хранилище активных эффектов одного участника боя"""
+    STACK = "stack"  # Сила складывается, длительность - наибольшая
+    REFRESH = "refresh"  # Берутся наибольшие сила и длительность
+    REPLACE = "replace"  # Новый эффект заменяет старый
+    
+    RULES = {
+        "poison": REFRESH,  # Урон в конце каждого раунда
+        "armor_break": STACK,  # Снижение защиты
+        "stun": REFRESH,  # Пропуск хода
+        "shield": REFRESH,  # Поглощение урона каждого удара
+        "dodge": REFRESH,  # Прибавка к шансу уклонения
+        "haste": REFRESH  # Доля прибавки к скорости в очереди инициативы
+    }
+    
+    TICK_DAMAGE = ("poison",)
+    
+    __slots__ = ("effects",)
+    
+    def __init__(self):
+        self.effects = {}
+    
+    def __len__(self) -> int:
+        return len(self.effects)
+    
+    def __contains__(self, name: str) -> bool:
+        return name in self.effects
+    
+    def apply(self, name: str, power: float, duration: int) -> StatusEffect:
+        """Наложение эффекта по правилу стакания"""
+        effect = self.effects.get(name)
+        if effect is None:
+            effect = self.effects[name] = StatusEffect(name, power, duration)
+            return effect
+        
+        rule = self.RULES.get(name, self.REPLACE)
+        if rule == self.STACK:
+            effect.power += power
+            effect.duration = max(effect.duration, duration)
+        elif rule == self.REFRESH:
+            effect.power = max(effect.power, power)
+            effect.duration = max(effect.duration, duration)
+        else:
+            effect.power = power
+            effect.duration = duration
+        return effect
+    
+    def power(self, name: str) -> float:
+        """Сила эффекта или 0, если он не активен"""
+        effect = self.effects.get(name)
+        return effect.power if effect else 0
+    
+    def remove(self, name: str):
+        """Снятие эффекта"""
+        self.effects.pop(name, None)
+    
+    def clear(self):
+        """Снятие всех эффектов"""
+        self.effects.clear()
+    
+    def remaining(self, name: str) -> int:
+        """Оставшиеся раунды эффекта или 0"""
+        effect = self.effects.get(name)
+        return effect.duration if effect else 0
+    
+    def tick(self) -> int:
+        """Конец раунда: периодический урон и истечение эффектов за O(активных)"""
+        if not self.effects:
+            return 0
+        
+        damage = 0
+        expired = []
+        for name, effect in self.effects.items():
+            if name in self.TICK_DAMAGE:
+                damage += effect.power
+            effect.duration -= 1
+            if effect.duration <= 0:
+                expired.append(name)
+        
+        for name in expired:
+            del self.effects[name]
+        
+        return damage
+    
+    def to_list(self) -> List[Dict]:
+        """Сериализация всех активных эффектов"""
+        return [effect.to_dict() for effect in self.effects.values()]
+    
+    @classmethod
+    def from_list(cls, data: List[Dict]) -> "StatusEffects":
+        """Восстановление хранилища из сериализованного вида"""
+        store = cls()
+        for effect_data in data or []:
+            store.effects[effect_data["name"]] = StatusEffect(
+                effect_data["name"], effect_data["power"], effect_data["duration"])
+        return store
+
+class StatModifier:
+    """Временная прибавка к характеристике: истекает по часам игры или по числу раундов"""
+    __slots__ = ("stat", "value", "source", "expires_at", "turns")
+    
+    def __init__(self, stat: str, value: int, source: str,
+                 expires_at: Optional[int] = None, turns: Optional[int] = None):
+        self.stat = stat
+        self.value = value
+        self.source = source  # Зелье, эффект оружия и т.п.; повторный источник обновляет модификатор
+        self.expires_at = expires_at  # Игровая минута (TimerWheel.now), в которую модификатор снимается
+        self.turns = turns  # Оставшиеся раунды боя
+    
+    def to_dict(self) -> Dict:
+        """Сериализация модификатора"""
+        return {"stat": self.stat, "value": self.value, "source": self.source,
+                "expires_at": self.expires_at, "turns": self.turns}
+
+class StatModifiers:
+    """Стек модификаторов поверх базовых характеристик
+    
+    Суммы по характеристикам считаются один раз при изменении набора; version
+    растет с каждым изменением, по ней владелец сбрасывает свои кэши.
+    """
+    __slots__ = ("modifiers", "totals", "next_expiry", "turn_based", "version")
+    
+    WALL_CLOCK = 10 ** 9  # expires_at больше - время time.time() из старых сохранений
+    
+    def __init__(self):
+        self.modifiers: Dict[Tuple[str, str], StatModifier] = {}
+        self.totals: Dict[str, int] = {}
+        self.next_expiry = float("inf")  # Ближайшее истечение по часам
+        self.turn_based = 0  # Модификаторов с отсчетом раундов
+        self.version = 0
+    
+    def __len__(self) -> int:
+        return len(self.modifiers)
+    
+    def __iter__(self):
+        return iter(self.modifiers.values())
+    
+    def add(self, stat: str, value: int, source: str, minutes: Optional[int] = None,
+            turns: Optional[int] = None, now: int = 0) -> StatModifier:
+        """Модификатор на minutes игровых минут от минуты now или turns раундов; без них - до снятия"""
+        key = (source, stat)
+        if minutes is None:
+            current = self.modifiers.get(key)
+            if current is not None and current.value == value and current.expires_at is None:
+                # Продление того же раундового модификатора: суммы не меняются
+                if (current.turns is None) == (turns is None):
+                    current.turns = turns
+                    return current
+            expires_at = None
+        else:
+            expires_at = now + minutes
+        modifier = StatModifier(stat, value, source, expires_at, turns)
+        self.modifiers[key] = modifier
+        self._changed()
+        return modifier
+    
+    def remove(self, source: str) -> List[StatModifier]:
+        """Снятие всех модификаторов источника"""
+        removed = [modifier for key, modifier in self.modifiers.items() if key[0] == source]
+        return self._drop(removed)
+    
+    def expire(self, now: int) -> List[StatModifier]:
+        """Снятие истекших к игровой минуте now; без истекших - O(1)"""
+        if now < self.next_expiry:
+            return []
+        return self._drop([modifier for modifier in self.modifiers.values()
+                           if modifier.expires_at is not None and modifier.expires_at <= now])
+    
+    def tick(self) -> List[StatModifier]:
+        """Конец раунда боя: отсчет модификаторов с длительностью в раундах"""
+        if not self.turn_based:
+            return []
+        expired = []
+        for modifier in self.modifiers.values():
+            if modifier.turns is not None:
+                modifier.turns -= 1
+                if modifier.turns <= 0:
+                    expired.append(modifier)
+        return self._drop(expired)
+    
+    def drop_turn_based(self) -> List[StatModifier]:
+        """Конец боя: раундовые модификаторы за его пределами не действуют"""
+        if not self.turn_based:
+            return []
+        return self._drop([modifier for modifier in self.modifiers.values() if modifier.turns is not None])
+    
+    def apply(self, base: Dict[str, int]) -> Dict[str, int]:
+        """Эффективные характеристики: базовые плюс суммы модификаторов"""
+        stats = dict(base)
+        for stat, value in self.totals.items():
+            stats[stat] = stats.get(stat, 0) + value
+        return stats
+    
+    def _drop(self, modifiers: List[StatModifier]) -> List[StatModifier]:
+        for modifier in modifiers:
+            del self.modifiers[(modifier.source, modifier.stat)]
+        if modifiers:
+            self._changed()
+        return modifiers
+    
+    def _changed(self):
+        totals = {}
+        next_expiry = float("inf")
+        turn_based = 0
+        for modifier in self.modifiers.values():
+            totals[modifier.stat] = totals.get(modifier.stat, 0) + modifier.value
+            if modifier.expires_at is not None:
+                next_expiry = min(next_expiry, modifier.expires_at)
+            if modifier.turns is not None:
+                turn_based += 1
+        self.totals = totals
+        self.next_expiry = next_expiry
+        self.turn_based = turn_based
+        self.version += 1
+    
+    def to_list(self) -> List[Dict]:
+        """Сериализация всех модификаторов"""
+        return [modifier.to_dict() for modifier in self.modifiers.values()]
+    
+    @classmethod
+    def from_list(cls, data: List[Dict], now: int = 0) -> "StatModifiers":
+        """Восстановление стека из сериализованного вида
+        
+        Старые сохранения хранили срок во времени time.time(): остаток
+        переводится в игровые минуты от now, истекшие модификаторы отбрасываются.
+        """
+        store = cls()
+        for modifier_data in data or []:
+            expires_at = modifier_data.get("expires_at")
+            if expires_at is not None and expires_at > cls.WALL_CLOCK:
+                left = expires_at - time.time()
+                if left <= 0:
+                    continue
+                expires_at = now + int(left // 60) + 1
+            modifier = StatModifier(modifier_data["stat"], modifier_data["value"], modifier_data["source"],
+                                    expires_at, modifier_data.get("turns"))
+            store.modifiers[(modifier.source, modifier.stat)] = modifier
+        store._changed()
+        return store
+
+class EffectHandler:
+    """Скомпилированный обработчик эффекта: функция и ее параметры"""
+    __slots__ = ("key", "apply", "title", "damage_mult")
+    
+    def __init__(self, key: str, apply: Callable, title: str = None, damage_mult: float = 0):
+        self.key = key
+        self.apply = apply
+        self.title = title or key
+        self.damage_mult = damage_mult
+
+class HandlerRegistry:
+    """Реестр обработчиков по идентификатору эффекта или способности"""
+    def __init__(self):
+        self.handlers: Dict[str, EffectHandler] = {}
+    
+    def register(self, key: str, title: str = None, damage_mult: float = 0):
+        """Декоратор регистрации обработчика"""
+        def decorator(func: Callable) -> Callable:
+            self.handlers[key] = EffectHandler(key, func, title, damage_mult)
+            return func
+        return decorator
+    
+    def resolve(self, key: Optional[str]) -> Optional[EffectHandler]:
+        """Обработчик по идентификатору или None, если он не зарегистрирован"""
+        return self.handlers.get(key) if key else None
+    
+    def title(self, key: str) -> str:
+        """Отображаемое название эффекта"""
+        handler = self.handlers.get(key)
+        return handler.title if handler else key
+    
+    def __contains__(self, key: str) -> bool:
+        return key in self.handlers
+
+# Эффекты оружия: обработчик (item, player, enemy) -> (бонусный урон, сообщение)
+WEAPON_EFFECTS = HandlerRegistry()
+
+@WEAPON_EFFECTS.register("fire_damage", "Огненный урон")
+def _fire_damage(item, player, enemy) -> Tuple[int, str]:
+    # Дополнительный огненный урон
+    bonus_damage = roll_int(RNG.combat, 3, 8)
+    return bonus_damage, f"{Color.RED}Огненный урон! +{bonus_damage}{Color.END}"
+
+@WEAPON_EFFECTS.register("mana_steal", "Кража маны")
+def _mana_steal(item, player, enemy) -> Tuple[int, str]:
+    # Кража маны
+    mana_steal = roll_int(RNG.combat, 5, 15)
+    if enemy and hasattr(enemy, 'type') and enemy.type == EnemyType.NECROMANCER:
+        # Некроманты дают больше маны
+        mana_steal *= 2
+    player.mana = min(player.max_mana, player.mana + mana_steal)
+    return 0, f"{Color.BLUE}Кража маны! +{mana_steal} маны{Color.END}"
+
+@WEAPON_EFFECTS.register("critical_chance", "Шанс крита")
+def _critical_chance(item, player, enemy) -> Tuple[int, str]:
+    # Увеличенный шанс крита: удача на несколько раундов, повторное срабатывание продлевает
+    player.add_modifier("luck", item.CRITICAL_LUCK, "critical_chance", turns=item.CRITICAL_LUCK_TURNS)
+    return 0, f"{Color.YELLOW}Увеличен шанс критического удара!{Color.END}"
+
+@WEAPON_EFFECTS.register("poison", "Яд")
+def _poison(item, player, enemy) -> Tuple[int, str]:
+    # Яд наносит урон в конце каждого из 3 раундов
+    poison_damage = roll_int(RNG.combat, 2, 5)
+    if enemy:
+        enemy.active_effects.apply("poison", poison_damage, item.POISON_DURATION)
+    return 0, f"{Color.GREEN}Ядовитый урон! +{poison_damage} в течение 3 ходов{Color.END}"
+
+@WEAPON_EFFECTS.register("life_steal", "Кража здоровья")
+def _life_steal(item, player, enemy) -> Tuple[int, str]:
+    # Кража здоровья
+    life_steal = roll_int(RNG.combat, 3, 10)
+    player.heal(life_steal)
+    return 0, f"{Color.RED}Кража здоровья! +{life_steal} HP{Color.END}"
+
+@WEAPON_EFFECTS.register("stun_chance", "Оглушение")
+def _stun_chance(item, player, enemy) -> Tuple[int, str]:
+    # Шанс оглушения
+    stun_chance = RNG.combat.random()
+    if stun_chance < 0.2:  # 20% шанс оглушить
+        if enemy:
+            enemy.active_effects.apply("stun", 1, 1)
+        return 0, f"{Color.PURPLE}Противник оглушен на 1 ход!{Color.END}"
+    return 0, ""
+
+@WEAPON_EFFECTS.register("armor_penetration", "Пробитие брони")
+def _armor_penetration(item, player, enemy) -> Tuple[int, str]:
+    # Пробивание брони
+    return 5, f"{Color.CYAN}Пробитие брони! Игнорирует 5 защиты{Color.END}"
+
+class WearCounter:
+    """Общий счетчик износа: удар увеличивает его один раз для всех привязанных к нему вещей"""
+    __slots__ = ("hits",)
+    
+    def __init__(self):
+        self.hits = 0
+
 class Item:
     """Класс предмета с улучшениями"""
+    POISON_DURATION = 3
+    CRITICAL_LUCK = 3  # Прибавка к удаче от эффекта critical_chance
+    CRITICAL_LUCK_TURNS = 3  # На сколько раундов боя
+    WEARABLE = (ItemType.WEAPON, ItemType.ARMOR, ItemType.HELMET, ItemType.GLOVES, ItemType.BOOTS)
+    _ids = itertools.count(1000)  # Номера предметов: счетчик, а не бросок, чтобы не сдвигать потоки RNG
+    
     def __init__(self, name: str, item_type: ItemType, value: int = 0, 
                 damage: int = 0, defense: int = 0, health: int = 0,
                 mana: int = 0, description: str = "", durability: int = 100,
                 required_level: int = 1, armor_slot: str = None,
                 character_classes: List[CharacterClass] = None,
                 special_effect: str = None):
-        self.id = random.randint(1000, 9999)
+        self.id = next(Item._ids)
         self.name = name
         self.item_type = item_type
         self.value = value
@@ -148,14 +595,46 @@ class Item:
         self.health = health
         self.mana = mana
         self.description = description
+        self.wear = None  # WearCounter надетой вещи: износ копится в нем и читается лениво
+        self.wear_base = 0
         self.durability = durability
         self.max_durability = durability
         self.required_level = required_level
         self.armor_slot = armor_slot
-        self.special_effect = special_effect  # Специальный эффект оружия
+        self.special_effect = special_effect  # Специальный эффект оружия (обработчик разрешается сразу)
         self.rarity = self.calculate_rarity()
         self.character_classes = character_classes or [CharacterClass.WARRIOR, CharacterClass.MAGE, CharacterClass.ARCHER, CharacterClass.ROGUE]
     
+    @property
+    def durability(self) -> int:
+        wear = self.wear
+        if wear is None:
+            return self._durability
+        return max(0, self._durability - (wear.hits - self.wear_base))
+    
+    @durability.setter
+    def durability(self, value: int):
+        self._durability = value
+        if self.wear is not None:
+            self.wear_base = self.wear.hits
+    
+    def bind_wear(self, counter: Optional[WearCounter]):
+        """Перенести накопленный износ в прочность и считать дальнейший от counter"""
+        self._durability = self.durability
+        self.wear = counter
+        self.wear_base = counter.hits if counter is not None else 0
+    
+    @property
+    def special_effect(self) -> Optional[str]:
+        return self._special_effect
+    
+    @special_effect.setter
+    def special_effect(self, effect: Optional[str]):
+        self._special_effect = effect
+        # Функция обработчика связывается один раз: удар зовет ее без обращения к реестру и EffectHandler
+        handler = WEAPON_EFFECTS.resolve(effect)
+        self.effect_apply = handler.apply if handler is not None else None
+    
     def is_suitable_for_class(self, character_class: CharacterClass) -> bool:
         """Проверка, подходит ли предмет для класса персонажа"""
         return character_class in self.character_classes
@@ -191,14 +670,14 @@ class Item:
     
     def degrade(self, amount: int = 1):
         """Уменьшение прочности предмета"""
-        if self.item_type in [ItemType.WEAPON, ItemType.ARMOR, ItemType.HELMET, ItemType.GLOVES, ItemType.BOOTS]:
+        if self.item_type in self.WEARABLE:
             self.durability = max(0, self.durability - amount)
             return self.durability <= 0
         return False
     
     def repair(self, amount: int = 100):
         """Ремонт предмета"""
-        if self.item_type in [ItemType.WEAPON, ItemType.ARMOR, ItemType.HELMET, ItemType.GLOVES, ItemType.BOOTS]:
+        if self.item_type in self.WEARABLE:
             self.durability = min(self.max_durability, self.durability + amount)
     
     def copy(self):
@@ -228,155 +707,740 @@ class Item:
     
     def apply_special_effect(self, player, enemy=None) -> Tuple[int, str]:
         """Применение специального эффекта оружия"""
-        if not self.special_effect:
+        apply = self.effect_apply
+        if apply is None:
             return 0, ""
+        return apply(self, player, enemy)
+
+# Способности врагов: обработчик (enemy, target) -> (урон, сообщение)
+ENEMY_ABILITIES = HandlerRegistry()
+
+@ENEMY_ABILITIES.register("Огненное дыхание", damage_mult=1.5)
+def _fire_breath(enemy, target) -> Tuple[int, str]:
+    damage = int(enemy.damage * 1.5)
+    return damage, f"{enemy.name} использует Огненное дыхание!"
+
+@ENEMY_ABILITIES.register("Магический щит")
+def _magic_shield(enemy, target) -> Tuple[int, str]:
+    enemy.active_effects.apply("shield", enemy.SHIELD_POWER, enemy.ABILITY_EFFECT_DURATION)
+    return 0, f"{enemy.name} использует Магический щит! (поглощает {enemy.SHIELD_POWER} урона)"
+
+@ENEMY_ABILITIES.register("Ядовитый укус", damage_mult=1.2)
+def _poison_bite(enemy, target) -> Tuple[int, str]:
+    damage = int(enemy.damage * 1.2)
+    if target:
+        target.active_effects.apply("poison", enemy.poison_power(), enemy.ABILITY_EFFECT_DURATION)
+    return damage, f"{enemy.name} использует Ядовитый укус! (яд)"
+
+@ENEMY_ABILITIES.register("Кислотная атака", damage_mult=0.8)
+def _acid_attack(enemy, target) -> Tuple[int, str]:
+    damage = int(enemy.damage * 0.8)
+    armor_reduction = enemy.ACID_ARMOR_REDUCTION
+    if target:
+        target.active_effects.apply("armor_break", armor_reduction, enemy.ABILITY_EFFECT_DURATION)
+    return damage, f"{enemy.name} использует Кислотную атаку! (-{armor_reduction} защиты)"
+
+@ENEMY_ABILITIES.register("Воскрешение скелетов")
+def _raise_skeletons(enemy, target) -> Tuple[int, str]:
+    # Здесь можно было бы добавить логику воскрешения
+    return 0, f"{enemy.name} пытается воскресить скелетов!"
+
+REQUIRED = object()  # Поле схемы без значения по умолчанию
+
+class ContentError(ValueError):
+    """Ошибка содержимого игры: неверный JSON, несовпадение со схемой или битая ссылка"""
+
+class ContentCatalog:
+    """Каталог содержимого игры: data/*.json, проверенные по схемам, со скомпилированным кэшем
+    
+    Каждый вид содержимого - свой JSON-файл. Компиляция проверяет файлы по
+    SCHEMAS и ссылки между ними, дополняет поля значениями по умолчанию и
+    записывает результат снимком marshal вместе с хэшем содержимого и
+    отпечатком исходников (размер и время изменения). Пока отпечаток совпадает,
+    каталог загружается одним чтением кэша, без разбора JSON и проверок.
+    
+    Схема объекта - словарь {поле: (проверка, значение по умолчанию)}; проверка -
+    тип, перечисление (имя элемента), реестр обработчиков (ключ в нем), [проверка]
+    для списка, кортеж проверок для списка фиксированной длины, схема вложенного
+    объекта или {перечисление: проверка} для словаря по именам элементов.
+    """
+    VERSION = 1  # Повышается при изменении схем: кэш прежней версии пересобирается
+    DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+    CACHE = "content.cache"
+    
+    ITEM = {
+        "name": (str, REQUIRED),
+        "type": (ItemType, REQUIRED),
+        "value": (int, 0),
+        "damage": (int, 0),
+        "defense": (int, 0),
+        "health": (int, 0),
+        "mana": (int, 0),
+        "description": (str, ""),
+        "durability": (int, 100),
+        "required_level": (int, 1),
+        "armor_slot": (str, None),
+        "classes": ([CharacterClass], None),  # None - подходит всем классам
+        "special_effect": (WEAPON_EFFECTS, None)
+    }
+    LOCATION = {
+        "name": (str, REQUIRED),
+        "type": (LocationType, REQUIRED),
+        "levels": ((int, int), REQUIRED),
+        "description": (str, REQUIRED),
+        "connections": ([str], []),
+        "has_shop": (bool, False),
+        "has_tavern": (bool, False),
+        "has_bordello": (bool, False),
+        "special_event_chance": (float, 0.1)
+    }
+    QUEST = {
+        "name": (str, REQUIRED),
+        "description": (str, REQUIRED),
+        "location": (str, REQUIRED),
+        "reward_xp": (int, REQUIRED),
+        "reward_gold": (int, REQUIRED),
+        "required_level": (int, 1),
+        "type": (str, "main"),
+        "time_limit": (int, 0),  # Минут игровых часов (0 - без ограничения)
+        "objectives": ([{"description": (str, REQUIRED), "target": (str, REQUIRED), "count": (int, REQUIRED)}], []),
+        "rewards": ([str], [])  # Имена предметов из items
+    }
+    GIRL = {
+        "name": (str, REQUIRED),
+        "specialty": (str, REQUIRED),
+        "price": (int, REQUIRED),
+        "description": (str, "")
+    }
+    ENEMY = {
+        "health": (int, REQUIRED),
+        "damage": (int, REQUIRED),
+        "defense": (int, REQUIRED),
+        "xp": (int, REQUIRED),
+        "gold": ((int, int), REQUIRED),
+        "speed": (int, 100),  # Частота ходов: 100 - раз в раунд
+        "abilities": ([ENEMY_ABILITIES], [])
+    }
+    ENCOUNTER_BAND = {
+        "from": (int, REQUIRED),  # Полоса действует с этого уровня до начала следующей
+        "enemies": ({EnemyType: float}, REQUIRED)  # Враг -> вес
+    }
+    SCHEMAS = {
+        "items": [ITEM],
+        "world": [LOCATION],
+        "quests": [QUEST],
+        "bordello": [GIRL],
+        "enemies": {EnemyType: ENEMY},
+        "encounters": {LocationType: [ENCOUNTER_BAND]}
+    }
+    
+    def __init__(self, content: Dict, digest: str):
+        self.digest = digest  # Хэш исходников: одинаковое содержимое - одинаковый хэш
+        self.items: List[Dict] = content["items"]
+        self.world: List[Dict] = content["world"]
+        self.quests: List[Dict] = content["quests"]
+        self.bordello: List[Dict] = content["bordello"]
+        self.enemies: Dict[str, Dict] = content["enemies"]
+        self.encounters: Dict[str, List[Dict]] = content["encounters"]
+    
+    @classmethod
+    def load(cls, directory: str = None) -> "ContentCatalog":
+        """Каталог из кэша, если исходники не менялись, иначе компиляция с записью кэша"""
+        directory = directory or cls.DIRECTORY
+        fingerprint = cls.fingerprint(directory)
+        cached = None
+        try:
+            with open(os.path.join(directory, cls.CACHE), "rb") as f:
+                cached = marshal.loads(f.read())  # Одно чтение: marshal.load читает файл мелкими порциями
+            version, cached_fingerprint, digest, content = cached
+        except (OSError, EOFError, ValueError, TypeError):
+            cached = None
+        else:
+            if version == (cls.VERSION, marshal.version) and cached_fingerprint == fingerprint:
+                return cls(content, digest)
+        return cls.compile(directory, cached)
+    
+    @classmethod
+    def fingerprint(cls, directory: str) -> List:
+        """Размеры и времена изменения исходников: сверяются без их чтения"""
+        fingerprint = []
+        for kind in cls.SCHEMAS:
+            stat = os.stat(os.path.join(directory, f"{kind}.json"))
+            fingerprint.append([kind, stat.st_size, stat.st_mtime_ns])
+        return fingerprint
+    
+    @classmethod
+    def compile(cls, directory: str = None, cached: Tuple = None) -> "ContentCatalog":
+        """Проверка исходников и запись кэша; ошибка содержимого - ContentError с путем к полю
+        
+        Если исходники только тронуты (хэш тот же), проверенные данные берутся из
+        прежнего кэша и обновляется лишь отпечаток.
+        """
+        directory = directory or cls.DIRECTORY
+        fingerprint = cls.fingerprint(directory)
+        sources = {}
+        digest = hashlib.sha256()
+        for kind in cls.SCHEMAS:
+            with open(os.path.join(directory, f"{kind}.json"), "rb") as f:
+                sources[kind] = f.read()
+            digest.update(kind.encode() + b"\0" + sources[kind] + b"\0")
+        digest = digest.hexdigest()
+        
+        if cached is not None and cached[0] == (cls.VERSION, marshal.version) and cached[2] == digest:
+            content = cached[3]
+        else:
+            content = {}
+            for kind, schema in cls.SCHEMAS.items():
+                try:
+                    data = json.loads(sources[kind])
+                except ValueError as error:
+                    raise ContentError(f"{kind}.json: неверный JSON: {error}") from None
+                content[kind] = cls.check(schema, data, f"{kind}.json")
+            cls.check_links(content)
         
-        effect = self.special_effect
-        if effect == "fire_damage":
-            # Дополнительный огненный урон
-            bonus_damage = random.randint(3, 8)
-            return bonus_damage, f"{Color.RED}Огненный урон! +{bonus_damage}{Color.END}"
-        
-        elif effect == "mana_steal":
-            # Кража маны
-            mana_steal = random.randint(5, 15)
-            if enemy and hasattr(enemy, 'type') and enemy.type == EnemyType.NECROMANCER:
-                # Некроманты дают больше маны
-                mana_steal *= 2
-            player.mana = min(player.max_mana, player.mana + mana_steal)
-            return 0, f"{Color.BLUE}Кража маны! +{mana_steal} маны{Color.END}"
-        
-        elif effect == "critical_chance":
-            # Увеличенный шанс крита
-            player.stats["luck"] += 3  # Временный бонус
-            return 0, f"{Color.YELLOW}Увеличен шанс критического удара!{Color.END}"
-        
-        elif effect == "poison":
-            # Ядовитый урон
-            poison_damage = random.randint(2, 5)
-            return poison_damage, f"{Color.GREEN}Ядовитый урон! +{poison_damage} в течение 3 ходов{Color.END}"
-        
-        elif effect == "life_steal":
-            # Кража здоровья
-            life_steal = random.randint(3, 10)
-            player.heal(life_steal)
-            return 0, f"{Color.RED}Кража здоровья! +{life_steal} HP{Color.END}"
-        
-        elif effect == "stun_chance":
-            # Шанс оглушения
-            stun_chance = random.random()
-            if stun_chance < 0.2:  # 20% шанс оглушить
-                return 0, f"{Color.PURPLE}Противник оглушен на 1 ход!{Color.END}"
+        path = os.path.join(directory, cls.CACHE)
+        try:
+            with open(path + ".tmp", "wb") as f:
+                marshal.dump(((cls.VERSION, marshal.version), fingerprint, digest, content), f)
+            os.replace(path + ".tmp", path)
+        except OSError:
+            pass  # Каталог только для чтения: работаем без кэша
+        return cls(content, digest)
+    
+    @classmethod
+    def check(cls, spec, value, path: str):
+        """Значение по спецификации схемы; возвращает его с заполненными умолчаниями"""
+        if isinstance(spec, list):
+            if not isinstance(value, list):
+                raise ContentError(f"{path}: ожидается список")
+            return [cls.check(spec[0], element, f"{path}[{index}]") for index, element in enumerate(value)]
+        if isinstance(spec, tuple):
+            if not isinstance(value, list) or len(value) != len(spec):
+                raise ContentError(f"{path}: ожидается список из {len(spec)} значений")
+            return [cls.check(element_spec, element, f"{path}[{index}]")
+                    for index, (element_spec, element) in enumerate(zip(spec, value))]
+        if isinstance(spec, dict):
+            if not isinstance(value, dict):
+                raise ContentError(f"{path}: ожидается объект")
+            key_spec = next(iter(spec))
+            if isinstance(key_spec, type) and issubclass(key_spec, Enum):
+                checked = {}
+                for key, element in value.items():
+                    cls.check(key_spec, key, path)
+                    checked[key] = cls.check(spec[key_spec], element, f"{path}.{key}")
+                return checked
+            unknown = [key for key in value if key not in spec]
+            if unknown:
+                raise ContentError(f"{path}: неизвестные поля {unknown}")
+            checked = {}
+            for key, (field_spec, default) in spec.items():
+                if key in value and value[key] is not None:
+                    checked[key] = cls.check(field_spec, value[key], f"{path}.{key}")
+                elif default is REQUIRED:
+                    raise ContentError(f"{path}: нет обязательного поля {key}")
+                else:
+                    checked[key] = copy.deepcopy(default)
+            return checked
+        if isinstance(spec, type) and issubclass(spec, Enum):
+            if value not in spec.__members__:
+                raise ContentError(f"{path}: неизвестное значение {spec.__name__}: {value!r}")
+            return value
+        if isinstance(spec, HandlerRegistry):
+            if value not in spec:
+                raise ContentError(f"{path}: неизвестный эффект {value!r}")
+            return value
+        if spec is float:
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ContentError(f"{path}: ожидается число, получено {value!r}")
+            return float(value)
+        if isinstance(value, bool) != (spec is bool) or not isinstance(value, spec):
+            raise ContentError(f"{path}: ожидается {spec.__name__}, получено {value!r}")
+        return value
+    
+    @staticmethod
+    def check_links(content: Dict):
+        """Ссылки между файлами: имена уникальны, связи и награды указывают на существующее"""
+        names = {}
+        for kind in ("items", "world", "quests", "bordello"):
+            names[kind] = set()
+            for entry in content[kind]:
+                if entry["name"] in names[kind]:
+                    raise ContentError(f"{kind}.json: имя {entry['name']!r} встречается дважды")
+                names[kind].add(entry["name"])
+        for entry in content["world"]:
+            for name in entry["connections"]:
+                if name not in names["world"]:
+                    raise ContentError(f"world.json: {entry['name']}: неизвестная связь {name!r}")
+        for entry in content["quests"]:
+            if entry["location"] not in names["world"]:
+                raise ContentError(f"quests.json: {entry['name']}: неизвестная локация {entry['location']!r}")
+            for name in entry["rewards"]:
+                if name not in names["items"]:
+                    raise ContentError(f"quests.json: {entry['name']}: неизвестный предмет {name!r}")
+    
+    def enemy_stats(self) -> Dict[EnemyType, Dict]:
+        """Базовые характеристики врагов по типу; золото - кортеж (мин, макс)"""
+        return {EnemyType[name]: {"health": stats["health"], "damage": stats["damage"], "defense": stats["defense"],
+                                  "xp": stats["xp"], "gold": tuple(stats["gold"]), "speed": stats["speed"]}
+                for name, stats in self.enemies.items()}
+    
+    def enemy_abilities(self) -> Dict[EnemyType, Tuple[str, ...]]:
+        return {EnemyType[name]: tuple(stats["abilities"])
+                for name, stats in self.enemies.items() if stats["abilities"]}
+
+CONTENT = ContentCatalog.load()
+
+class EnemyTemplate:
+    """Предрасчитанные характеристики врага для тройки (тип, уровень, сложность)"""
+    __slots__ = ("type", "level", "difficulty", "name", "max_health", "damage", "defense",
+                 "xp_reward", "gold_range", "loot_chance", "speed", "special_abilities", "ability_handlers")
+    
+    def __init__(self, enemy_type: EnemyType, level: int, difficulty: Difficulty):
+        stats = Enemy.BASE_STATS.get(enemy_type, Enemy.BASE_STATS[EnemyType.GOBLIN])
         
-        elif effect == "armor_penetration":
-            # Пробивание брони
-            return 5, f"{Color.CYAN}Пробитие брони! Игнорирует 5 защиты{Color.END}"
+        # Масштабирование по уровню и модификатор сложности
+        scale = 1 + (level - 1) * 0.3
+        difficulty_mult = Enemy.DIFFICULTY_MULT.get(difficulty, 1.0)
         
-        return 0, ""
-
-class Enemy:
-    """Класс врага с улучшениями"""
-    def __init__(self, enemy_type: EnemyType, level: int = 1, difficulty: Difficulty = Difficulty.NORMAL):
         self.type = enemy_type
         self.level = level
-        self.name = f"{enemy_type.value} Ур.{level}"
         self.difficulty = difficulty
-        
-        # Базовые характеристики в зависимости от типа
-        base_stats = {
-            EnemyType.GOBLIN: {"health": 30, "damage": 5, "defense": 2, "xp": 30, "gold": (20, 25)},
-            EnemyType.ORC: {"health": 40, "damage": 8, "defense": 5, "xp": 30, "gold": (25, 30)},
-            EnemyType.WOLF: {"health": 20, "damage": 6, "defense": 1, "xp": 15, "gold": (10, 20)},
-            EnemyType.SKELETON: {"health": 30, "damage": 7, "defense": 3, "xp": 15, "gold": (10, 15)},
-            EnemyType.TROLL: {"health": 55, "damage": 12, "defense": 8, "xp": 30, "gold": (10, 25)},
-            EnemyType.DRAGON: {"health": 200, "damage": 25, "defense": 15, "xp": 150, "gold": (50, 100)},
-            EnemyType.BANDIT: {"health": 35, "damage": 6, "defense": 4, "xp": 20, "gold": (20, 25)},
-            EnemyType.SPIDER: {"health": 15, "damage": 4, "defense": 1, "xp": 20, "gold": (10, 15)},
-            EnemyType.WITCH: {"health": 40, "damage": 9, "defense": 3, "xp": 30, "gold": (15, 30)},
-            EnemyType.NECROMANCER: {"health": 60, "damage": 11, "defense": 6, "xp": 40, "gold": (20, 40)},
-            EnemyType.SLIME: {"health": 25, "damage": 3, "defense": 1, "xp": 20, "gold": (10, 20)}
-        }
-        
-        stats = base_stats.get(enemy_type, base_stats[EnemyType.GOBLIN])
-        
-        # Масштабирование по уровню
-        scale = 1 + (level - 1) * 0.3
-        
-        # Модификатор сложности
-        difficulty_mult = {
-            Difficulty.EASY: 0.8,
-            Difficulty.NORMAL: 1.0,
-            Difficulty.HARD: 1.3,
-            Difficulty.INSANE: 1.8
-        }.get(difficulty, 1.0)
-        
+        self.name = f"{enemy_type.value} Ур.{level}"
         self.max_health = int(stats["health"] * scale * difficulty_mult)
-        self.health = self.max_health
         self.damage = int(stats["damage"] * scale * difficulty_mult)
         self.defense = int(stats["defense"] * scale * difficulty_mult)
         self.xp_reward = int(stats["xp"] * scale * difficulty_mult)
         
         # Награда золотом с учетом сложности
         gold_min, gold_max = stats["gold"]
-        gold_min = int(gold_min * scale * difficulty_mult)
-        gold_max = int(gold_max * scale * difficulty_mult)
-        self.gold_reward = random.randint(gold_min, gold_max)
+        self.gold_range = (int(gold_min * scale * difficulty_mult), int(gold_max * scale * difficulty_mult))
         
         # Шанс выпадения лута в зависимости от сложности
         self.loot_chance = 0.3 * difficulty_mult
         
-        # Особые способности врагов
-        self.special_abilities = self.get_special_abilities()
+        # Скорость от уровня и сложности не зависит: это свойство вида
+        self.speed = stats["speed"]
+        
+        # Особые способности врагов: общие для типа, обработчики разрешены заранее
+        self.special_abilities = Enemy.TYPE_ABILITIES.get(enemy_type, ())
+        self.ability_handlers = Enemy._compile_abilities(enemy_type)
+
+class Enemy:
+    """Класс врага с улучшениями
+    
+    Неизменяемые характеристики берутся из общего EnemyTemplate, в экземпляре
+    хранится только изменяемое в бою состояние.
+    """
+    SHIELD_POWER = 5
+    ACID_ARMOR_REDUCTION = 2
+    ABILITY_EFFECT_DURATION = 3
+    
+    # Базовые характеристики в зависимости от типа (data/enemies.json); speed - частота ходов (100 - раз в раунд)
+    BASE_STATS = CONTENT.enemy_stats()
+    
+    DIFFICULTY_MULT = {
+        Difficulty.EASY: 0.8,
+        Difficulty.NORMAL: 1.0,
+        Difficulty.HARD: 1.3,
+        Difficulty.INSANE: 1.8
+    }
+    
+    TYPE_ABILITIES = CONTENT.enemy_abilities()
+    _compiled_abilities: Dict[EnemyType, Dict[str, EffectHandler]] = {}
+    _templates: Dict[Tuple[EnemyType, int, Difficulty], EnemyTemplate] = {}
+    
+    __slots__ = ("template", "max_health", "health", "damage", "defense", "gold_reward", "active_effects")
+    
+    def __init__(self, enemy_type: EnemyType, level: int = 1, difficulty: Difficulty = Difficulty.NORMAL):
+        template = self.template_for(enemy_type, level, difficulty)
+        self.template = template
+        self.max_health = self.health = template.max_health
+        self.damage = template.damage
+        self.defense = template.defense
+        self.gold_reward = RNG.loot.randint(*template.gold_range)
+        self.active_effects = StatusEffects()
+    
+    @classmethod
+    def template_for(cls, enemy_type: EnemyType, level: int = 1,
+                     difficulty: Difficulty = Difficulty.NORMAL) -> EnemyTemplate:
+        """Общий шаблон характеристик, рассчитываемый один раз на (тип, уровень, сложность)"""
+        key = (enemy_type, level, difficulty)
+        template = cls._templates.get(key)
+        if template is None:
+            template = cls._templates[key] = EnemyTemplate(enemy_type, level, difficulty)
+        return template
     
-    def get_special_abilities(self) -> List[str]:
+    @classmethod
+    def from_template(cls, template: EnemyTemplate, gold_reward: int) -> "Enemy":
+        """Враг по готовому шаблону и заранее выброшенному золоту, без обращения к RNG"""
+        enemy = cls.__new__(cls)
+        enemy.template = template
+        enemy.max_health = enemy.health = template.max_health
+        enemy.damage = template.damage
+        enemy.defense = template.defense
+        enemy.gold_reward = gold_reward
+        enemy.active_effects = StatusEffects()
+        return enemy
+    
+    @classmethod
+    def spawn(cls, enemy_type: EnemyType, level: int = 1, difficulty: Difficulty = Difficulty.NORMAL,
+              count: int = 1) -> List["Enemy"]:
+        """Пакетное создание одинаковых врагов для симуляций: золото тянется блоком
+        
+        Сборщик мусора на время пакета приостанавливается: циклов здесь нет, а его
+        проходы по растущему списку занимали большую часть времени создания.
+        """
+        template = cls.template_for(enemy_type, level, difficulty)
+        gold_min, gold_max = template.gold_range
+        if np is not None:
+            golds = RNG.numpy("loot").integers(gold_min, gold_max + 1, count).tolist()
+        else:
+            rand = RNG.loot.randint
+            golds = [rand(gold_min, gold_max) for _ in range(count)]
+        
+        max_health, damage, defense = template.max_health, template.damage, template.defense
+        new = cls.__new__
+        enemies = []
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for gold in golds:
+                enemy = new(cls)
+                enemy.template = template
+                enemy.max_health = enemy.health = max_health
+                enemy.damage = damage
+                enemy.defense = defense
+                enemy.gold_reward = gold
+                enemy.active_effects = StatusEffects()
+                enemies.append(enemy)
+        finally:
+            if gc_enabled:
+                gc.enable()
+        return enemies
+    
+    @property
+    def type(self) -> EnemyType:
+        return self.template.type
+    
+    @property
+    def level(self) -> int:
+        return self.template.level
+    
+    @property
+    def difficulty(self) -> Difficulty:
+        return self.template.difficulty
+    
+    @property
+    def name(self) -> str:
+        return self.template.name
+    
+    @property
+    def xp_reward(self) -> int:
+        return self.template.xp_reward
+    
+    @property
+    def loot_chance(self) -> float:
+        return self.template.loot_chance
+    
+    @property
+    def special_abilities(self) -> Tuple[str, ...]:
+        return self.template.special_abilities
+    
+    @property
+    def ability_handlers(self) -> Dict[str, EffectHandler]:
+        return self.template.ability_handlers
+    
+    def get_special_abilities(self) -> Tuple[str, ...]:
         """Получение особых способностей врага"""
-        abilities = []
-        
-        if self.type == EnemyType.DRAGON:
-            abilities.append("Огненное дыхание")
-        elif self.type == EnemyType.WITCH:
-            abilities.append("Магический щит")
-        elif self.type == EnemyType.NECROMANCER:
-            abilities.append("Воскрешение скелетов")
-        elif self.type == EnemyType.SPIDER:
-            abilities.append("Ядовитый укус")
-        elif self.type == EnemyType.SLIME:
-            abilities.append("Кислотная атака")
-        
-        return abilities
-    
-    def use_special_ability(self) -> Tuple[int, str]:
-        """Использование особой способности"""
+        return self.TYPE_ABILITIES.get(self.type, ())
+    
+    @classmethod
+    def _compile_abilities(cls, enemy_type: EnemyType) -> Dict[str, EffectHandler]:
+        """Обработчики способностей типа врага, разрешаемые один раз на тип"""
+        handlers = cls._compiled_abilities.get(enemy_type)
+        if handlers is None:
+            handlers = cls._compiled_abilities[enemy_type] = {
+                ability: ENEMY_ABILITIES.resolve(ability)
+                for ability in cls.TYPE_ABILITIES.get(enemy_type, ())
+                if ability in ENEMY_ABILITIES
+            }
+        return handlers
+    
+    def use_special_ability(self, ability: str = None, target=None) -> Tuple[int, str]:
+        """Использование особой способности (случайной, если не указана)"""
         if not self.special_abilities:
             return 0, ""
         
-        ability = random.choice(self.special_abilities)
-        
-        if ability == "Огненное дыхание":
-            damage = int(self.damage * 1.5)
-            return damage, f"{self.name} использует Огненное дыхание!"
-        elif ability == "Магический щит":
-            self.defense += 5
-            return 0, f"{self.name} использует Магический щит! (+5 к защите)"
-        elif ability == "Ядовитый укус":
-            damage = int(self.damage * 1.2)
-            return damage, f"{self.name} использует Ядовитый укус! (яд)"
-        elif ability == "Кислотная атака":
-            damage = int(self.damage * 0.8)
-            armor_reduction = 2
-            return damage, f"{self.name} использует Кислотную атаку! (-{armor_reduction} защиты)"
-        elif ability == "Воскрешение скелетов":
-            # Здесь можно было бы добавить логику воскрешения
-            return 0, f"{self.name} пытается воскресить скелетов!"
-        
-        return 0, ""
+        if ability is None:
+            ability = self.special_abilities[roll_below(RNG.combat, len(self.special_abilities))]
+        
+        handler = self.ability_handlers.get(ability)
+        if handler is None:
+            return 0, ""
+        return handler.apply(self, target)
+    
+    def poison_power(self) -> int:
+        """Урон яда за раунд от ядовитого укуса"""
+        return max(1, self.damage // 4)
+    
+    def speed(self) -> int:
+        """Скорость в очереди инициативы с учетом ускорения"""
+        speed = self.template.speed
+        if self.active_effects:
+            speed = int(speed * (1 + self.active_effects.power("haste")))
+        return speed
+    
+    def take_damage(self, damage: int) -> int:
+        """Получение урона с учетом щита, возвращает нанесенный урон"""
+        dealt = max(0, damage - int(self.active_effects.power("shield")))
+        self.health -= dealt
+        return dealt
+
+class AliasTable:
+    """Таблица псевдонимов Уолкера: выбор исхода по весам за O(1)
+    
+    Каждая из n ячеек хранит порог prob и запасной исход alias. Один бросок
+    u в [0, n) дает и ячейку (целая часть), и сравнение с порогом (дробная),
+    поэтому выбор стоит одно обращение к генератору при любом числе исходов.
+    """
+    __slots__ = ("outcomes", "prob", "alias", "_arrays")
+    
+    def __init__(self, weights: Dict):
+        outcomes = [outcome for outcome, weight in weights.items() if weight > 0]
+        total = sum(weights[outcome] for outcome in outcomes)
+        if not outcomes:
+            raise ContentError("Таблица псевдонимов без исходов с положительным весом")
+        
+        # Метод Воуза: недобравшие до 1 ячейки дополняются из переполненных
+        count = len(outcomes)
+        scaled = [weights[outcome] * count / total for outcome in outcomes]
+        prob = [1.0] * count
+        alias = list(range(count))
+        small = [index for index, value in enumerate(scaled) if value < 1]
+        large = [index for index, value in enumerate(scaled) if value >= 1]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            prob[less] = scaled[less]
+            alias[less] = more
+            scaled[more] -= 1 - scaled[less]
+            (small if scaled[more] < 1 else large).append(more)
+        # Оставшиеся ячейки заполнены целиком (отличие от 1 - погрешность округления)
+        
+        self.outcomes = tuple(outcomes)
+        self.prob = tuple(prob)
+        self.alias = tuple(alias)
+        self._arrays = None  # Массивы NumPy для пакетного выбора, создаются при первом обращении
+    
+    def sample(self, rng: random.Random):
+        """Один исход за один бросок rng"""
+        scaled = rng.random() * len(self.prob)
+        index = int(scaled)
+        if scaled - index >= self.prob[index]:
+            index = self.alias[index]
+        return self.outcomes[index]
+    
+    def sample_indices(self, generator, count: int):
+        """Номера count исходов массивом NumPy: тот же выбор, что в sample, без цикла Python"""
+        if self._arrays is None:
+            self._arrays = np.array(self.prob), np.array(self.alias, dtype=np.intp)
+        prob, alias = self._arrays
+        scaled = generator.random(count) * len(prob)
+        index = scaled.astype(np.intp)
+        return np.where(scaled - index < prob[index], index, alias[index])
+    
+    def sample_many(self, count: int, stream: str = "analysis") -> List:
+        """count исходов из потока RNG: через NumPy, если он есть, иначе поштучно"""
+        if np is not None:
+            outcomes = self.outcomes
+            return [outcomes[index] for index in self.sample_indices(RNG.numpy(stream), count).tolist()]
+        rng = RNG.stream(stream)
+        return [self.sample(rng) for _ in range(count)]
+
+class EncounterTable:
+    """Встречи одного типа локации: полосы уровней, каждая - своя таблица псевдонимов
+    
+    Полоса действует от своего уровня "from" до начала следующей; уровни ниже
+    первой полосы берут первую, выше последней - последнюю.
+    """
+    __slots__ = ("location_type", "levels", "bands")
+    
+    def __init__(self, location_type: LocationType, bands: List[Dict]):
+        self.location_type = location_type
+        self.levels: List[int] = []
+        self.bands: List[AliasTable] = []
+        for band in sorted(bands, key=lambda band: band["from"]):
+            if self.levels and band["from"] == self.levels[-1]:
+                raise ContentError(f"Две полосы встреч {location_type.name} с уровня {band['from']}")
+            weights = {}
+            for name, weight in band["enemies"].items():
+                if name not in EnemyType.__members__:
+                    raise ContentError(f"Неизвестный враг в таблице встреч {location_type.name}: {name}")
+                weights[EnemyType[name]] = weight
+            self.levels.append(band["from"])
+            self.bands.append(AliasTable(weights))
+        if not self.bands:
+            raise ContentError(f"Таблица встреч {location_type.name} без полос уровней")
+    
+    def band(self, level: int) -> AliasTable:
+        return self.bands[max(0, bisect.bisect_right(self.levels, level) - 1)]
+    
+    def sample(self, level: int, rng: random.Random) -> EnemyType:
+        return self.band(level).sample(rng)
+    
+    def sample_many(self, level: int, count: int, stream: str = "analysis") -> List[EnemyType]:
+        return self.band(level).sample_many(count, stream)
+
+class EncounterTables:
+    """Скомпилированные таблицы встреч всех типов локаций"""
+    def __init__(self, definitions: Dict[str, List[Dict]]):
+        self.tables: Dict[LocationType, EncounterTable] = {}
+        for type_name, bands in definitions.items():
+            if type_name not in LocationType.__members__:
+                raise ContentError(f"Неизвестный тип локации в таблицах встреч: {type_name}")
+            location_type = LocationType[type_name]
+            self.tables[location_type] = EncounterTable(location_type, bands)
+        missing = [location_type.name for location_type in LocationType if location_type not in self.tables]
+        if missing:
+            raise ContentError(f"Нет таблиц встреч для типов локаций: {missing}")
+    
+    def __getitem__(self, location_type: LocationType) -> EncounterTable:
+        return self.tables[location_type]
+    
+    def sample(self, location_type: LocationType, level: int, rng: random.Random) -> EnemyType:
+        """Тип врага для локации и уровня за один бросок rng"""
+        return self.tables[location_type].sample(level, rng)
+    
+    def sample_many(self, location_type: LocationType, level: int, count: int,
+                    stream: str = "analysis") -> List[EnemyType]:
+        """Пакетный выбор для симуляций и массового заселения"""
+        return self.tables[location_type].sample_many(level, count, stream)
+
+# Встречи по типам локаций: data/encounters.json
+ENCOUNTER_TABLES = EncounterTables(CONTENT.encounters)
+
+class Timer:
+    """Запланированный вызов на колесе таймеров"""
+    __slots__ = ("deadline", "callback", "args", "cancelled")
+    
+    def __init__(self, deadline: int, callback: Callable, args: tuple):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+    
+    def cancel(self):
+        self.cancelled = True
+
+class TimerWheel:
+    """Хэшированное колесо таймеров на игровых часах (минуты игры)
+    
+    Два уровня по SLOTS ячеек: мелкое колесо - минуты текущего круга из SLOTS
+    минут, крупное - круги текущей эпохи из SLOTS кругов; более дальние
+    таймеры ждут в overflow. Когда мелкое колесо начинает новый круг, ячейка
+    крупного колеса раскладывается по минутам, так что каждая ячейка мелкого
+    колеса содержит только таймеры своей минуты. Занятые ячейки отмечены
+    битами fine_bits и coarse_bits, и часы перескакивают сразу к ближайшей
+    занятой минуте или кругу: сдвиг стоит число непустых ячеек на пути и
+    пройденных эпох плюс число сработавших таймеров, а не число прошедших
+    минут. Отмена ленивая: отмененный таймер выбрасывается, когда подойдет
+    его минута.
+    """
+    SLOTS = 256
+    
+    def __init__(self, now: int = 0):
+        self.now = now
+        self.fine: List[List[Timer]] = [[] for _ in range(self.SLOTS)]
+        self.coarse: List[List[Timer]] = [[] for _ in range(self.SLOTS)]
+        self.overflow: List[Timer] = []
+        self.fine_bits = 0  # Бит i - в ячейке fine[i] есть таймеры
+        self.coarse_bits = 0  # Бит i - в ячейке coarse[i] есть таймеры
+        self.pending = 0  # Таймеры на колесах, включая отмененные
+    
+    def __len__(self) -> int:
+        return self.pending
+    
+    def schedule(self, delay: int, callback: Callable, *args) -> Timer:
+        """Вызвать callback(*args) через delay минут (не раньше следующей)"""
+        return self.schedule_at(self.now + delay, callback, *args)
+    
+    def schedule_at(self, deadline: int, callback: Callable, *args) -> Timer:
+        timer = Timer(max(deadline, self.now + 1), callback, args)
+        self._place(timer)
+        self.pending += 1
+        return timer
+    
+    def _place(self, timer: Timer):
+        slots = self.SLOTS
+        deadline = timer.deadline
+        if deadline // slots == self.now // slots:
+            self.fine[deadline % slots].append(timer)
+            self.fine_bits |= 1 << deadline % slots
+        elif deadline // (slots * slots) == self.now // (slots * slots):
+            self.coarse[deadline // slots % slots].append(timer)
+            self.coarse_bits |= 1 << deadline // slots % slots
+        else:
+            self.overflow.append(timer)
+    
+    def advance(self, minutes: int) -> int:
+        """Сдвинуть часы, вызывая наступившие таймеры по порядку; возвращает число вызванных"""
+        slots = self.SLOTS
+        target = self.now + minutes
+        fired = 0
+        while self.now < target:
+            if not self.pending:
+                self.now = target
+                break
+            now = self.now
+            ahead = self.fine_bits >> (now % slots + 1)
+            if ahead:  # Ближайшая занятая минута текущего круга
+                now += (ahead & -ahead).bit_length()
+                if now > target:
+                    self.now = target
+                    break
+                self.now = now
+            else:  # Ближайший занятый круг эпохи или начало следующей эпохи
+                ahead = self.coarse_bits >> (now // slots % slots + 1)
+                if ahead:
+                    now = (now // slots + (ahead & -ahead).bit_length()) * slots
+                else:
+                    now = (now // (slots * slots) + 1) * slots * slots
+                if now > target:
+                    self.now = target
+                    break
+                self.now = now
+                if now % (slots * slots) == 0:
+                    waiting, self.overflow = self.overflow, []
+                    for timer in waiting:
+                        self._place(timer)
+                bucket = self.coarse[now // slots % slots]  # Таймеры нового круга спускаются на мелкое колесо
+                if bucket:
+                    self.coarse[now // slots % slots] = []
+                    self.coarse_bits &= ~(1 << now // slots % slots)
+                    for timer in bucket:
+                        self.fine[timer.deadline % slots].append(timer)
+                        self.fine_bits |= 1 << timer.deadline % slots
+            
+            due = self.fine[now % slots]
+            if not due:
+                continue
+            self.fine[now % slots] = []
+            self.fine_bits &= ~(1 << now % slots)
+            self.pending -= len(due)
+            for timer in due:
+                if not timer.cancelled:
+                    timer.callback(*timer.args)
+                    fired += 1
+        return fired
 
 class Location:
     """Класс локации с улучшениями"""
+    POPULATION_RNG = random.Random()  # Пересевается для каждого поколения: без нового состояния на вызов
+    
     def __init__(self, name: str, loc_type: LocationType, level_range: Tuple[int, int],
                  description: str, connections: List[str] = None, 
                  has_shop: bool = False, has_tavern: bool = False,
-                 has_bordello: bool = False, special_event_chance: float = 0.1):
+                 has_bordello: bool = False, special_event_chance: float = 0.1,
+                 population_seed: Optional[int] = None):
         self.name = name
         self.type = loc_type
         self.level_range = level_range
@@ -386,41 +1450,166 @@ class Location:
         self.has_tavern = has_tavern
         self.has_bordello = has_bordello
         self.special_event_chance = special_event_chance
-        self.enemies = []
         self.quests = []
         self.discovered = False
         self.cleared = False
-        self.respawn_timer = 0
+        self.respawn_timer = 0  # Минута игровых часов, когда вернутся враги (0 - не запланировано)
+        self.shop_sold: Dict[str, int] = {}  # Продано магазином с последнего завоза: предмет -> штук
+        self.restock_timer = 0  # Минута игровых часов следующего завоза (0 - не запланирован)
+        
+        # Враги создаются при первом обращении к enemies из зерна и номера поколения;
+        # выгруженный состав хранится как номера убитых и здоровье раненых
+        self.population_seed = RNG.world.getrandbits(32) if population_seed is None else population_seed
+        self.generation = 0  # Растет с каждым возрождением врагов
+        self.killed = ()  # Номера убитых врагов поколения (пока состав выгружен)
+        self.wounded = {}  # Номер врага -> оставшееся здоровье (пока состав выгружен)
+        self.tracker = None  # PopulationTracker, которому сообщается о создании состава
+        self.state = None  # WorldState, которому сообщается о смене сохраняемого состояния
+        self._enemies = None
+        self._spawned = ()  # Состав поколения в порядке генерации (пока он загружен)
+    
+    @property
+    def enemies(self) -> List[Enemy]:
+        """Враги локации; при первом обращении восстанавливаются из зерна и отличий"""
+        if self._enemies is None:
+            self._materialize()
+        return self._enemies
+    
+    @enemies.setter
+    def enemies(self, enemies: List[Enemy]):
+        # Произвольный состав не описывается зерном, поэтому такая локация не выгружается
+        self._enemies = list(enemies)
+        self._spawned = ()
+        self.killed = ()
+        self.wounded = {}
+    
+    @property
+    def is_materialized(self) -> bool:
+        return self._enemies is not None
+    
+    def spawn_generation(self) -> List[Enemy]:
+        """Состав текущего поколения по таблице встреч (5-10 врагов): одинаков при каждом вызове"""
+        rng = self.POPULATION_RNG
+        rng.seed(self.population_seed << 32 | self.generation)
+        encounters = ENCOUNTER_TABLES[self.type]
+        num_enemies = rng.randint(5, 10)
+        
+        enemies = []
+        for _ in range(num_enemies):
+            level = rng.randint(self.level_range[0], self.level_range[1])
+            enemy_type = encounters.sample(level, rng)
+            template = Enemy.template_for(enemy_type, level)
+            enemies.append(Enemy.from_template(template, rng.randint(*template.gold_range)))
+        return enemies
+    
+    def _materialize(self):
+        enemies = self.spawn_generation()
+        self._spawned = tuple(enemies)
+        for index, health in self.wounded.items():
+            # Сохранение до таблиц встреч могло описывать на этом месте другого врага
+            enemies[index].health = min(health, enemies[index].max_health)
+        if self.killed:
+            killed = set(self.killed)
+            enemies = [enemy for index, enemy in enumerate(enemies) if index not in killed]
+        self.killed = ()
+        self.wounded = {}
+        self._enemies = enemies
+        if self.tracker is not None:
+            self.tracker.touch(self)
+    
+    def population_diff(self) -> Optional[Tuple[Tuple[int, ...], Dict[int, int]]]:
+        """Отличия состава от поколения: (номера убитых, здоровье раненых) или None,
+        если в составе есть враг не из поколения
+        """
+        enemies = self._enemies
+        if enemies is None:
+            return self.killed, self.wounded
+        
+        positions = {id(enemy): index for index, enemy in enumerate(self._spawned)}
+        wounded = {}
+        present = set()
+        for enemy in enemies:
+            index = positions.get(id(enemy))
+            if index is None:
+                return None
+            present.add(index)
+            if enemy.health != enemy.max_health:
+                wounded[index] = enemy.health
+        return tuple(index for index in range(len(self._spawned)) if index not in present), wounded
+    
+    def evict(self) -> bool:
+        """Выгрузка врагов до зерна и отличий; False, если состав так не описать"""
+        enemies = self._enemies
+        if enemies is None:
+            return True
+        if any(enemy.active_effects for enemy in enemies):
+            return False  # Незавершенный бой
+        diff = self.population_diff()
+        if diff is None:
+            return False
         
-        # Генерация врагов для локации - ИСПРАВЛЕНО: увеличение количества врагов
-        self.generate_enemies()
+        self.killed, self.wounded = diff
+        self._enemies = None
+        self._spawned = ()
+        return True
+    
+    def restore(self, record: dict):
+        """Состояние из записи WorldState.record; пустая запись - исходное состояние
+        
+        Открытость локации восстанавливает WorldGraph.reset_discovered.
+        """
+        self.cleared = record.get("cleared", False)
+        self.respawn_timer = record.get("respawn_timer", 0)
+        self.shop_sold = dict(record.get("shop_sold", {}))
+        self.restock_timer = record.get("restock_timer", 0)
+        self.population_seed = record.get("population_seed", self.population_seed)
+        self.generation = record.get("generation", 0)
+        self.killed = tuple(record.get("killed", ()))
+        # Ключи JSON - строки
+        self.wounded = {int(index): health for index, health in record.get("wounded", {}).items()}
+        self._enemies = None
+        self._spawned = ()
+    
+    def is_restorable(self) -> bool:
+        """Состояние описывается записью WorldState.record: локацию можно забыть и
+        построить заново генератором, а затем восстановить через restore
+        """
+        return self.population_diff() is not None
     
     def generate_enemies(self):
-        """Генерация врагов для локации - ИСПРАВЛЕНО: теперь 5-10 врагов"""
-        enemy_types = list(EnemyType)
-        # Генерируем от 5 до 10 врагов вместо 2-8
-        num_enemies = random.randint(5, 10)
-        
-        for _ in range(num_enemies):
-            enemy_type = random.choice(enemy_types)
-            level = random.randint(self.level_range[0], self.level_range[1])
-            self.enemies.append(Enemy(enemy_type, level))
-    
-    def should_respawn(self) -> bool:
-        """Проверка, должны ли возродиться враги"""
-        if not self.enemies and not self.cleared:
-            self.respawn_timer += 1
-            if self.respawn_timer >= 3:  # Через 3 посещения
-                self.generate_enemies()
-                self.respawn_timer = 0
-                return True
-        return False
+        """Новое поколение врагов вместо текущего состава"""
+        self.generation += 1
+        self.killed = ()
+        self.wounded = {}
+        self._enemies = None
+        self._spawned = ()
+        self._materialize()
+    
+    def respawn(self):
+        """Возвращение врагов: новое поколение, локация больше не очищена"""
+        self.generate_enemies()
+        self.cleared = False
+        self.respawn_timer = 0
+        self.mark_changed()
+    
+    def pick_group(self, max_size: int = 4) -> List[Enemy]:
+        """Случайная группа врагов локации для совместного нападения"""
+        if not self.enemies:
+            return []
+        size = RNG.combat.randint(min(2, len(self.enemies)), min(max_size, len(self.enemies)))
+        return RNG.combat.sample(self.enemies, size)
     
     def clear_enemies(self):
         """Очистка локации от врагов"""
         self.enemies.clear()
         self.cleared = True
+        self.mark_changed()
     
+    def mark_changed(self):
+        """Сохраняемое состояние локации изменилось"""
+        if self.state is not None:
+            self.state.mark(self)
+
     def add_special_event(self):
         """Добавление специального события"""
         events = [
@@ -433,43 +1622,757 @@ class Location:
             "Вы чувствуете дрожь земли",
             "Вы видите странное свечение"
         ]
-        return random.choice(events)
+        return RNG.events.choice(events)
 
-class Quest:
-    """Класс квеста с улучшениями"""
-    def __init__(self, name: str, description: str, location: str,
-                 reward_xp: int, reward_gold: int, required_level: int = 1,
-                 quest_type: str = "main", time_limit: int = 0):
-        self.id = random.randint(100, 999)
-        self.name = name
-        self.description = description
-        self.location = location
-        self.status = QuestStatus.NOT_STARTED
-        self.reward_xp = reward_xp
-        self.reward_gold = reward_gold
-        self.required_level = required_level
-        self.quest_type = quest_type
-        self.time_limit = time_limit
-        self.start_time = None
-        self.objectives = {}
-        self.completed_objectives = {}
-        self.reward_items = []
-        
-    def add_objective(self, objective: str, target: str, count: int):
-        """Добавление цели квеста"""
-        self.objectives[objective] = {"target": target, "count": count, "current": 0}
-        
-    def add_reward_item(self, item: Item):
-        """Добавление предмета в награду"""
-        self.reward_items.append(item)
-        
-    def start(self):
-        """Начало квеста"""
-        self.status = QuestStatus.IN_PROGRESS
-        self.start_time = datetime.now()
+class PopulationTracker:
+    """Локации с загруженными врагами в порядке последнего обращения
+    
+    Сверх limit самые давние выгружаются в зерно и отличия; текущая локация
+    игрока и ее соседи не выгружаются.
+    """
+    def __init__(self, limit: int = 16):
+        self.limit = limit
+        self.recent: Dict[str, Location] = {}
+        self.pinned = set()  # Имена текущей локации и ее соседей
+    
+    def __len__(self) -> int:
+        return len(self.recent)
+    
+    def touch(self, location: Location):
+        """Локация использована: в конец очереди, лишние давние выгружаются"""
+        recent = self.recent
+        recent.pop(location.name, None)
+        recent[location.name] = location
+        if len(recent) <= self.limit:
+            return
         
-    def update_objective(self, objective: str, amount: int = 1) -> bool:
-        """Обновление прогресса цели"""
+        for name in list(recent):
+            if len(recent) <= self.limit:
+                break
+            if name in self.pinned:
+                continue
+            candidate = recent[name]
+            if candidate.evict():
+                del recent[name]
+    
+    def forget(self, location: Location):
+        """Локация выгружена из мира целиком"""
+        self.recent.pop(location.name, None)
+        self.pinned.discard(location.name)
+    
+    def visit(self, location: Location, neighbors: List[Location]):
+        """Игрок пришел в location: она и соседи закреплены и освежены"""
+        self.pinned = {location.name}
+        self.pinned.update(neighbor.name for neighbor in neighbors)
+        for neighbor in neighbors:
+            if neighbor.is_materialized:
+                self.touch(neighbor)
+        if location.is_materialized:
+            self.touch(location)
+
+class WorldState:
+    """Изменения локаций мира, сохраняемые по чанкам
+    
+    Локация сообщает о смене discovered/cleared/respawn_timer, запасов
+    магазина (shop_sold/restock_timer) и состава врагов (поколение, убитые и
+    раненые; о бое - в его начале) через mark, и при сохранении
+    переписываются только файлы чанков с отмеченными локациями. В файле чанка
+    лежат лишь локации, отличные от исходного состояния, поэтому и сохранение,
+    и загрузка зависят от того, что игрок успел изменить, а не от размера мира.
+    
+    Выгружаемая локация сгенерированного мира оставляет свою запись в records
+    через unload, а при новой загрузке чанка получает ее обратно через lookup.
+    """
+    def __init__(self, chunk_of: Callable[[str], str], keep_seeds: bool = False):
+        self.chunk_of = chunk_of  # Имя локации -> имя файла ее чанка
+        # Записывать зерна составов: они случайны в мире по умолчанию и выводятся из генератора в сгенерированном
+        self.keep_seeds = keep_seeds
+        self.dirty: Dict[str, Dict[str, Location]] = {}  # Чанк -> измененные с последней записи
+        # Чанк -> записи, как они лежат в directory, плюс записи выгруженных с последнего сохранения
+        self.records: Dict[str, Dict[str, dict]] = {}
+        self.directory = None  # Каталог, с которым совпадают records (кроме чанков из dirty)
+    
+    def mark(self, location: Location):
+        self.dirty.setdefault(self.chunk_of(location.name), {})[location.name] = location
+    
+    def unload(self, location: Location):
+        """Локация выгружается: ее несохраненное изменение сразу переходит в records
+        
+        Чанк остается в dirty, поэтому следующее сохранение перепишет его файл.
+        """
+        chunk = self.chunk_of(location.name)
+        dirty = self.dirty.get(chunk)
+        if dirty is None or dirty.pop(location.name, None) is None:
+            return
+        record = self.record(location)
+        records = self.records.setdefault(chunk, {})
+        if record is None:
+            records.pop(location.name, None)
+        else:
+            records[location.name] = record
+    
+    def lookup(self, name: str) -> dict:
+        """Запись локации в records; пустая, если состояние исходное"""
+        return self.records.get(self.chunk_of(name), {}).get(name, {})
+    
+    def record(self, location: Location) -> Optional[dict]:
+        """Сохраняемое состояние локации или None, если оно исходное
+        
+        Состав врагов пишется как поколение и отличия от него; состав из чужих
+        врагов (Location.enemies задан целиком) так не описать, и он не пишется.
+        """
+        diff = location.population_diff() or ((), {})
+        killed, wounded = diff
+        if not (location.discovered or location.cleared or location.respawn_timer or location.shop_sold
+                or location.generation or killed or wounded):
+            return None
+        record = {
+            "discovered": location.discovered,
+            "cleared": location.cleared,
+            "respawn_timer": location.respawn_timer
+        }
+        if location.shop_sold:
+            record["shop_sold"] = dict(location.shop_sold)
+            record["restock_timer"] = location.restock_timer
+        if location.generation:
+            record["generation"] = location.generation
+        if killed:
+            record["killed"] = list(killed)
+        if wounded:
+            record["wounded"] = {str(index): health for index, health in wounded.items()}
+        if self.keep_seeds:
+            record["population_seed"] = location.population_seed
+        return record
+    
+    def save(self, directory: str) -> int:
+        """Записать изменения в directory; возвращает число переписанных чанков
+        
+        Если records не совпадают с directory (другой слот или каталог удален),
+        каталог переписывается целиком.
+        """
+        full = directory != self.directory or not os.path.isdir(directory)
+        for chunk, locations in self.dirty.items():
+            records = self.records.setdefault(chunk, {})
+            for name, location in locations.items():
+                record = self.record(location)
+                if record is None:
+                    records.pop(name, None)
+                else:
+                    records[name] = record
+        
+        os.makedirs(directory, exist_ok=True)
+        if full:
+            chunks = list(self.records)
+            for file_name in os.listdir(directory):
+                if file_name.endswith(".json") and file_name[:-5] not in self.records:
+                    os.remove(os.path.join(directory, file_name))
+        else:
+            chunks = list(self.dirty)
+        
+        for chunk in chunks:
+            path = os.path.join(directory, f"{chunk}.json")
+            records = self.records.get(chunk)
+            if records:
+                with open(path + ".tmp", 'w', encoding='utf-8') as f:
+                    json.dump(records, f, ensure_ascii=False)
+                os.replace(path + ".tmp", path)
+            else:
+                self.records.pop(chunk, None)
+                if os.path.exists(path):
+                    os.remove(path)
+        
+        self.dirty.clear()
+        self.directory = directory
+        return len(chunks)
+    
+    def load(self, directory: str) -> Dict[str, dict]:
+        """Прочитать записанные чанки; имя локации -> запись"""
+        self.records = {}
+        self.dirty.clear()
+        self.directory = directory
+        if os.path.isdir(directory):
+            for file_name in os.listdir(directory):
+                if file_name.endswith(".json"):
+                    with open(os.path.join(directory, file_name), 'r', encoding='utf-8') as f:
+                        self.records[file_name[:-5]] = json.load(f)
+        return {name: record for records in self.records.values() for name, record in records.items()}
+
+class WorldGraph:
+    """Мир, скомпилированный в целочисленный граф смежности
+    
+    Локации нумеруются по порядку добавления; adjacency[i] - кортеж номеров
+    соседей, reverse[i] - номера локаций, из которых ведет дорога в i. Отдельный
+    маршрут ищется двунаправленным поиском в ширину. Для меню, где нужны
+    расстояния до многих целей, строится дерево поиска от текущей локации, и
+    маршрут к выбранной цели читается из него. Оба кэша живут до изменения
+    графа; открытие новой локации сбрасывает только маршруты по открытым локациям.
+    Цель - меню маршрута (дерево по открытым локациям и маршрут из него) быстрее
+    миллисекунды на самом большом графе, который держит игра: 25 загруженных чанков
+    сгенерированного мира, 1601 локация (сценарий world_route в bench_suite).
+    
+    Сгенерированный мир достраивается и выгружается чанками: дороги к еще не
+    добавленным локациям ждут в pending, а номера выгруженных переиспользуются.
+    """
+    ROUTE_CACHE_LIMIT = 1024
+    TREE_CACHE_LIMIT = 8
+    
+    def __init__(self, locations: Dict[str, Location], partial: bool = False):
+        self.names: List[str] = []
+        self.index: Dict[str, int] = {}
+        self.locations: List[Location] = []
+        self.adjacency: List[Tuple[int, ...]] = []
+        self.reverse: List[List[int]] = []
+        self.routes: Dict[Tuple[int, int, bool], Optional[List[int]]] = {}
+        # Дерево поиска от вершины: предшественники и число переходов (-1 - недостижима)
+        self.trees: Dict[Tuple[int, bool], Tuple[List[int], List[int]]] = {}
+        self.discovered: Dict[str, None] = {}  # Открытые локации в порядке открытия
+        self.pending: Dict[str, List[int]] = {}  # Имя недобавленной локации -> вершины с дорогами к ней
+        self.free: List[int] = []  # Номера выгруженных локаций
+        
+        self.add_locations(list(locations.values()))
+        if self.pending and not partial:
+            listed = ", ".join(f"{self.names[source]} -> {name}"
+                               for name, sources in self.pending.items() for source in sources)
+            raise KeyError(f"Неизвестные локации в связях: {listed}")
+    
+    def __len__(self) -> int:
+        return len(self.index)
+    
+    def __contains__(self, name: str) -> bool:
+        return name in self.index
+    
+    def add_locations(self, locations: List[Location]):
+        """Добавить локации; дороги к еще не добавленным появятся вместе с ними"""
+        nodes = [self._add_node(location) for location in locations]
+        for node, location in zip(nodes, locations):
+            self._connect(node, location.connections)
+            if location.discovered:
+                self.discovered[location.name] = None
+        self.forget_routes()
+    
+    def remove_locations(self, names: List[str]):
+        """Выгрузить локации; дороги к ним снова ждут их добавления"""
+        pending = self.pending
+        for name in names:
+            node = self.index.pop(name)
+            for target in self.adjacency[node]:
+                self.reverse[target].remove(node)
+            for source in self.reverse[node]:
+                self.adjacency[source] = tuple(target for target in self.adjacency[source] if target != node)
+                pending.setdefault(name, []).append(source)
+            for target_name in self.locations[node].connections:
+                sources = pending.get(target_name)
+                if sources and node in sources:
+                    sources.remove(node)
+                    if not sources:
+                        del pending[target_name]
+            
+            self.discovered.pop(name, None)
+            self.names[node] = None
+            self.locations[node] = None
+            self.adjacency[node] = ()
+            self.reverse[node] = []
+            self.free.append(node)
+        self.forget_routes()
+    
+    def _add_node(self, location: Location) -> int:
+        if location.name in self.index:
+            raise KeyError(f"Локация {location.name} добавлена дважды")
+        if self.free:
+            node = self.free.pop()
+            self.names[node] = location.name
+            self.locations[node] = location
+        else:
+            node = len(self.locations)
+            self.names.append(location.name)
+            self.locations.append(location)
+            self.adjacency.append(())
+            self.reverse.append([])
+        self.index[location.name] = node
+        
+        for source in self.pending.pop(location.name, ()):
+            self.adjacency[source] += (node,)
+            self.reverse[node].append(source)
+        return node
+    
+    def _connect(self, node: int, names: List[str]):
+        index = self.index
+        targets = []
+        for name in dict.fromkeys(names):
+            target = index.get(name)
+            if target is None:
+                self.pending.setdefault(name, []).append(node)
+            else:
+                targets.append(target)
+        self.adjacency[node] = tuple(targets)
+        for target in targets:
+            self.reverse[target].append(node)
+    
+    def neighbors(self, name: str) -> List[Location]:
+        """Локации, куда ведут дороги из name"""
+        locations = self.locations
+        return [locations[node] for node in self.adjacency[self.index[name]]]
+    
+    def route(self, source: str, target: str, discovered_only: bool = False) -> Optional[List[str]]:
+        """Кратчайший маршрут от source до target включительно или None, если пути нет
+        
+        С discovered_only промежуточные локации берутся только из открытых игроком.
+        """
+        start, goal = self.index[source], self.index[target]
+        key = (start, goal, discovered_only)
+        tree = self.trees.get((start, discovered_only))
+        if tree is not None:
+            path = self._walk(tree[0], goal)
+        elif key in self.routes:
+            path = self.routes[key]
+        else:
+            path = self._search(start, goal, discovered_only)
+            if len(self.routes) >= self.ROUTE_CACHE_LIMIT:
+                del self.routes[next(iter(self.routes))]
+            self.routes[key] = path
+        if path is None:
+            return None
+        names = self.names
+        return [names[node] for node in path]
+    
+    def distances(self, source: str, targets: List[str], discovered_only: bool = False) -> Dict[str, int]:
+        """Число переходов от source до каждой из достижимых targets"""
+        hops = self.tree(source, discovered_only)[1]
+        index = self.index
+        return {name: hops[index[name]] for name in targets if hops[index[name]] >= 0}
+    
+    def tree(self, source: str, discovered_only: bool = False) -> Tuple[List[int], List[int]]:
+        """Дерево поиска в ширину от source: предшественники и число переходов, -1 - недостижима
+        
+        С discovered_only дерево проходит только через открытые локации, но
+        включает и неоткрытые соседние как листья.
+        """
+        start = self.index[source]
+        key = (start, discovered_only)
+        tree = self.trees.get(key)
+        if tree is not None:
+            return tree
+        
+        adjacency = self.adjacency
+        locations = self.locations
+        parents = [-1] * len(locations)
+        hops = [-1] * len(locations)
+        parents[start] = start
+        hops[start] = 0
+        front = [start]
+        depth = 0
+        while front:
+            depth += 1
+            next_front = []
+            for node in front:
+                for neighbor in adjacency[node]:
+                    if parents[neighbor] < 0:
+                        parents[neighbor] = node
+                        hops[neighbor] = depth
+                        # Неоткрытая локация остается листом: через нее дальше не идут
+                        if not discovered_only or locations[neighbor].discovered:
+                            next_front.append(neighbor)
+            front = next_front
+        
+        if len(self.trees) >= self.TREE_CACHE_LIMIT:
+            del self.trees[next(iter(self.trees))]
+        tree = self.trees[key] = (parents, hops)
+        return tree
+    
+    def discover(self, name: str) -> bool:
+        """Отметить локацию открытой; True, если она открыта впервые"""
+        location = self.locations[self.index[name]]
+        if location.discovered:
+            return False
+        location.discovered = True
+        location.mark_changed()
+        self.discovered[name] = None
+        self.forget_routes(discovered_only=True)
+        return True
+    
+    def reset_discovered(self, names: List[str]):
+        """Заменить набор открытых локаций (загрузка сохранения)"""
+        for name in self.discovered:
+            location = self.locations[self.index[name]]
+            location.discovered = False
+            location.mark_changed()
+        self.discovered.clear()
+        self.forget_routes(discovered_only=True)
+        for name in names:
+            if name in self.index:
+                self.discover(name)
+    
+    def forget_routes(self, discovered_only: bool = False):
+        """Сброс кэшей маршрутов: изменились дороги или, с discovered_only, открыта новая локация
+        
+        Открытие локации не меняет маршрутов без ограничения открытыми, и они остаются в кэше.
+        """
+        if discovered_only:
+            for key in [key for key in self.routes if key[2]]:
+                del self.routes[key]
+            for key in [key for key in self.trees if key[1]]:
+                del self.trees[key]
+            return
+        self.routes.clear()
+        self.trees.clear()
+    
+    @staticmethod
+    def _walk(tree: List[int], goal: int) -> Optional[List[int]]:
+        if tree[goal] < 0:
+            return None
+        path = [goal]
+        node = goal
+        while tree[node] != node:
+            node = tree[node]
+            path.append(node)
+        path.reverse()
+        return path
+    
+    def _search(self, start: int, goal: int, discovered_only: bool) -> Optional[List[int]]:
+        """Двунаправленный поиск в ширину: фронты растут навстречу, меньший первым"""
+        if start == goal:
+            return [start]
+        
+        locations = self.locations
+        forward = {start: None}  # Вершина -> предшественник на пути от start
+        backward = {goal: None}  # Вершина -> следующая на пути к goal
+        forward_front, backward_front = [start], [goal]
+        
+        while forward_front and backward_front:
+            if len(forward_front) <= len(backward_front):
+                edges, parents, others, front = self.adjacency, forward, backward, forward_front
+            else:
+                edges, parents, others, front = self.reverse, backward, forward, backward_front
+            
+            next_front = []
+            for node in front:
+                for neighbor in edges[node]:
+                    if neighbor in parents:
+                        continue
+                    if discovered_only and neighbor not in others and not locations[neighbor].discovered:
+                        continue
+                    parents[neighbor] = node
+                    if neighbor in others:
+                        return self._join(neighbor, forward, backward)
+                    next_front.append(neighbor)
+            
+            if parents is forward:
+                forward_front = next_front
+            else:
+                backward_front = next_front
+        
+        return None
+    
+    @staticmethod
+    def _join(meeting: int, forward: Dict[int, Optional[int]], backward: Dict[int, Optional[int]]) -> List[int]:
+        path = []
+        node = meeting
+        while node is not None:
+            path.append(node)
+            node = forward[node]
+        path.reverse()
+        node = backward[meeting]
+        while node is not None:
+            path.append(node)
+            node = backward[node]
+        return path
+
+class WorldGenerator:
+    """Процедурный мир из зерна: квадратная сетка size × size, по локации на клетку
+    
+    "Стартовая деревня" стоит в клетке (0, 0), уровни растут с удалением от нее.
+    Тип, имя, уровни, магазин и таверна клетки и каждая дорога выводятся хэшем
+    зерна и координат, поэтому чанк строится без соседей, а дорогу через
+    границу чанков обе стороны видят одинаково. Внутри чанка дороги образуют
+    остовное дерево (клетка соединена с западной или северной соседкой) и
+    случайные петли; соседние чанки связаны хотя бы одной дорогой, так что мир
+    связен. Имя сгенерированной локации заканчивается ее координатами.
+    """
+    CHUNK_SIZE = 8
+    LEVEL_STEP = 2  # Клеток удаления от деревни на уровень
+    TOWN_SPACING = 6  # На квадрат TOWN_SPACING × TOWN_SPACING клеток один город
+    SHOP_CHANCE = 0.75  # Доля городов с магазином; таверна есть в каждом
+    BIOME_SHARE = 0.5  # Доля клеток чанка, взявших его основной тип
+    LOOP_CHANCE = 0.15  # Лишняя дорога на восток или юг внутри чанка
+    BORDER_CHANCE = 0.2  # Дорога через границу чанков сверх обязательной
+    START = "Стартовая деревня"
+    BORDELLO = "Роскошный бордель"
+    CELL_CACHE_LIMIT = 4096
+    
+    TYPE_WEIGHTS = (
+        (LocationType.FOREST, 30),
+        (LocationType.CAVE, 14),
+        (LocationType.MOUNTAIN, 14),
+        (LocationType.RUINS, 12),
+        (LocationType.SWAMP, 12),
+        (LocationType.DUNGEON, 10),
+        (LocationType.BEACH, 8)
+    )
+    NAMES = {
+        LocationType.TOWN: ("Деревня", "Поселок", "Городок", "Застава", "Хутор"),
+        LocationType.FOREST: ("Темный лес", "Сумрачная чаща", "Старая роща", "Лесная глушь", "Еловый бор"),
+        LocationType.DUNGEON: ("Подземелье", "Склеп", "Катакомбы", "Темница", "Долина троллей"),
+        LocationType.MOUNTAIN: ("Орочьи горы", "Скалистый перевал", "Каменный хребет", "Ледяной пик"),
+        LocationType.CAVE: ("Гоблинские пещеры", "Сырой грот", "Кристальная пещера", "Глубокая расщелина"),
+        LocationType.RUINS: ("Забытые руины", "Разрушенная крепость", "Заброшенная хижина", "Древний храм"),
+        LocationType.SWAMP: ("Таинственное болото", "Гнилая топь", "Туманная трясина"),
+        LocationType.BEACH: ("Песчаный берег", "Каменистая отмель", "Бухта контрабандистов")
+    }
+    DESCRIPTIONS = {
+        LocationType.TOWN: ("Небольшое поселение, где можно отдохнуть и пополнить припасы.",
+                            "Оживленный городок на перекрестке дорог."),
+        LocationType.FOREST: ("Густой лес, полный опасных существ.",
+                              "Самые глубины леса, куда редко ступает нога человека."),
+        LocationType.DUNGEON: ("Сырые коридоры, уходящие глубоко под землю.",
+                               "Глубокое ущелье, дом могущественных тварей."),
+        LocationType.MOUNTAIN: ("Высокие горы, где обосновались орки.",
+                                "Узкие тропы над пропастью, продуваемые ледяным ветром."),
+        LocationType.CAVE: ("Лабиринт пещер, кишащий гоблинами.",
+                            "Темные своды, с которых капает холодная вода."),
+        LocationType.RUINS: ("Древние руины, хранящие множество тайн.",
+                             "Старые стены, от которых веет зловещей магией."),
+        LocationType.SWAMP: ("Топи, полные странных существ и ядовитых растений.",
+                             "Вязкая трясина, над которой стелется туман."),
+        LocationType.BEACH: ("Пустынный берег, куда волны выносят обломки кораблей.",
+                             "Скалистая отмель, облюбованная контрабандистами.")
+    }
+    EVENT_CHANCES = {
+        LocationType.TOWN: 0.05,
+        LocationType.FOREST: 0.2,
+        LocationType.CAVE: 0.15,
+        LocationType.RUINS: 0.25
+    }
+    
+    # Соли хэша: разные свойства клетки не коррелируют между собой
+    _CELL, _DETAIL, _BIOME, _TOWN, _BORDER = range(1, 6)
+    _MASK = (1 << 64) - 1
+    
+    def __init__(self, seed: int, size: int):
+        if size < 1:
+            raise ValueError(f"Размер мира должен быть положительным: {size}")
+        self.seed = seed & self._MASK
+        self.size = size
+        self.low = -(size // 2)  # Координаты клеток по каждой оси: low..high
+        self.high = self.low + size - 1
+        
+        total = sum(weight for _, weight in self.TYPE_WEIGHTS)
+        self.types = [loc_type for loc_type, _ in self.TYPE_WEIGHTS]
+        self.cumulative = []
+        running = 0
+        for _, weight in self.TYPE_WEIGHTS:
+            running += weight
+            self.cumulative.append(running / total)
+        
+        # Клетка -> (хэш, тип): каждую клетку спрашивают и ее соседки
+        self.cells: Dict[Tuple[int, int], Tuple[int, LocationType]] = {}
+    
+    def _hash(self, *values: int) -> int:
+        """splitmix64 по зерну и значениям: одинаков на любой платформе и версии Python"""
+        mask = self._MASK
+        h = self.seed
+        for value in values:
+            z = ((h ^ (value & mask)) + 0x9E3779B97F4A7C15) & mask
+            z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & mask
+            z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & mask
+            h = z ^ (z >> 31)
+        return h
+    
+    @staticmethod
+    def _fraction(h: int, offset: int) -> float:
+        """16 бит хэша, начиная с offset, как число из [0, 1)"""
+        return (h >> offset & 0xFFFF) / 0x10000
+    
+    def _weighted(self, roll: float) -> LocationType:
+        return self.types[min(bisect.bisect(self.cumulative, roll), len(self.types) - 1)]
+    
+    def _span(self, chunk: int) -> Tuple[int, int]:
+        """Первая и последняя клетка чанка по одной оси с учетом края мира"""
+        start = chunk * self.CHUNK_SIZE
+        return max(start, self.low), min(start + self.CHUNK_SIZE - 1, self.high)
+    
+    def is_town(self, x: int, y: int) -> bool:
+        spacing = self.TOWN_SPACING
+        block_x, block_y = x // spacing, y // spacing
+        if block_x == 0 and block_y == 0:
+            return x == 0 and y == 0  # Город этого квадрата - стартовая деревня
+        h = self._hash(self._TOWN, block_x, block_y)
+        return x == block_x * spacing + h % spacing and y == block_y * spacing + (h >> 16) % spacing
+    
+    def cell(self, x: int, y: int) -> Tuple[int, LocationType]:
+        """Хэш клетки и тип ее локации"""
+        key = (x, y)
+        cell = self.cells.get(key)
+        if cell is not None:
+            return cell
+        
+        h = self._hash(self._CELL, x, y)
+        roll = self._fraction(h, 33)
+        if self.is_town(x, y):
+            loc_type = LocationType.TOWN
+        elif roll < self.BIOME_SHARE:
+            biome = self._hash(self._BIOME, x // self.CHUNK_SIZE, y // self.CHUNK_SIZE)
+            loc_type = self._weighted(self._fraction(biome, 0))
+        else:
+            loc_type = self._weighted((roll - self.BIOME_SHARE) / (1 - self.BIOME_SHARE))
+        
+        if len(self.cells) >= self.CELL_CACHE_LIMIT:
+            self.cells.clear()
+        cell = self.cells[key] = (h, loc_type)
+        return cell
+    
+    def name_at(self, x: int, y: int) -> str:
+        if x == 0 and y == 0:
+            return self.START
+        h, loc_type = self.cell(x, y)
+        names = self.NAMES[loc_type]
+        return f"{names[(h >> 49) % len(names)]} ({x}, {y})"
+    
+    def position_of(self, name: str) -> Optional[Tuple[int, int]]:
+        """Клетка локации по имени или None, если в этом мире такой нет"""
+        if name in (self.START, self.BORDELLO):
+            return 0, 0
+        _, _, tail = name.rpartition(" (")
+        x, _, y = tail.rstrip(")").partition(", ")
+        try:
+            x, y = int(x), int(y)
+        except ValueError:
+            return None
+        if not (self.low <= x <= self.high and self.low <= y <= self.high) or self.name_at(x, y) != name:
+            return None
+        return x, y
+    
+    def chunk_of(self, name: str) -> Tuple[int, int]:
+        position = self.position_of(name)
+        if position is None:
+            raise KeyError(f"Неизвестная локация: {name}")
+        return position[0] // self.CHUNK_SIZE, position[1] // self.CHUNK_SIZE
+    
+    def chunks_around(self, chunk: Tuple[int, int], radius: int) -> List[Tuple[int, int]]:
+        """Чанки в квадрате radius вокруг chunk, не выходящие за край мира"""
+        first, last = self.low // self.CHUNK_SIZE, self.high // self.CHUNK_SIZE
+        cx, cy = chunk
+        return [(x, y)
+                for y in range(max(cy - radius, first), min(cy + radius, last) + 1)
+                for x in range(max(cx - radius, first), min(cx + radius, last) + 1)]
+    
+    def _parent(self, x: int, y: int) -> Optional[Tuple[int, int]]:
+        """Соседка клетки по остовному дереву чанка: западная или северная"""
+        size = self.CHUNK_SIZE
+        first_x = self._span(x // size)[0]
+        first_y = self._span(y // size)[0]
+        if x > first_x and y > first_y:
+            return (x, y - 1) if self.cell(x, y)[0] & 1 else (x - 1, y)
+        if x > first_x:
+            return x - 1, y
+        if y > first_y:
+            return x, y - 1
+        return None
+    
+    def _road(self, x: int, y: int, east: bool) -> bool:
+        """Есть ли дорога из (x, y) в соседнюю клетку на восток или на юг"""
+        nx, ny = (x + 1, y) if east else (x, y + 1)
+        if nx > self.high or ny > self.high:
+            return False
+        size = self.CHUNK_SIZE
+        roll = self._fraction(self.cell(x, y)[0], 1 if east else 17)
+        if nx // size == x // size and ny // size == y // size:
+            return self._parent(nx, ny) == (x, y) or roll < self.LOOP_CHANCE
+        
+        # Граница чанков: одна обязательная дорога на пару соседних чанков
+        start, end = self._span(y // size) if east else self._span(x // size)
+        border = self._hash(self._BORDER, nx // size, ny // size, int(east))
+        return (y if east else x) == start + border % (end - start + 1) or roll < self.BORDER_CHANCE
+    
+    def roads(self, x: int, y: int) -> List[Tuple[int, int]]:
+        """Клетки, куда ведут дороги из (x, y)"""
+        cells = []
+        if self._road(x, y, True):
+            cells.append((x + 1, y))
+        if self._road(x, y, False):
+            cells.append((x, y + 1))
+        if x > self.low and self._road(x - 1, y, True):
+            cells.append((x - 1, y))
+        if y > self.low and self._road(x, y - 1, False):
+            cells.append((x, y - 1))
+        return cells
+    
+    def location_at(self, x: int, y: int) -> Location:
+        """Локация клетки; одинакова при каждом вызове"""
+        connections = [self.name_at(*cell) for cell in self.roads(x, y)]
+        detail = self._hash(self._DETAIL, x, y)
+        if x == 0 and y == 0:
+            return Location(self.START, LocationType.TOWN, (1, 3),
+                            "Тихая деревня, где начинаются многие приключения.",
+                            connections + [self.BORDELLO],
+                            has_shop=True, has_tavern=True, has_bordello=True,
+                            population_seed=detail >> 32)
+        
+        h, loc_type = self.cell(x, y)
+        names = self.NAMES[loc_type]
+        descriptions = self.DESCRIPTIONS[loc_type]
+        low = max(1, max(abs(x), abs(y)) // self.LEVEL_STEP + (detail & 0xFF) % 3)
+        high = low + 2 + (detail >> 8 & 0xFF) % 3
+        town = loc_type == LocationType.TOWN
+        return Location(f"{names[(h >> 49) % len(names)]} ({x}, {y})", loc_type, (low, high),
+                        descriptions[(h >> 57) % len(descriptions)], connections,
+                        has_shop=town and self._fraction(detail, 16) < self.SHOP_CHANCE,
+                        has_tavern=town,
+                        special_event_chance=self.EVENT_CHANCES.get(loc_type, 0.1),
+                        population_seed=detail >> 32)
+    
+    def chunk(self, cx: int, cy: int) -> List[Location]:
+        """Все локации чанка; одинаковы при каждом вызове"""
+        first_x, last_x = self._span(cx)
+        first_y, last_y = self._span(cy)
+        locations = [self.location_at(x, y)
+                     for y in range(first_y, last_y + 1)
+                     for x in range(first_x, last_x + 1)]
+        if first_x <= 0 <= last_x and first_y <= 0 <= last_y:
+            locations.append(Location(self.BORDELLO, LocationType.BORDELLO, (1, 100),
+                                      "Заведение с красивыми девушками и приятной атмосферой.",
+                                      [self.START], has_bordello=True,
+                                      population_seed=self._hash(self._DETAIL, 0, 0, 1) >> 32))
+        return locations
+
+class Quest:
+    """Класс квеста с улучшениями"""
+    _ids = itertools.count(100)  # Номера квестов без явного quest_id
+    
+    def __init__(self, name: str, description: str, location: str,
+                 reward_xp: int, reward_gold: int, required_level: int = 1,
+                 quest_type: str = "main", time_limit: int = 0, quest_id: int = None):
+        self.id = next(Quest._ids) if quest_id is None else quest_id
+        self.name = name
+        self.description = description
+        self.location = location
+        self.status = QuestStatus.NOT_STARTED
+        self.reward_xp = reward_xp
+        self.reward_gold = reward_gold
+        self.required_level = required_level
+        self.quest_type = quest_type
+        self.time_limit = time_limit  # Минут игровых часов на выполнение (0 - без ограничения)
+        self.deadline = 0  # Минута игровых часов, когда квест провален
+        self.start_time = None
+        self.objectives = {}
+        self.completed_objectives = {}
+        self.reward_items = []
+        
+    def add_objective(self, objective: str, target: str, count: int):
+        """Добавление цели квеста"""
+        self.objectives[objective] = {"target": target, "count": count, "current": 0}
+        
+    def add_reward_item(self, item: Item):
+        """Добавление предмета в награду"""
+        self.reward_items.append(item)
+        
+    def start(self, now: int = 0):
+        """Начало квеста в минуту now игровых часов"""
+        self.status = QuestStatus.IN_PROGRESS
+        self.start_time = datetime.now()
+        self.deadline = now + self.time_limit if self.time_limit > 0 else 0
+        
+    def update_objective(self, objective: str, amount: int = 1) -> bool:
+        """Обновление прогресса цели"""
         if objective in self.objectives:
             self.objectives[objective]["current"] += amount
             if self.objectives[objective]["current"] >= self.objectives[objective]["count"]:
@@ -481,13 +2384,11 @@ class Quest:
             return False
         return False
     
-    def check_time_limit(self) -> bool:
-        """Проверка временного лимита"""
-        if self.time_limit > 0 and self.start_time:
-            elapsed = (datetime.now() - self.start_time).seconds / 60
-            if elapsed > self.time_limit:
-                self.status = QuestStatus.FAILED
-                return True
+    def check_time_limit(self, now: int) -> bool:
+        """Проверка временного лимита; True, если квест только что провален"""
+        if self.status == QuestStatus.IN_PROGRESS and self.deadline and now >= self.deadline:
+            self.status = QuestStatus.FAILED
+            return True
         return False
 
 class Achievement:
@@ -522,6 +2423,7 @@ class BordelloGirl:
         self.description = description
         self.available = True
         self.stamina = 100
+        self.recovering = False  # Восстановление сил запланировано на игровых часах
     
     def provide_service(self) -> Tuple[str, Dict[str, int]]:
         """Оказание услуги"""
@@ -562,6 +2464,10 @@ class BordelloGirl:
 
 class Player:
     """Класс игрока с улучшениями"""
+    INVENTORY_LIMIT = 40
+    ARMOR_SLOTS = ("armor", "helmet", "gloves", "boots")
+    SPEED_DEXTERITY_CAP = 60  # Наибольшая прибавка к скорости от ловкости
+    
     def __init__(self, name: str, difficulty: Difficulty = Difficulty.NORMAL):
         self.name = name
         self.level = 1
@@ -593,9 +2499,19 @@ class Player:
         self.achievements = []
         self.daily_quests = []
         self.last_login = datetime.now()
-        self.active_effects = {}  # Активные эффекты от предметов
-        
-        # Статистика
+        self.active_effects = StatusEffects()  # Активные эффекты состояния в бою
+        self.armor_wear = WearCounter()  # Удары по надетой броне
+        self.weapon_wear = WearCounter()  # Удары надетым оружием
+        self._armor_defense = None  # Сумма защиты надетой брони (None - пересчитать)
+        self.last_rolls = {}  # Случайные броски последней атаки или защиты (для журнала боя)
+        self.quiet = False  # Без вывода (автобой): открытые достижения копятся в quiet_achievements
+        self.quiet_achievements: List[str] = []
+        self.modifiers = StatModifiers()  # Временные прибавки к характеристикам
+        self.clock: Optional[TimerWheel] = None  # Игровые часы для модификаторов на время (назначает игра)
+        self.ended_modifiers: List[StatModifier] = []  # Истекшие по часам, еще не показанные игроку
+        self._effective_stats = None  # Базовые характеристики плюс модификаторы (None - пересчитать)
+        
+        # Статистика (базовые значения; временные прибавки - в modifiers)
         self.stats = {
             "strength": 10,
             "dexterity": 10,
@@ -661,10 +2577,68 @@ class Player:
         
         self.update_derived_stats()
     
+    @property
+    def effective_stats(self) -> Dict[str, int]:
+        """Характеристики с модификаторами; пересчитываются только после изменений"""
+        stats = self._effective_stats
+        if stats is None:
+            stats = self._effective_stats = self.modifiers.apply(self.stats)
+        return stats
+    
+    def add_modifier(self, stat: str, value: int, source: str,
+                     minutes: Optional[int] = None, turns: Optional[int] = None) -> StatModifier:
+        """Временная прибавка к характеристике на minutes игровых минут или turns раундов боя"""
+        version = self.modifiers.version
+        now = self.clock.now if self.clock is not None else 0
+        modifier = self.modifiers.add(stat, value, source, minutes, turns, now)
+        if self.modifiers.version != version:
+            self.update_derived_stats()
+        if modifier.expires_at is not None and self.clock is not None:
+            self.clock.schedule_at(modifier.expires_at, self._expire_modifiers)
+        return modifier
+    
+    def set_clock(self, clock: TimerWheel):
+        """Привязка к игровым часам: снятие модификаторов на время заводится на них"""
+        self.clock = clock
+        for expires_at in {modifier.expires_at for modifier in self.modifiers if modifier.expires_at is not None}:
+            clock.schedule_at(expires_at, self._expire_modifiers)
+    
+    def _expire_modifiers(self):
+        expired = self.modifiers.expire(self.clock.now)
+        if expired:
+            self.update_derived_stats()
+            self.ended_modifiers.extend(expired)
+    
+    def expire_modifiers(self) -> List[StatModifier]:
+        """Модификаторы, истекшие по часам игры с прошлого вызова"""
+        expired = self.ended_modifiers
+        self.ended_modifiers = []
+        return expired
+    
+    def tick_modifiers(self) -> List[StatModifier]:
+        """Конец раунда боя для модификаторов с длительностью в раундах"""
+        expired = self.modifiers.tick()
+        if expired:
+            self.update_derived_stats()
+        return expired
+    
+    def end_battle_modifiers(self):
+        """Снятие раундовых модификаторов по окончании боя"""
+        if self.modifiers.drop_turn_based():
+            self.update_derived_stats()
+    
+    def set_stats(self, stats: Dict[str, int], modifiers: List[Dict] = None, now: int = 0):
+        """Замена базовых характеристик и модификаторов (загрузка, повтор боя) без пересчета здоровья и маны"""
+        self.stats = stats
+        self.modifiers = StatModifiers.from_list(modifiers, now)
+        self._effective_stats = None
+    
     def update_derived_stats(self):
-        """Обновление производных характеристик"""
-        self.max_health = 100 + self.stats["constitution"] * 5 + (self.level * 2)
-        self.max_mana = 50 + self.stats["intelligence"] * 3 + (self.level * 1)
+        """Пересчет эффективных характеристик после смены базовых или модификаторов и производных от них"""
+        self._effective_stats = None
+        stats = self.effective_stats
+        self.max_health = 100 + stats["constitution"] * 5 + (self.level * 2)
+        self.max_mana = 50 + stats["intelligence"] * 3 + (self.level * 1)
         
         if self.health > self.max_health:
             self.health = self.max_health
@@ -673,10 +2647,26 @@ class Player:
     
     def attack(self, enemy=None) -> Tuple[int, str]:
         """Атака игрока - ДОБАВЛЕН ФУНКЦИОНАЛ СПЕЦИАЛЬНЫХ ЭФФЕКТОВ ОРУЖИЯ"""
-        base_damage = self.stats["strength"] // 2
+        damage, is_critical, is_miss, special_message = self.roll_attack(enemy)
+        
+        if is_miss:
+            return 0, f"{self.name} промахивается!"
+        
+        message = f"{self.name} атакует"
+        if is_critical:
+            message += f" {Color.RED}КРИТИЧЕСКИ{Color.END}!"
+        if special_message:
+            message += f" {special_message}"
+        
+        return damage, message
+    
+    def roll_attack(self, enemy=None) -> Tuple[int, bool, bool, str]:
+        """Расчет атаки без вывода: (урон, крит, промах, сообщение эффекта)"""
+        stats = self.effective_stats
+        base_damage = stats["strength"] // 2
         
         if self.character_class == CharacterClass.MAGE:
-            base_damage += self.stats["intelligence"] // 3
+            base_damage += stats["intelligence"] // 3
         
         special_damage = 0
         special_message = ""
@@ -686,714 +2676,2612 @@ class Player:
             base_damage += weapon.damage
             
             # Применение специального эффекта оружия
-            if weapon.special_effect and enemy:
-                effect_damage, effect_message = weapon.apply_special_effect(self, enemy)
+            apply = weapon.effect_apply
+            if apply is not None and enemy:
+                effect_damage, effect_message = apply(weapon, self, enemy)
                 special_damage += effect_damage
                 if effect_message:
                     special_message = effect_message
+                stats = self.effective_stats  # Эффект мог добавить модификатор
             
-            weapon.degrade()
+            self.weapon_wear.hits += 1
         
         # Критический удар
-        crit_chance = (self.stats["dexterity"] + self.stats["luck"]) / 200
-        is_critical = random.random() < crit_chance
+        crit_chance = (stats["dexterity"] + stats["luck"]) / 200
+        crit_roll = RNG.combat.random()
+        is_critical = crit_roll < crit_chance
         
-        miss_chance = max(0, 0.05 - (self.stats["dexterity"] / 500))
-        is_miss = random.random() < miss_chance
+        miss_chance = max(0, 0.05 - (stats["dexterity"] / 500))
+        miss_roll = RNG.combat.random()
+        is_miss = miss_roll < miss_chance
+        
+        self.last_rolls = {"crit": crit_roll, "miss": miss_roll}
         
         if is_miss:
-            return 0, f"{self.name} промахивается!"
+            return 0, False, True, special_message
         
         damage = base_damage + special_damage
-        message = f"{self.name} атакует"
         
         if is_critical:
-            damage = int(damage * (1.5 + (self.stats["luck"] / 100)))
-            message += f" {Color.RED}КРИТИЧЕСКИ{Color.END}!"
+            damage = int(damage * (1.5 + (stats["luck"] / 100)))
+        else:
+            damage = roll_int(RNG.combat, int(damage * 0.8), int(damage * 1.2))
+            self.last_rolls["damage"] = damage
+        
+        damage = int(damage * self.difficulty_mult)
+        
+        return damage, is_critical, False, special_message
+    
+    def take_damage(self, damage: int, bonus_defense: int = 0) -> bool:
+        """Получение урона"""
+        self.receive_hit(damage, bonus_defense)
+        return self.health <= 0
+    
+    def defense_against(self, bonus_defense: int = 0) -> int:
+        """Текущая защита от удара с учетом брони и эффектов"""
+        effects = self.active_effects
+        armor = self._armor_defense
+        if armor is None:
+            armor = self.armor_defense()
+        defense = self.effective_stats["constitution"] // 3 + bonus_defense + armor
+        if effects:
+            defense += int(effects.power("shield") - effects.power("armor_break"))
+        return defense
+    
+    def armor_defense(self) -> int:
+        """Защита надетой брони, пересчитываемая только после смены снаряжения"""
+        if self._armor_defense is None:
+            self._armor_defense = sum(self.equipped[slot].defense for slot in self.ARMOR_SLOTS
+                                      if self.equipped[slot])
+        return self._armor_defense
+    
+    def dodge_chance(self) -> float:
+        """Текущий шанс уклонения"""
+        return self.effective_stats["dexterity"] / 300 + self.active_effects.power("dodge")
+    
+    def speed(self) -> int:
+        """Скорость в очереди инициативы: ловкость выше базовой и ускорение"""
+        speed = TurnScheduler.BASE_SPEED + min(max(0, self.effective_stats["dexterity"] - 10), self.SPEED_DEXTERITY_CAP)
+        if self.active_effects:
+            speed = int(speed * (1 + self.active_effects.power("haste")))
+        return speed
+    
+    def degrade_armor(self, hits: int = 1):
+        """Износ надетой брони от полученных ударов (копится в счетчике, см. apply_wear)"""
+        self.armor_wear.hits += hits
+    
+    def apply_wear(self) -> List[Item]:
+        """Перенести накопленный износ в прочность вещей; возвращает сломанные вещи"""
+        broken = []
+        for slot, item in self.equipped.items():
+            if item is not None and item.wear is not None:
+                item.bind_wear(item.wear)
+                if item.durability <= 0:
+                    broken.append(item)
+        if broken:
+            self._armor_defense = None
+        return broken
+    
+    def set_equipped(self, slot: str, item: Optional[Item]):
+        """Положить вещь в слот (или освободить его) с привязкой износа и сбросом кэша защиты"""
+        old = self.equipped[slot]
+        if old is not None:
+            old.bind_wear(None)
+        self.equipped[slot] = item
+        if item is not None:
+            if slot == "weapon":
+                item.bind_wear(self.weapon_wear)
+            elif slot in self.ARMOR_SLOTS:
+                item.bind_wear(self.armor_wear)
+        self._armor_defense = None
+    
+    def receive_hit(self, damage: int, bonus_defense: int = 0) -> Tuple[int, bool]:
+        """Применение удара без вывода: (полученный урон, уклонение)"""
+        defense = self.defense_against(bonus_defense)
+        self.armor_wear.hits += 1
+        
+        dodge_roll = RNG.combat.random()
+        self.last_rolls = {"dodge": dodge_roll}
+        is_dodged = dodge_roll < self.dodge_chance()
+        
+        if is_dodged:
+            return 0, True
+        
+        actual_damage = max(1, damage - defense)
+        actual_damage = int(actual_damage / self.difficulty_mult)
+        
+        self.health -= actual_damage
+        
+        return actual_damage, False
+    
+    def heal(self, amount: int):
+        """Лечение игрока"""
+        self.health = min(self.max_health, self.health + amount)
+    
+    def restore_mana(self, amount: int):
+        """Восстановление маны"""
+        self.mana = min(self.max_mana, self.mana + amount)
+    
+    def drink_potion(self, item: Item) -> Dict[str, int]:
+        """Выпить зелье без вывода, возвращает примененные эффекты"""
+        effects = {}
+        
+        if item.health > 0:
+            old_health = self.health
+            self.heal(item.health)
+            effects["health"] = self.health - old_health
+        
+        if item.mana > 0:
+            old_mana = self.mana
+            self.restore_mana(item.mana)
+            effects["mana"] = self.mana - old_mana
+        
+        if item.name == "Эликсир опыта":
+            self.gain_xp(100)
+            effects["xp"] = 100
+        
+        stat_potions = {
+            "Зелье силы": ("strength", 5, 10),
+            "Эликсир удачи": ("luck", 3, 60),
+            "Зелье ловкости": ("dexterity", 5, 10),
+            "Зелье интеллекта": ("intelligence", 5, 10)
+        }
+        
+        if item.name in stat_potions:
+            stat, value, minutes = stat_potions[item.name]
+            self.add_modifier(stat, value, item.name, minutes=minutes)
+            effects[stat] = value
+        
+        self.remove_item(item)
+        return effects
+    
+    def gain_xp(self, amount: int) -> bool:
+        """Получение опыта"""
+        actual_amount = int(amount * self.difficulty_mult)
+        self.xp += actual_amount
+        
+        self.check_achievement("level_up", 0)
+        
+        if self.xp >= self.xp_to_next_level:
+            self.level_up()
+            return True
+        return False
+    
+    def level_up(self):
+        """Повышение уровня"""
+        self.level += 1
+        self.xp -= self.xp_to_next_level
+        self.xp_to_next_level = int(self.xp_to_next_level * 1.4)
+        
+        self.stats["strength"] += 2
+        self.stats["dexterity"] += 2
+        self.stats["intelligence"] += 2
+        self.stats["constitution"] += 2
+        self.stats["luck"] += 1
+        
+        class_bonus_stats = {
+            CharacterClass.WARRIOR: {"strength": 3, "constitution": 2},
+            CharacterClass.MAGE: {"intelligence": 3},
+            CharacterClass.ARCHER: {"dexterity": 3, "strength": 1},
+            CharacterClass.ROGUE: {"dexterity": 2, "luck": 2}
+        }
+        
+        bonuses = class_bonus_stats.get(self.character_class, {})
+        for stat, value in bonuses.items():
+            if stat == "max_mana":
+                self.max_mana += value
+            else:
+                self.stats[stat] += value
+        
+        self.update_derived_stats()
+        self.health = self.max_health
+        self.mana = self.max_mana
+        
+        if not self.quiet:
+            print(f"{Color.YELLOW}Поздравляем! Вы достигли {self.level} уровня!{Color.END}")
+            print(f"Здоровье: {self.health}/{self.max_health}")
+            print(f"Мана: {self.mana}/{self.max_mana}")
+            for skill in SKILL_BOOK.learned_at(self.character_class, self.level):
+                print(f"{Color.CYAN}Новое умение: {skill.name}!{Color.END}")
+        
+        for achievement in self.achievements:
+            if achievement.condition == "level_up":
+                achievement.update()
+    
+    def add_item(self, item: Item):
+        """Добавление предмета в инвентарь"""
+        if len(self.inventory) < self.INVENTORY_LIMIT:
+            self.inventory.append(item)
+            self.check_achievement("collect_item", 1)
+        else:
+            print(f"{Color.RED}Инвентарь полон!{Color.END}")
+    
+    def remove_item(self, item: Item) -> bool:
+        """Удаление предмета из инвентаря"""
+        if item in self.inventory:
+            self.inventory.remove(item)
+            return True
+        return False
+    
+    def equip_item(self, item: Item) -> bool:
+        """Экипировка предмета"""
+        if item not in self.inventory:
+            return False
+        
+        if not item.is_equippable(self.level):
+            print(f"{Color.RED}Ваш уровень слишком низок для этого предмета!{Color.END}")
+            return False
+        
+        slot_map = {
+            ItemType.WEAPON: "weapon",
+            ItemType.ARMOR: "armor",
+            ItemType.HELMET: "helmet",
+            ItemType.GLOVES: "gloves",
+            ItemType.BOOTS: "boots",
+            ItemType.RING: "ring",
+            ItemType.AMULET: "amulet"
+        }
+        
+        slot = slot_map.get(item.item_type)
+        
+        if item.item_type == ItemType.ARMOR and item.armor_slot:
+            slot = item.armor_slot
+        
+        if not slot:
+            return False
+        
+        if self.equipped[slot]:
+            self.inventory.append(self.equipped[slot])
+        
+        self.set_equipped(slot, item)
+        self.inventory.remove(item)
+        
+        return True
+    
+    def unequip_item(self, slot: str) -> bool:
+        """Снятие предмета"""
+        if self.equipped[slot]:
+            self.inventory.append(self.equipped[slot])
+            self.set_equipped(slot, None)
+            return True
+        return False
+    
+    def get_stat_bonus(self, stat: str) -> int:
+        """Получение бонуса от статов"""
+        return self.effective_stats[stat] // 10
+    
+    def check_achievement(self, condition: str, value: int = 1):
+        """Проверка и обновление достижений"""
+        for achievement in self.achievements:
+            if achievement.condition == condition and not achievement.completed:
+                if achievement.update(value):
+                    if self.quiet:
+                        self.quiet_achievements.append(achievement.name)
+                    else:
+                        print(f"{Color.YELLOW}ДОСТИЖЕНИЕ РАЗБЛОКИРОВАНО: {achievement.name}{Color.END}")
+                        print(f"{achievement.description}")
+                        print(f"Награда: {achievement.reward_xp} опыта, {achievement.reward_gold} золота")
+                    
+                    self.xp += achievement.reward_xp
+                    self.gold += achievement.reward_gold
+                    
+                    if self.xp >= self.xp_to_next_level:
+                        self.level_up()
+
+class BattleAction(Enum):
+    """Действия игрока в бою"""
+    ATTACK = "Атаковать"
+    ITEM = "Использовать предмет"
+    SKILL = "Использовать умение"
+    DEFEND = "Защищаться"
+    FLEE = "Попытаться убежать"
+
+class TurnResult:
+    """Структурированный результат одного хода боя"""
+    __slots__ = ("round", "actor", "action", "damage", "dealt", "is_critical", "is_miss",
+                 "is_dodged", "ability", "message", "effects", "success",
+                 "enemy_dead", "player_dead", "target", "rolls")
+    
+    def __init__(self, round_number: int, actor: str, action):
+        self.round = round_number
+        self.actor = actor  # "player" или "enemy"
+        self.action = action  # BattleAction для игрока, "attack"/"ability"/"volley" для врага
+        self.damage = 0  # Исходный урон удара
+        self.dealt = 0  # Фактически нанесенный урон
+        self.is_critical = False
+        self.is_miss = False
+        self.is_dodged = False
+        self.ability = None  # Умение игрока или способность врага
+        self.message = ""  # Сообщение эффекта оружия или способности
+        self.effects = {}  # Лечение, мана, бонусы зелий
+        self.success = True  # Успех побега/умения
+        self.enemy_dead = False
+        self.player_dead = False
+        self.target = None  # Индекс цели в групповом бою
+        self.rolls = None  # Случайные броски хода
+
+class TurnScheduler:
+    """Очередь инициативы: участник с большей скоростью ходит чаще
+    
+    Каждый участник лежит в куче со временем своего следующего хода; после хода
+    он возвращается в нее с задержкой ROUND_TIME * BASE_SPEED / скорость, поэтому
+    выбор хода и перепланирование стоят O(log n) при любом числе участников.
+    При равном времени первым ходит добавленный раньше. Раунд - отрезок ROUND_TIME
+    на шкале времени: участник со скоростью BASE_SPEED ходит ровно раз в раунд.
+    """
+    ROUND_TIME = 1000  # Длительность раунда в тиках
+    BASE_SPEED = 100
+    MIN_SPEED = 10
+    ROUND_END = -1  # Отметка конца раунда в timeline
+    TIMELINE_LIMIT = 512  # Разверток в кэше: пар скоростей в балансных прогонах - сотни
+    _timelines: Dict[Tuple[Tuple[int, ...], int], Tuple[int, ...]] = {}
+    
+    __slots__ = ("heap", "order", "removed", "time")
+    
+    def __init__(self):
+        self.heap = []  # (время хода, порядок добавления, участник)
+        self.order = {}
+        self.removed = set()  # Выбывшие участники, удаляются из кучи лениво
+        self.time = 0  # Время текущего хода
+    
+    @classmethod
+    def delay(cls, speed: int) -> int:
+        """Тиков между ходами участника с данной скоростью"""
+        return cls.ROUND_TIME * cls.BASE_SPEED // max(cls.MIN_SPEED, speed)
+    
+    def add(self, actor, time: int = 0):
+        """Поставить участника в очередь; первый ход - в момент time"""
+        order = self.order.setdefault(actor, len(self.order))
+        heapq.heappush(self.heap, (time, order, actor))
+    
+    def remove(self, actor):
+        """Убрать выбывшего участника из очереди"""
+        self.removed.add(actor)
+    
+    def _purge(self):
+        heap = self.heap
+        while heap and heap[0][2] in self.removed:
+            self.removed.discard(heapq.heappop(heap)[2])
+    
+    def peek_time(self) -> int:
+        """Время ближайшего хода"""
+        self._purge()
+        return self.heap[0][0]
+    
+    def pop(self):
+        """Участник, чей ход наступил; время очереди переходит к его ходу"""
+        self._purge()
+        self.time, _, actor = heapq.heappop(self.heap)
+        return actor
+    
+    def pop_due(self) -> List:
+        """Остальные участники, чей ход наступил в то же время"""
+        due = []
+        self._purge()
+        while self.heap and self.heap[0][0] == self.time:
+            due.append(heapq.heappop(self.heap)[2])
+            self._purge()
+        return due
+    
+    def push(self, actor, speed: int):
+        """Вернуть сходившего участника в очередь"""
+        if actor not in self.removed:
+            heapq.heappush(self.heap, (self.time + self.delay(speed), self.order[actor], actor))
+    
+    def preview(self, current, speed: Callable, count: int) -> List:
+        """Ближайшие count ходов начиная с текущего, очередь не меняется"""
+        heap = [entry for entry in self.heap if entry[2] not in self.removed]
+        heap.append((self.time, self.order[current], current))
+        heapq.heapify(heap)
+        turns = []
+        while heap and len(turns) < count:
+            time, order, actor = heap[0]
+            turns.append(actor)
+            heapq.heapreplace(heap, (time + self.delay(speed(actor)), order, actor))
+        return turns
+    
+    @classmethod
+    def timeline(cls, speeds: Tuple[int, ...], rounds: int) -> Tuple[int, ...]:
+        """Порядок ходов участников с постоянными скоростями на rounds раундов
+        
+        Участники - индексы в speeds, конец каждого раунда отмечен ROUND_END.
+        Быстрые симуляции боя идут по этой кэшированной развертке без своей кучи.
+        """
+        key = (speeds, rounds)
+        timeline = cls._timelines.get(key)
+        if timeline is None:
+            if len(cls._timelines) >= cls.TIMELINE_LIMIT:
+                del cls._timelines[next(iter(cls._timelines))]
+            scheduler = cls()
+            for actor in range(len(speeds)):
+                scheduler.add(actor)
+            events = []
+            round_number = 1
+            while round_number <= rounds:
+                if scheduler.peek_time() >= round_number * cls.ROUND_TIME:
+                    events.append(cls.ROUND_END)
+                    round_number += 1
+                else:
+                    actor = scheduler.pop()
+                    events.append(actor)
+                    scheduler.push(actor, speeds[actor])
+            timeline = cls._timelines[key] = tuple(events)
+        return timeline
+
+class Skill:
+    """Скомпилированное умение класса: стоимость, перезарядка и формула силы
+    
+    Формула - словарь {величина: коэффициент} с необязательными "base" (слагаемое)
+    и "mult" (множитель суммы); величины - характеристики игрока, "weapon" (урон
+    оружия) и "level". При загрузке она превращается в функцию amount(player).
+    """
+    KINDS = ("damage", "heal", "effect")
+    STATS = ("strength", "dexterity", "intelligence", "constitution", "luck")
+    SCALING = {
+        "weapon": lambda player: player.equipped["weapon"].damage if player.equipped["weapon"] else 0,
+        "level": lambda player: player.level
+    }
+    
+    __slots__ = ("name", "character_class", "level", "cost", "cooldown", "description",
+                 "kind", "amount", "self_damage", "effect", "power", "duration")
+    
+    def __init__(self, definition: Dict):
+        self.name = definition["name"]
+        self.character_class = CharacterClass[definition["class"]]
+        self.level = definition.get("level", 1)  # Уровень, на котором умение изучается
+        self.cost = definition["cost"]
+        self.cooldown = definition.get("cooldown", 0)  # Ходов игрока до повторного применения
+        self.description = definition["description"]
+        self.self_damage = definition.get("self_damage", 0)
+        self.amount = None
+        self.effect = None
+        self.power = 0
+        self.duration = 0
+        
+        kinds = [kind for kind in self.KINDS if kind in definition]
+        if len(kinds) != 1:
+            raise ContentError(f"Умение {self.name} должно задавать ровно одно из {self.KINDS}")
+        self.kind = kinds[0]
+        if self.kind == "effect":
+            effect = definition["effect"]
+            self.effect = effect["name"]
+            self.power = effect["power"]
+            self.duration = effect["duration"]
+        else:
+            self.amount = self.compile_formula(self.name, definition[self.kind])
+    
+    @classmethod
+    def compile_formula(cls, name: str, formula: Dict) -> Callable[["Player"], int]:
+        """Формула умения -> функция игрока; неизвестная величина - ошибка загрузки"""
+        base = formula.get("base", 0)
+        mult = formula.get("mult", 1)
+        terms = []
+        for key, coefficient in formula.items():
+            if key in ("base", "mult"):
+                continue
+            getter = cls.SCALING.get(key)
+            if getter is None:
+                if key not in cls.STATS:
+                    raise ContentError(f"Неизвестная величина в формуле умения {name}: {key}")
+                getter = lambda player, stat=key: player.effective_stats[stat]
+            terms.append((getter, coefficient))
+        terms = tuple(terms)
+        
+        def amount(player) -> int:
+            total = base
+            for getter, coefficient in terms:
+                total += coefficient * getter(player)
+            return int(total * mult)
+        return amount
+
+class SkillBook:
+    """Книга умений: определения компилируются один раз и индексируются по классу
+    
+    Умения класса отсортированы по уровню изучения, поэтому изученные персонажем -
+    префикс списка, найденный бинарным поиском по его уровню.
+    """
+    def __init__(self, definitions: List[Dict]):
+        self.skills: Dict[str, Skill] = {}
+        self.by_class: Dict[CharacterClass, List[Skill]] = {char_class: [] for char_class in CharacterClass}
+        for definition in definitions:
+            skill = Skill(definition)
+            self.skills[skill.name] = skill
+            self.by_class[skill.character_class].append(skill)
+        
+        self.levels: Dict[CharacterClass, List[int]] = {}
+        for char_class, skills in self.by_class.items():
+            skills.sort(key=lambda skill: skill.level)
+            self.levels[char_class] = [skill.level for skill in skills]
+    
+    def get(self, name: Optional[str]) -> Optional[Skill]:
+        return self.skills.get(name) if name else None
+    
+    def learned(self, player) -> List[Skill]:
+        """Умения, изученные игроком к его уровню"""
+        skills = self.by_class.get(player.character_class)
+        if not skills:
+            return []
+        return skills[:bisect.bisect_right(self.levels[player.character_class], player.level)]
+    
+    def knows(self, player, name: str) -> bool:
+        """Изучено ли умение игроком"""
+        skill = self.skills.get(name)
+        return (skill is not None and skill.character_class == player.character_class
+                and skill.level <= player.level)
+    
+    def learned_at(self, char_class: CharacterClass, level: int) -> List[Skill]:
+        """Умения, которые класс изучает ровно на этом уровне"""
+        return [skill for skill in self.by_class.get(char_class, ()) if skill.level == level]
+    
+    def next_skill(self, player) -> Optional[Skill]:
+        """Ближайшее еще не изученное умение"""
+        skills = self.by_class.get(player.character_class)
+        if not skills:
+            return None
+        index = bisect.bisect_right(self.levels[player.character_class], player.level)
+        return skills[index] if index < len(skills) else None
+
+# Определения умений классов: формулы урона и лечения см. Skill.compile_formula
+SKILL_DEFINITIONS = [
+    {"name": "Сильный удар", "class": "WARRIOR", "level": 1, "cost": 10, "cooldown": 0,
+     "damage": {"strength": 0.5, "weapon": 1, "mult": 1.5},
+     "description": "Мощный удар, наносящий увеличенный урон"},
+    {"name": "Берсерк", "class": "WARRIOR", "level": 5, "cost": 25, "cooldown": 3, "self_damage": 10,
+     "damage": {"strength": 0.5, "constitution": 0.2, "weapon": 1, "mult": 2.5},
+     "description": "Мощная атака ценой здоровья"},
+    {"name": "Огненный шар", "class": "MAGE", "level": 1, "cost": 20, "cooldown": 1,
+     "damage": {"strength": 0.5, "intelligence": 0.5, "weapon": 1, "mult": 2.0},
+     "description": "Шар огня, поджигающий врага"},
+    {"name": "Лечение", "class": "MAGE", "level": 3, "cost": 15, "cooldown": 2,
+     "heal": {"base": 30, "intelligence": 0.5},
+     "description": "Восстанавливает здоровье"},
+    {"name": "Стрела снайпера", "class": "ARCHER", "level": 1, "cost": 15, "cooldown": 1,
+     "damage": {"strength": 0.5, "dexterity": 0.3, "weapon": 1, "mult": 1.8},
+     "description": "Точный выстрел в уязвимое место"},
+    {"name": "Быстрая стрельба", "class": "ARCHER", "level": 4, "cost": 12, "cooldown": 4,
+     "effect": {"name": "haste", "power": 0.5, "duration": 3},
+     "description": "На время ускоряет ваши ходы"},
+    {"name": "Скрытый удар", "class": "ROGUE", "level": 1, "cost": 12, "cooldown": 1,
+     "damage": {"strength": 0.5, "luck": 0.3, "weapon": 1, "mult": 1.7},
+     "description": "Внезапная атака из укрытия"},
+    {"name": "Уклонение", "class": "ROGUE", "level": 3, "cost": 8, "cooldown": 3,
+     "effect": {"name": "dodge", "power": 0.5, "duration": 2},
+     "description": "Увеличивает шанс уклонения"}
+]
+
+SKILL_BOOK = SkillBook(SKILL_DEFINITIONS)
+
+class CombatEngine:
+    """Ядро боя без ввода-вывода: разрешает ходы и возвращает структурированные результаты
+    
+    run разыгрывает бой целиком: меняет участников и возвращает TurnResult каждого
+    хода - порядка 10 тысяч боев в секунду на одном ядре. Цель около 100 тысяч боев
+    в секунду относится только к быстрому пути plan + resolve_plan: бой «только
+    атака» без изменения участников, результат - (победа, раунды, потеряно HP).
+    На одном ядре Xeon тестовой машины он дает от 50 до 150 тысяч в зависимости от нагрузки.
+    """
+    ENEMY_ABILITY_CHANCE = 0.3
+    PLAN_ROUNDS = 16  # Раундов развертки в плане: длинные бои дочитывают полную
+    # Эффект состояния способности врага по функции ее обработчика, а не по названию
+    ABILITY_STATUSES = {_magic_shield: "shield", _poison_bite: "poison", _acid_attack: "armor_break"}
+    def __init__(self, player: Player, enemy: Enemy):
+        self.player = player
+        self.enemy = enemy
+        self.round = 1
+        self.defense_bonus = 0  # Бонус защитной стойки на следующий удар врага
+        self.outcome = None  # "victory", "defeat" или "fled"
+        self.replay = None  # BattleReplay, в который пишутся действия и ход боя
+        self.enemy_policy = ENEMY_POLICIES.get(enemy.type, DEFAULT_ENEMY_POLICY)
+        self.player_turns = 0  # Сделано ходов игроком
+        self.skill_ready = {}  # Умение -> номер хода игрока, с которого оно снова доступно
+        
+        # Очередь инициативы: игрок добавлен первым и при равном времени ходит раньше
+        self.scheduler = TurnScheduler()
+        for actor in self.actors():
+            self.scheduler.add(actor)
+        self.actor = self.scheduler.pop()
+        self.player_turn = self.actor == "player"
+    
+    @property
+    def is_over(self) -> bool:
+        """Завершен ли бой"""
+        return self.outcome is not None
+    
+    def actors(self) -> List:
+        """Участники очереди инициативы"""
+        return ["player", "enemy"]
+    
+    def speed_of(self, actor) -> int:
+        """Текущая скорость участника очереди"""
+        return self.player.speed() if actor == "player" else self.enemy.speed()
+    
+    def turn_order(self, count: int = 5) -> List:
+        """Ближайшие count ходов начиная с текущего"""
+        return self.scheduler.preview(self.actor, self.speed_of, count)
+    
+    def available_skills(self) -> List[Skill]:
+        """Умения, изученные игроком, из индекса книги умений"""
+        return SKILL_BOOK.learned(self.player)
+    
+    def cooldown_left(self, skill: str) -> int:
+        """Ходов игрока до конца перезарядки умения"""
+        return max(0, self.skill_ready.get(skill, 0) - self.player_turns)
+    
+    def can_use(self, skill: str) -> bool:
+        """Изучено ли умение, готово ли оно и хватает ли маны"""
+        info = SKILL_BOOK.get(skill)
+        return (info is not None and SKILL_BOOK.knows(self.player, skill)
+                and not self.cooldown_left(skill) and self.player.mana >= info.cost)
+    
+    def _check_outcome(self, result: TurnResult):
+        """Проверка смерти участников после хода"""
+        if self.enemy.health <= 0:
+            result.enemy_dead = True
+            self.outcome = "victory"
+        elif self.player.health <= 0:
+            result.player_dead = True
+            self.outcome = "defeat"
+        
+        if self.outcome:
+            self._end_battle()
+    
+    def _end_battle(self):
+        """Эффекты состояния и раундовые модификаторы действуют только в пределах боя; износ снаряжения - пакетом"""
+        self.player.active_effects.clear()
+        self.enemy.active_effects.clear()
+        self.player.end_battle_modifiers()
+        self.player.apply_wear()
+    
+    def _tick_effects(self, result: TurnResult):
+        """Конец раунда: периодический урон и истечение эффектов"""
+        player_damage = self.player.active_effects.tick()
+        if player_damage:
+            self.player.health -= player_damage
+            result.effects["poison_player"] = player_damage
+        if self.player.modifiers.turn_based:
+            self.player.tick_modifiers()
+        
+        enemy_damage = self.enemy.active_effects.tick()
+        if enemy_damage:
+            self.enemy.health -= enemy_damage
+            result.effects["poison_enemy"] = enemy_damage
+    
+    def _end_turn(self, result: TurnResult, acted: List = None):
+        """Конец хода: сходившие встают в очередь, на границах раундов тикают эффекты
+        
+        Раунд заканчивается, когда ближайший ход выходит за его границу, поэтому
+        медленный участник может пропустить раунд, а быстрый - сходить в нем дважды.
+        """
+        self._check_outcome(result)
+        if self.outcome:
+            return
+        
+        scheduler = self.scheduler
+        for actor in acted or (self.actor,):
+            scheduler.push(actor, self.speed_of(actor))
+        
+        while scheduler.peek_time() >= self.round * scheduler.ROUND_TIME:
+            self._tick_effects(result)
+            self._check_outcome(result)
+            if self.outcome:
+                return
+            self.round += 1
+        
+        self.actor = scheduler.pop()
+        self.player_turn = self.actor == "player"
+    
+    def _recorded(self, result: TurnResult) -> TurnResult:
+        """Запись здоровья участников после хода в повтор боя"""
+        if self.replay is not None:
+            self.replay.add_turn(self.player.health, self.enemy.health)
+        return result
+    
+    def player_action(self, action: BattleAction, item: Item = None, skill: str = None) -> TurnResult:
+        """Ход игрока; item/skill равные None означают отмененное действие"""
+        result = TurnResult(self.round, "player", action)
+        if self.replay is not None:
+            self.replay.add_action(self.player, action, item, skill)
+        
+        if action == BattleAction.ATTACK:
+            damage, is_critical, is_miss, message = self.player.roll_attack(self.enemy)
+            result.damage = damage
+            result.is_critical = is_critical
+            result.is_miss = is_miss
+            result.message = message
+            result.rolls = self.player.last_rolls
+            if damage > 0:
+                result.dealt = self.enemy.take_damage(damage)
+        
+        elif action == BattleAction.ITEM:
+            if item is None:
+                result.success = False
+            elif item.item_type == ItemType.POTION:
+                result.effects = self.player.drink_potion(item)
+            else:
+                self.player.remove_item(item)
+        
+        elif action == BattleAction.SKILL:
+            self._use_skill(skill, result)
+        
+        elif action == BattleAction.DEFEND:
+            self.defense_bonus = self.player.get_stat_bonus("constitution") // 2
+            result.effects = {"defense": self.defense_bonus}
+        
+        elif action == BattleAction.FLEE:
+            escape_chance = 0.5 + self.player.get_stat_bonus("dexterity") * 0.1
+            escape_roll = RNG.combat.random()
+            result.rolls = {"escape": escape_roll}
+            result.success = escape_roll < escape_chance
+            if result.success:
+                self.outcome = "fled"
+                self._end_battle()
+                return self._recorded(result)
+        
+        self.player_turns += 1
+        self._end_turn(result)
+        return self._recorded(result)
+    
+    def _use_skill(self, skill: str, result: TurnResult):
+        """Применение умения игрока: проверка изучения, перезарядки и маны"""
+        player = self.player
+        info = SKILL_BOOK.get(skill)
+        result.ability = skill
+        
+        if info is None or not SKILL_BOOK.knows(player, skill):
+            result.success = False
+            return
+        
+        cooldown = self.cooldown_left(skill)
+        if cooldown:
+            result.success = False
+            result.effects = {"cooldown": cooldown}
+            return
+        
+        if player.mana < info.cost:
+            result.success = False
+            return
+        
+        player.mana -= info.cost
+        self.skill_ready[skill] = self.player_turns + 1 + info.cooldown
+        
+        if info.kind == "damage":
+            damage = info.amount(player)
+            weapon = player.equipped["weapon"]
+            if weapon:
+                bonus, result.message = weapon.apply_special_effect(player, self.enemy)
+                damage += bonus
+            result.damage = damage
+            result.dealt = self.enemy.take_damage(damage)
+            
+            if info.self_damage:
+                player.health -= info.self_damage
+                result.effects = {"self_damage": info.self_damage}
+        
+        elif info.kind == "heal":
+            amount = info.amount(player)
+            player.heal(amount)
+            result.effects = {"health": amount}
+        
+        else:
+            player.active_effects.apply(info.effect, info.power, info.duration)
+            result.effects = {info.effect: info.power}
+    
+    def enemy_action(self) -> TurnResult:
+        """Ход противника: способность с шансом 30% или обычная атака"""
+        enemy = self.enemy
+        damage = 0
+        rolls = {}
+        
+        if "stun" in enemy.active_effects:
+            result = TurnResult(self.round, "enemy", "stunned")
+        else:
+            ability = self.enemy_policy(self, rolls)
+            if ability is not None:
+                result = TurnResult(self.round, "enemy", "ability")
+                result.ability = ability
+                damage, result.message = enemy.use_special_ability(ability, self.player)
+            else:
+                result = TurnResult(self.round, "enemy", "attack")
+                damage = roll_int(RNG.combat, max(1, enemy.damage - 2), enemy.damage + 2)
+                rolls["damage"] = damage
+        
+        if damage > 0:
+            result.damage = damage
+            result.dealt, result.is_dodged = self.player.receive_hit(damage, self.defense_bonus)
+            rolls.update(self.player.last_rolls)
+        result.rolls = rolls
+        
+        self.defense_bonus = 0
+        self._end_turn(result)
+        return self._recorded(result)
+    
+    def run(self, policy: Callable[["CombatEngine"], BattleAction] = None,
+            max_rounds: int = 1000) -> List[TurnResult]:
+        """Провести бой целиком по стратегии (по умолчанию - только атака)
+        
+        Стратегия возвращает BattleAction или кортеж (действие, предмет, умение).
+        """
+        results = []
+        
+        while not self.is_over and self.round <= max_rounds:
+            if self.player_turn:
+                decision = policy(self) if policy else BattleAction.ATTACK
+                if isinstance(decision, tuple):
+                    results.append(self.player_action(*decision))
+                else:
+                    results.append(self.player_action(decision))
+            else:
+                results.append(self.enemy_action())
+        
+        if not self.is_over:
+            self._end_battle()
+        
+        return results
+    
+    @staticmethod
+    def simulate(player: Player, enemy: Enemy, max_rounds: int = 1000,
+                 rng: random.Random = RNG.combat) -> Tuple[bool, int, int]:
+        """Быстрый бой «только атака» без изменения участников: (победа, раунды, потеряно HP)"""
+        return CombatEngine.resolve(CombatEngine.snapshot(player, enemy), max_rounds, rng)
+    
+    @staticmethod
+    def snapshot(player: Player, enemy: Enemy) -> Tuple:
+        """Компактный снимок параметров боя для многократного CombatEngine.resolve
+        
+        Последний элемент - политика врага из ENEMY_POLICIES или None для
+        DEFAULT_ENEMY_POLICY (способность выбирается случайно).
+        """
+        stats = player.effective_stats
+        
+        base_damage = stats["strength"] // 2
+        if player.character_class == CharacterClass.MAGE:
+            base_damage += stats["intelligence"] // 3
+        
+        weapon = player.equipped["weapon"]
+        effect = None
+        if weapon:
+            base_damage += weapon.damage
+            effect = weapon.special_effect
+        
+        defense = stats["constitution"] // 3 + player.armor_defense()
+        
+        abilities = [(ability, CombatEngine.ability_damage(enemy, ability))
+                     for ability in enemy.special_abilities]
+        
+        return (base_damage, effect, stats["dexterity"], stats["luck"], defense,
+                player.difficulty_mult, player.health, player.max_health,
+                enemy.health, enemy.damage, abilities, player.speed(), enemy.speed(),
+                enemy.max_health, ENEMY_POLICIES.get(enemy.type))
+    
+    @staticmethod
+    def plan(snapshot: Tuple, max_rounds: int = 1000) -> Tuple:
+        """Постоянные боя по снимку для серии CombatEngine.resolve_plan
+        
+        Все, что не зависит от бросков, считается здесь один раз: разброс и крит
+        удара игрока для каждого бонуса урона, шансы, границы атаки врага,
+        эффект состояния каждой способности (CombatEngine.ability_status),
+        развертка очередности ходов и модели политики врага (обычная и с
+        прибавкой удачи от critical_chance).
+        """
+        (base_damage, effect, dexterity, luck, defense, player_mult, start_health,
+         max_health, enemy_health, enemy_damage, abilities, player_speed, enemy_speed,
+         _, policy) = snapshot
+        
+        lucky_luck = luck + Item.CRITICAL_LUCK
+        crit_mult = 1.5 + luck / 100
+        lucky_mult = 1.5 + lucky_luck / 100
+        # Удар с бонусом урона эффекта (огонь 3-8, пробитие 5, иначе 0):
+        # (нижняя граница, ширина разброса, бит на бросок разброса, крит, крит с удачей)
+        if effect == "fire_damage":
+            bonuses = range(3, 9)
+        else:
+            bonuses = (5,) if effect == "armor_penetration" else (0,)
+        hits = [None] * 9
+        for bonus in bonuses:
+            damage = base_damage + bonus
+            low = int(damage * 0.8)
+            span = int(damage * 1.2) - low + 1
+            hits[bonus] = (low, span, span.bit_length(), int(damage * crit_mult), int(damage * lucky_mult))
+        
+        enemy_low = max(1, enemy_damage - 2)
+        enemy_span = enemy_damage + 2 - enemy_low + 1
+        models = None
+        if policy is not None:
+            lucky = snapshot[:3] + (lucky_luck,) + snapshot[4:]
+            models = (policy.snapshot_model(snapshot), policy.snapshot_model(lucky))
+        return (tuple(hits), effect, (dexterity + luck) / 200, (dexterity + lucky_luck) / 200,
+                max(0, 0.05 - (dexterity / 500)), dexterity / 300, player_mult,
+                start_health, max_health, enemy_health, enemy_low, enemy_span, enemy_span.bit_length(),
+                tuple((ability, damage, CombatEngine.ability_status(ability)) for ability, damage in abilities),
+                defense, max(1, enemy_damage // 4), (player_speed, enemy_speed),
+                TurnScheduler.timeline((player_speed, enemy_speed), min(max_rounds, CombatEngine.PLAN_ROUNDS)),
+                max_rounds, policy, models)
+    
+    @staticmethod
+    def resolve(snapshot: Tuple, max_rounds: int = 1000,
+                rng: random.Random = RNG.combat) -> Tuple[bool, int, int]:
+        """Разрешение боя по снимку; для серии боев выгоднее plan + resolve_plan"""
+        return CombatEngine.resolve_plan(CombatEngine.plan(snapshot, max_rounds), rng)
+    
+    @staticmethod
+    def resolve_plan(plan: Tuple, rng: random.Random = RNG.combat) -> Tuple[bool, int, int]:
+        """Разрешение боя по плану из CombatEngine.plan
+        
+        Повторяет формулы Player.attack, Player.take_damage, Enemy.use_special_ability,
+        выбор способности политикой врага и тики StatusEffects в том же порядке
+        бросков, что и CombatEngine.run по стратегии «только атака», но без
+        прочности, вывода и промежуточных объектов. Очередность ходов берется из
+        TurnScheduler.timeline по скоростям участников.
+        """
+        (hits, effect, base_crit_chance, lucky_crit_chance, miss_chance, dodge_chance, player_mult,
+         start_health, max_health, enemy_health, enemy_low, enemy_span, enemy_bits, abilities, defense,
+         bite_poison, speeds, timeline, max_rounds, policy, models) = plan
+        
+        ability_chance = CombatEngine.ENEMY_ABILITY_CHANCE
+        poison_duration = Item.POISON_DURATION
+        effect_duration = Enemy.ABILITY_EFFECT_DURATION
+        shield_power = Enemy.SHIELD_POWER
+        acid_reduction = Enemy.ACID_ARMOR_REDUCTION
+        lucky_turns = Item.CRITICAL_LUCK_TURNS
+        
+        rand = rng.random
+        # Целые броски - тем же roll_below, что и у Player.attack и врага в CombatEngine.run;
+        # в двух самых частых (разброс удара, атака врага) его цикл развернут на месте
+        getrandbits = rng.getrandbits
+        health = start_health
+        plain_hit = hits[5] if effect == "armor_penetration" else hits[0]
+        crit_chance = base_crit_chance
+        crit_index = 3
+        
+        # Эффекты состояния: сила и оставшиеся раунды
+        enemy_poison = enemy_poison_left = enemy_shield_left = 0
+        player_poison = player_poison_left = armor_break = armor_break_left = 0
+        enemy_stunned = False
+        lucky_left = 0  # Раунды модификатора удачи от critical_chance
+        
+        round_number = 1
+        events = timeline
+        while True:
+            for actor in events:
+                if actor == 0:
+                    hit = plain_hit
+                    if effect:
+                        if effect == "fire_damage":
+                            hit = hits[3 + roll_below(rng, 6)]
+                        elif effect == "poison":
+                            enemy_poison = max(enemy_poison, 2 + roll_below(rng, 4))
+                            enemy_poison_left = max(enemy_poison_left, poison_duration)
+                        elif effect == "mana_steal":
+                            roll_below(rng, 11)
+                        elif effect == "critical_chance":
+                            lucky_left = lucky_turns
+                            crit_chance = lucky_crit_chance
+                            crit_index = 4
+                        elif effect == "life_steal":
+                            health = min(max_health, health + 3 + roll_below(rng, 8))
+                        elif effect == "stun_chance":
+                            if rand() < 0.2:
+                                enemy_stunned = True
+                    
+                    is_critical = rand() < crit_chance
+                    if rand() >= miss_chance:
+                        if is_critical:
+                            damage = int(hit[crit_index] * player_mult)
+                        else:
+                            span = hit[1]
+                            roll = getrandbits(hit[2])
+                            while roll >= span:
+                                roll = getrandbits(hit[2])
+                            damage = int((hit[0] + roll) * player_mult)
+                        if damage > 0:
+                            if enemy_shield_left:
+                                damage = max(0, damage - shield_power)
+                            enemy_health -= damage
+                            if enemy_health <= 0:
+                                return True, round_number, start_health - health
+                
+                elif actor == 1:
+                    damage = 0
+                    ability = None
+                    if enemy_stunned:
+                        pass  # Оглушение держится до конца раунда
+                    elif abilities and rand() < ability_chance:
+                        status = None
+                        if policy is None:
+                            ability, damage, status = abilities[roll_below(rng, len(abilities))]
+                        else:
+                            ability = policy.choose(models[crit_index - 3],
+                                                    (health, float(enemy_health), enemy_shield_left,
+                                                     player_poison_left, armor_break, armor_break_left), 0)
+                            for option, option_damage, option_status in abilities:
+                                if option == ability:
+                                    damage, status = option_damage, option_status
+                        if status == "shield":
+                            enemy_shield_left = max(enemy_shield_left, effect_duration)
+                        elif status == "poison":
+                            player_poison = bite_poison
+                            player_poison_left = max(player_poison_left, effect_duration)
+                        elif status == "armor_break":
+                            armor_break += acid_reduction
+                            armor_break_left = max(armor_break_left, effect_duration)
+                    if ability is None and not enemy_stunned:
+                        roll = getrandbits(enemy_bits)
+                        while roll >= enemy_span:
+                            roll = getrandbits(enemy_bits)
+                        damage = enemy_low + roll
+                    
+                    if damage > 0 and rand() >= dodge_chance:
+                        health -= int(max(1, damage - defense + armor_break) / player_mult)
+                        if health <= 0:
+                            return False, round_number, start_health - health
+                
+                else:
+                    # Конец раунда: тики эффектов игрока, затем врага
+                    if player_poison_left:
+                        health -= player_poison
+                        player_poison_left -= 1
+                        if not player_poison_left:
+                            player_poison = 0
+                    if armor_break_left:
+                        armor_break_left -= 1
+                        if not armor_break_left:
+                            armor_break = 0
+                    if enemy_poison_left:
+                        enemy_health -= enemy_poison
+                        enemy_poison_left -= 1
+                        if not enemy_poison_left:
+                            enemy_poison = 0
+                    if enemy_shield_left:
+                        enemy_shield_left -= 1
+                    enemy_stunned = False
+                    if lucky_left:
+                        lucky_left -= 1
+                        if not lucky_left:
+                            crit_chance, crit_index = base_crit_chance, 3
+                    
+                    if enemy_health <= 0:
+                        return True, round_number, start_health - health
+                    if health <= 0:
+                        return False, round_number, start_health - health
+                    round_number += 1
+            
+            if round_number > max_rounds:
+                break
+            # Бой длиннее развертки плана: продолжение по полной развертке
+            events = TurnScheduler.timeline(speeds, max_rounds)[len(timeline):]
+        
+        return False, max_rounds, start_health - health
+    
+    @staticmethod
+    def ability_status(ability: str) -> Optional[str]:
+        """Эффект состояния, который вешает способность врага, или None для чистого урона"""
+        handler = ENEMY_ABILITIES.resolve(ability)
+        return CombatEngine.ABILITY_STATUSES.get(handler.apply) if handler else None
+    
+    @staticmethod
+    def ability_damage(enemy: Enemy, ability: str) -> int:
+        """Урон способности врага без применения ее побочных эффектов"""
+        handler = ENEMY_ABILITIES.resolve(ability)
+        return int(enemy.damage * handler.damage_mult) if handler else 0
+
+class AutoBattlePolicy:
+    """Стратегия автобоя: умения, зелья и побег по порогам здоровья"""
+    def __init__(self, name: str, heal_below: float = 0.0, flee_below: float = 0.0,
+                 use_skills: bool = False):
+        self.name = name
+        self.heal_below = heal_below  # Доля здоровья, ниже которой пьется зелье
+        self.flee_below = flee_below  # Доля здоровья, ниже которой (без зелий) - побег
+        self.use_skills = use_skills
+    
+    @classmethod
+    def presets(cls) -> List["AutoBattlePolicy"]:
+        """Готовые стратегии для меню автобоя"""
+        return [
+            cls("Только атака"),
+            cls("Осторожная: зелье ниже 30% здоровья, без зелий - побег", heal_below=0.3, flee_below=0.3),
+            cls("Умения: сильнейшее доступное умение, зелье ниже 40%", heal_below=0.4, flee_below=0.15,
+                use_skills=True)
+        ]
+    
+    def __call__(self, engine: CombatEngine) -> Tuple[BattleAction, Optional[Item], Optional[str]]:
+        player = engine.player
+        health = player.health / player.max_health
+        
+        if health < self.heal_below:
+            potion = self.find_potion(player)
+            if potion:
+                return BattleAction.ITEM, potion, None
+            if self.use_skills and self.can_cast(engine, "Лечение"):
+                return BattleAction.SKILL, None, "Лечение"
+        
+        if health < self.flee_below:
+            return BattleAction.FLEE, None, None
+        
+        if self.use_skills:
+            skill = self.strongest_skill(engine)
+            if skill:
+                return BattleAction.SKILL, None, skill
+        
+        return BattleAction.ATTACK, None, None
+    
+    @staticmethod
+    def find_potion(player: Player) -> Optional[Item]:
+        """Самое сильное лечебное зелье в инвентаре"""
+        best = None
+        for item in player.inventory:
+            if item.item_type == ItemType.POTION and item.health > 0:
+                if best is None or item.health > best.health:
+                    best = item
+        return best
+    
+    @staticmethod
+    def can_cast(engine: CombatEngine, skill: str) -> bool:
+        """Изучено ли умение, готово ли оно и хватает ли маны"""
+        return engine.can_use(skill)
+    
+    @staticmethod
+    def strongest_skill(engine: CombatEngine) -> Optional[str]:
+        """Готовое атакующее умение с наибольшим уроном по формуле"""
+        player = engine.player
+        best, best_damage = None, 0
+        for skill in engine.available_skills():
+            if (skill.kind == "damage" and engine.can_use(skill.name)
+                    and player.health > skill.self_damage * 2):
+                damage = skill.amount(player)
+                if damage > best_damage:
+                    best, best_damage = skill.name, damage
+        return best
+
+class RandomAbilityPolicy:
+    """Поведение врага по умолчанию: способность с шансом ENEMY_ABILITY_CHANCE, иначе атака
+
+    Политика врага вызывается движком как policy(engine, rolls) и возвращает имя
+    способности или None для обычной атаки; свои броски она пишет в rolls. Когда
+    способность готова, выбор делает decide - его же зовет групповой бой.
+    """
+    def __call__(self, engine: CombatEngine, rolls: Dict) -> Optional[str]:
+        if not engine.enemy.special_abilities:
+            return None
+        rolls["ability"] = RNG.combat.random()
+        if rolls["ability"] < engine.ENEMY_ABILITY_CHANCE:
+            return self.decide(engine.player, engine.enemy, engine.defense_bonus)
+        return None
+    
+    def decide(self, player: Player, enemy: Enemy, defense_bonus: int = 0) -> Optional[str]:
+        """Готовая способность: случайная из способностей врага"""
+        return enemy.special_abilities[roll_below(RNG.combat, len(enemy.special_abilities))]
+
+class ExpectimaxPolicy(RandomAbilityPolicy):
+    """Враг с просмотром вперед: способность готова с тем же шансом, но применять ли ее
+    и какую, решает expectimax ограниченной глубины по упрощенной модели боя
+
+    Модель учитывает готовность способности и уклонение игрока как случайные узлы,
+    щит, яд и кислоту как эффекты с длительностью, а удары игрока между ходами
+    врага - их матожиданием с поправкой на соотношение скоростей.
+    Оценки кэшируются по компактному состоянию боя в таблице своего матча, поэтому
+    решение - чистая функция состояния и повторы боев остаются точными. Та же
+    функция (choose) принимает решения в CombatEngine.resolve_plan по модели из
+    плана боя и в групповом бою.
+    """
+    WIN = 2.0  # Оценка гибели игрока; эвристика листьев лежит в [-1, 1]
+    TABLE_LIMIT = 32  # Сколько таблиц матчей держать одновременно
+
+    def __init__(self, depth: int = 4):
+        self.depth = depth
+        self.tables = {}
+
+    @classmethod
+    def model(cls, player: Player, enemy: Enemy) -> Tuple:
+        """Неизменные в бою параметры матча: ключ таблицы транспозиций"""
+        return cls.snapshot_model(CombatEngine.snapshot(player, enemy), player.dodge_chance(),
+                                  max(enemy.poison_power(), player.active_effects.power("poison")))
+
+    @classmethod
+    def snapshot_model(cls, snapshot: Tuple, dodge: Optional[float] = None,
+                       poison_power: Optional[int] = None) -> Tuple:
+        """Модель по снимку CombatEngine.snapshot; без dodge и poison_power - как в начале
+        боя «только атака»: уклонение от одной ловкости, яд - от укуса этого врага
+        """
+        (base_damage, effect, dexterity, luck, defense, player_mult, _, max_health, _,
+         enemy_damage, abilities, player_speed, enemy_speed, enemy_max_health, _) = snapshot
+        if dodge is None:
+            dodge = dexterity / 300
+        if poison_power is None:
+            poison_power = max(1, enemy_damage // 4)
+
+        # Матожидание удара игрока: промах, крит и разброс урона как в Player.roll_attack
+        damage = base_damage + {"fire_damage": 5.5, "armor_penetration": 5}.get(effect, 0)
+        crit_chance = (dexterity + luck) / 200
+        hit_chance = 1 - max(0, 0.05 - dexterity / 500)
+        crit = int(damage * (1.5 + luck / 100)) * player_mult
+        normal = (int(damage * 0.8) + int(damage * 1.2)) / 2 * player_mult
+        hit = hit_chance * (crit_chance * crit + (1 - crit_chance) * normal)
+        shielded = hit_chance * (crit_chance * max(0, crit - Enemy.SHIELD_POWER)
+                                 + (1 - crit_chance) * max(0, normal - Enemy.SHIELD_POWER))
+        # Сколько в среднем ходит игрок за один ход врага
+        tempo = TurnScheduler.delay(enemy_speed) / TurnScheduler.delay(player_speed)
+        hit *= tempo
+        shielded *= tempo
+
+        attack = (None, (max(1, enemy_damage - 2) + enemy_damage + 2) / 2, None)
+        options = (attack,) + tuple((ability, ability_damage, CombatEngine.ability_status(ability))
+                                    for ability, ability_damage in abilities)
+
+        return (CombatEngine.ENEMY_ABILITY_CHANCE, options, dodge, defense, player_mult,
+                hit, shielded, poison_power, max_health, enemy_max_health)
+
+    def decide(self, player: Player, enemy: Enemy, defense_bonus: int = 0) -> Optional[str]:
+        """Лучшая способность врага против игрока или None, если выгоднее обычная атака"""
+        effects = player.active_effects
+        state = (player.health, float(enemy.health), enemy.active_effects.remaining("shield"),
+                 effects.remaining("poison"), effects.power("armor_break"), effects.remaining("armor_break"))
+        return self.choose(self.model(player, enemy), state, defense_bonus)
+
+    def choose(self, model: Tuple, state: Tuple, defense_bonus: int) -> Optional[str]:
+        """Решение по модели матча и состоянию (здоровье игрока и врага, щит, яд, кислота)"""
+        table = self.tables.get(model)
+        if table is None:
+            if len(self.tables) >= self.TABLE_LIMIT:
+                del self.tables[next(iter(self.tables))]
+            table = self.tables[model] = {}
+        # Готовые решения лежат в той же таблице под ключом (состояние, бонус защиты)
+        decision_key = (state, defense_bonus)
+        if decision_key in table:
+            return table[decision_key]
+
+        (chance, options, dodge, defense, mult, hit_damage, shielded_damage,
+         poison_power, max_health, max_enemy_health) = model
+        duration = Enemy.ABILITY_EFFECT_DURATION
+        acid = Enemy.ACID_ARMOR_REDUCTION
+        win = self.WIN
+
+        def value(state: Tuple, depth: int) -> float:
+            """Оценка перед ходом врага: способность готова с вероятностью chance"""
+            if depth == 0:
+                return state[1] / max_enemy_health - state[0] / max_health
+            key = state + (depth,)
+            cached = table.get(key)
+            if cached is not None:
+                return cached
+            attack = best = act(state, options[0], depth, 0)
+            for option in options[1:]:
+                option_value = act(state, option, depth, 0)
+                if option_value > best:
+                    best = option_value
+            result = table[key] = (1 - chance) * attack + chance * best
+            return result
+
+        def act(state: Tuple, option: Tuple, depth: int, bonus: int) -> float:
+            """Случайный узел уклонения игрока от действия врага"""
+            if option[1] > 0:
+                return (dodge * step(state, option, False, depth, bonus)
+                        + (1 - dodge) * step(state, option, True, depth, bonus))
+            return step(state, option, False, depth, bonus)
+
+        def step(state: Tuple, option: Tuple, hit: bool, depth: int, bonus: int) -> float:
+            """Остаток раунда по правилам CombatEngine и ответный удар игрока"""
+            health, enemy_health, shield, poison, armor, armor_left = state
+            kind = option[2]
+            if kind == "shield":
+                shield = max(shield, duration)
+            elif kind == "poison":
+                poison = max(poison, duration)
+            elif kind == "armor_break":
+                armor += acid
+                armor_left = max(armor_left, duration)
+
+            if hit:
+                health -= int(max(1, option[1] - defense - bonus + armor) / mult)
+                if health <= 0:
+                    return win
+
+            if poison:
+                health -= poison_power
+                poison -= 1
+            if armor_left:
+                armor_left -= 1
+                if not armor_left:
+                    armor = 0
+            if shield:
+                shield -= 1
+            if health <= 0:
+                return win
+
+            enemy_health -= shielded_damage if shield else hit_damage
+            if enemy_health <= 0:
+                return -win
+            return value((health, enemy_health, shield, poison, armor, armor_left), depth - 1)
+
+        best, best_value = None, act(state, options[0], self.depth, defense_bonus)
+        for option in options[1:]:
+            option_value = act(state, option, self.depth, defense_bonus)
+            if option_value > best_value:
+                best, best_value = option[0], option_value
+        table[decision_key] = best
+        return best
+
+DEFAULT_ENEMY_POLICY = RandomAbilityPolicy()
+
+# Политики врагов по типу; остальные типы используют DEFAULT_ENEMY_POLICY
+ENEMY_POLICIES: Dict[EnemyType, RandomAbilityPolicy] = {
+    EnemyType.DRAGON: ExpectimaxPolicy(depth=4),
+    EnemyType.WITCH: ExpectimaxPolicy(depth=4)
+}
+
+class EnemyGroup:
+    """Враги группового боя: здоровье и урон в упакованных массивах"""
+    def __init__(self, enemies: List[Enemy]):
+        self.enemies = list(enemies)
+        health = [enemy.health for enemy in self.enemies]
+        damage = [enemy.damage for enemy in self.enemies]
+        
+        if np is not None:
+            self.health = np.array(health, dtype=np.int64)
+            self.damage = np.array(damage, dtype=np.int64)
+            self.alive = self.health > 0
+        else:
+            self.health = health
+            self.damage = damage
+            self.alive = [hp > 0 for hp in health]
+        
+        self.living = [i for i, hp in enumerate(health) if hp > 0]  # Индексы живых по порядку
+        self.casters = [i for i, enemy in enumerate(self.enemies) if enemy.special_abilities]
+        self.affected = set()  # Индексы врагов с активными эффектами
+    
+    def __len__(self) -> int:
+        return len(self.living)
+    
+    def sync(self, index: int) -> bool:
+        """Перенос состояния врага в массивы; True, если враг только что погиб"""
+        enemy = self.enemies[index]
+        self.health[index] = enemy.health
+        
+        if enemy.health > 0:
+            if enemy.active_effects:
+                self.affected.add(index)
+            return False
+        
+        if not self.alive[index]:
+            return False
+        
+        self.alive[index] = False
+        self.living.remove(index)
+        self.affected.discard(index)
+        return True
+    
+    def defeated(self) -> List[Enemy]:
+        """Побежденные враги"""
+        return [enemy for enemy, alive in zip(self.enemies, self.alive) if not alive]
+    
+    def roll_attacks(self, ready, rng) -> List[int]:
+        """Броски урона обычных атак всех готовых врагов разом"""
+        if np is not None:
+            damage = self.damage[ready]
+            return rng.integers(np.maximum(1, damage - 2), damage + 3)
+        
+        return [roll_int(RNG.combat, max(1, damage - 2), damage + 2)
+                for damage, is_ready in zip(self.damage, ready) if is_ready]
+
+class GroupCombatEngine(CombatEngine):
+    """Групповой бой: игрок атакует выбранную цель, враги отвечают залпами
+    
+    Каждый враг - отдельный участник очереди инициативы; все враги, чей ход
+    наступил одновременно, бьют одним залпом.
+    """
+    def __init__(self, player: Player, enemies: List[Enemy], target: int = 0):
+        self.group = EnemyGroup(enemies)
+        super().__init__(player, self.group.enemies[target])
+        self.target = target
+        # Броски залпа идут блоками из боевого потока RNG
+        self.rng = RNG.numpy("combat") if np is not None else RNG.combat
+    
+    def actors(self) -> List:
+        return ["player"] + self.group.living
+    
+    def speed_of(self, actor) -> int:
+        return self.player.speed() if actor == "player" else self.group.enemies[actor].speed()
+    
+    def _sync(self, index: int) -> bool:
+        """EnemyGroup.sync; погибший враг покидает очередь инициативы"""
+        if self.group.sync(index):
+            self.scheduler.remove(index)
+            return True
+        return False
+    
+    def set_target(self, index: int) -> bool:
+        """Смена цели игрока; False, если враг уже повержен"""
+        if not 0 <= index < len(self.group.enemies) or not self.group.alive[index]:
+            return False
+        self.target = index
+        self.enemy = self.group.enemies[index]
+        return True
+    
+    def _check_outcome(self, result: TurnResult):
+        """Смерть цели переводит удар на следующего врага, победа - когда повержены все"""
+        group = self.group
+        if result.actor == "player" and result.target is None:  # Цель хода фиксируется один раз
+            result.target = self.target
+            result.enemy_dead = self._sync(self.target)
+        
+        if not group.living:
+            self.outcome = "victory"
+        elif self.player.health <= 0:
+            result.player_dead = True
+            self.outcome = "defeat"
+        elif not group.alive[self.target]:
+            self.set_target(group.living[0])
+        
+        if self.outcome:
+            self._end_battle()
+    
+    def _end_battle(self):
+        self.player.active_effects.clear()
+        for enemy in self.group.enemies:
+            enemy.active_effects.clear()
+        self.player.end_battle_modifiers()
+        self.player.apply_wear()
+    
+    def _tick_effects(self, result: TurnResult):
+        """Тики эффектов игрока и только тех врагов, на которых они наложены"""
+        group = self.group
+        player_damage = self.player.active_effects.tick()
+        if player_damage:
+            self.player.health -= player_damage
+            result.effects["poison_player"] = player_damage
+        if self.player.modifiers.turn_based:
+            self.player.tick_modifiers()
+        
+        enemy_damage = 0
+        killed = []
+        for index in list(group.affected):
+            enemy = group.enemies[index]
+            damage = enemy.active_effects.tick()
+            if damage:
+                enemy.health -= damage
+                enemy_damage += damage
+            if not enemy.active_effects:
+                group.affected.discard(index)
+            if self._sync(index):
+                killed.append(index)
+        
+        if enemy_damage:
+            result.effects["poison_enemy"] = enemy_damage
+        if killed:
+            result.effects["killed"] = killed
+    
+    def enemy_action(self) -> TurnResult:
+        """Ход врагов, чья очередь наступила: способности по одному, обычные атаки - одним залпом"""
+        group = self.group
+        player = self.player
+        result = TurnResult(self.round, "enemy", "volley")
+        
+        acting = [self.actor] + self.scheduler.pop_due()
+        ready = np.zeros(len(group.enemies), dtype=bool) if np is not None else [False] * len(group.enemies)
+        for index in acting:
+            ready[index] = True
+        stunned = [i for i in acting if i in group.affected and "stun" in group.enemies[i].active_effects]
+        for index in stunned:
+            ready[index] = False
+        
+        raw_damage = taken = hits = dodged = 0
+        messages = []
+        for index in group.casters:
+            if ready[index] and RNG.combat.random() < self.ENEMY_ABILITY_CHANCE:
+                enemy = group.enemies[index]
+                ability = ENEMY_POLICIES.get(enemy.type, DEFAULT_ENEMY_POLICY).decide(
+                    player, enemy, self.defense_bonus)
+                if ability is None:
+                    continue  # Политика предпочла обычную атаку: враг бьет в общем залпе
+                ready[index] = False
+                damage, message = enemy.use_special_ability(ability, player)
+                self._sync(index)
+                if message:
+                    messages.append(message)
+                if damage > 0:
+                    dealt, is_dodged = player.receive_hit(damage, self.defense_bonus)
+                    raw_damage += damage
+                    taken += dealt
+                    hits += 1
+                    dodged += is_dodged
+        
+        rolls = group.roll_attacks(ready, self.rng)
+        if len(rolls):
+            defense = player.defense_against(self.defense_bonus)
+            dodge_chance = player.dodge_chance()
+            player.degrade_armor(len(rolls))
+            
+            dodge_rolls = RNG.predraw("combat", len(rolls))
+            if np is not None:
+                is_hit = dodge_rolls >= dodge_chance
+                damage = np.floor(np.maximum(1, rolls - defense) / player.difficulty_mult)
+                volley_damage = int(damage[is_hit].sum())
+                raw_damage += int(rolls.sum())
+                dodged += len(rolls) - int(is_hit.sum())
+            else:
+                mult = player.difficulty_mult
+                volley_damage = 0
+                for roll, dodge_roll in zip(rolls, dodge_rolls):
+                    if dodge_roll < dodge_chance:
+                        dodged += 1
+                    else:
+                        volley_damage += int(max(1, roll - defense) / mult)
+                raw_damage += sum(rolls)
+            
+            player.health -= volley_damage
+            taken += volley_damage
+            hits += len(rolls)
+        
+        result.damage = raw_damage
+        result.dealt = taken
+        result.message = "\n".join(messages)
+        result.effects = {"attackers": len(acting) - len(stunned), "hits": hits,
+                          "dodged": dodged, "stunned": len(stunned)}
+        
+        self.defense_bonus = 0
+        self._end_turn(result, acting)
+        return result
+
+class BattleEstimator:
+    """Оценка исхода боя методом Монте-Карло: тысячи боев «только атака» одновременно
+    
+    Служит офлайн-балансировке (tools/balance_sweep.py), а не экрану выбора
+    противника: метки боя там дает TurnDistributionAnalyzer. Поэтому выборка
+    не урезается под время отклика, и 7 врагов по 10 тысяч боев с NumPy
+    считаются порядка 60-110 мс.
+    """
+    def __init__(self, fights: int = 10000, max_rounds: int = 200, seed: int = None,
+                 vectorized: bool = True):
+        self.fights = fights
+        self.max_rounds = max_rounds
+        self.seed = seed
+        # False - всегда последовательные бои resolve_plan: с зерном результат один
+        # и тот же, есть NumPy или нет
+        self.vectorized = vectorized
+        # Без NumPy, против врагов со своей политикой и с несколькими способностями
+        # бои считаются по одному, поэтому выборка меньше
+        self.fallback_fights = 300
+    
+    def estimate(self, player: Player, enemies: List[Enemy]) -> List[Dict[str, float]]:
+        """Шанс победы, среднее число раундов и потеря здоровья для каждого врага"""
+        if not enemies:
+            return []
+        
+        snapshots = [CombatEngine.snapshot(player, enemy) for enemy in enemies]
+        if np is None or not self.vectorized:
+            return [self._estimate_python(snapshot) for snapshot in snapshots]
+        
+        # Один векторный прогон на каждую скорость врага: у них общая очередность ходов.
+        # Враги со своей политикой решают по состоянию каждого боя, а в векторной модели
+        # у врага не больше одной способности - такие бои идут по одному
+        by_speed = {}
+        results = [None] * len(snapshots)
+        for index, snapshot in enumerate(snapshots):
+            if snapshot[14] is not None or len(snapshot[10]) > 1:
+                results[index] = self._estimate_python(snapshot)
+            else:
+                by_speed.setdefault(snapshot[12], []).append(index)
+        for indices in by_speed.values():
+            for index, result in zip(indices, self._estimate_numpy([snapshots[i] for i in indices])):
+                results[index] = result
+        return results
+    
+    def _estimate_python(self, snapshot: Tuple) -> Dict[str, float]:
+        """Последовательная оценка через CombatEngine.resolve_plan (без NumPy и для врагов с политикой)"""
+        rng = random.Random(self.seed) if self.seed is not None else RNG.analysis
+        start_health = snapshot[6]
+        plan = CombatEngine.plan(snapshot, self.max_rounds)
+        wins = rounds = hp_lost = 0
+        
+        for _ in range(self.fallback_fights):
+            won, fight_rounds, lost = CombatEngine.resolve_plan(plan, rng)
+            wins += won
+            rounds += fight_rounds
+            hp_lost += min(max(lost, 0), start_health)
+        
+        return {
+            "win_chance": wins / self.fallback_fights,
+            "rounds": rounds / self.fallback_fights,
+            "hp_lost": hp_lost / self.fallback_fights
+        }
+    
+    def _estimate_numpy(self, snapshots: List[Tuple]) -> List[Dict[str, float]]:
+        """Векторная оценка: все бои всех врагов идут в одном массиве состояния
+        
+        Скорость врага у всех снимков одна, поэтому ходы идут по общей развертке
+        TurnScheduler.timeline. Способность выбирается случайно, как в
+        DEFAULT_ENEMY_POLICY: врагов со своей политикой и с несколькими
+        способностями сюда не передают.
+        """
+        (base_damage, effect, dexterity, luck, defense, player_mult, start_health,
+         max_health, _, _, _, player_speed, enemy_speed, _, _) = snapshots[0]
+        
+        rng = np.random.default_rng(self.seed) if self.seed is not None else RNG.numpy("analysis")
+        count = len(snapshots)
+        total = count * self.fights
+        
+        crit_chance = base_crit_chance = (dexterity + luck) / 200
+        crit_mult = base_crit_mult = 1.5 + luck / 100
+        lucky_luck = luck + Item.CRITICAL_LUCK
+        lucky_left = 0  # critical_chance срабатывает на каждом ходу, поэтому счетчик общий для всех боев
+        miss_chance = max(0, 0.05 - (dexterity / 500))
+        dodge_chance = dexterity / 300
+        ability_chance = CombatEngine.ENEMY_ABILITY_CHANCE
+        poison_duration = Item.POISON_DURATION
+        effect_duration = Enemy.ABILITY_EFFECT_DURATION
+        shield_power = Enemy.SHIELD_POWER
+        acid_reduction = Enemy.ACID_ARMOR_REDUCTION
+        
+        # Вид единственной способности: 0 - нет, 1 - только урон, дальше - эффект состояния
+        ability_kinds = {None: 1, "shield": 2, "poison": 3, "armor_break": 4}
+        
+        # Строки состояния активных боев; завершенные бои отбрасываются после хода
+        state = np.zeros((16, total), dtype=np.int64)
+        state[0] = np.arange(total)
+        state[1] = np.repeat([s[8] for s in snapshots], self.fights)
+        state[2] = start_health
+        state[3] = np.repeat([max(1, s[9] - 2) for s in snapshots], self.fights)
+        state[4] = np.repeat([s[9] + 3 for s in snapshots], self.fights)
+        state[5] = np.repeat([ability_kinds[CombatEngine.ability_status(s[10][0][0])] if s[10] else 0
+                              for s in snapshots], self.fights)
+        state[6] = np.repeat([s[10][0][1] if s[10] else 0 for s in snapshots], self.fights)
+        state[7] = np.repeat([max(1, s[9] // 4) for s in snapshots], self.fights)
+        
+        won = np.zeros(total, dtype=bool)
+        rounds = np.full(total, self.max_rounds)
+        final_health = np.zeros(total, dtype=np.int64)
+        
+        round_number = 1
+        for actor in TurnScheduler.timeline((player_speed, enemy_speed), self.max_rounds):
+            size = state.shape[1]
+            if size == 0:
+                break
+            
+            (index, enemy_health, health, enemy_low, enemy_high, ability, ability_damage,
+             bite_poison, enemy_poison, enemy_poison_left, enemy_shield_left,
+             player_poison, player_poison_left, armor_break, armor_break_left, stunned) = state
+            
+            if actor == 0:
+                bonus = 0
+                if effect == "fire_damage":
+                    bonus = rng.integers(3, 9, size)
+                elif effect == "poison":
+                    np.maximum(enemy_poison, rng.integers(2, 6, size), out=enemy_poison)
+                    np.maximum(enemy_poison_left, poison_duration, out=enemy_poison_left)
+                elif effect == "armor_penetration":
+                    bonus = 5
+                elif effect == "critical_chance":
+                    lucky_left = Item.CRITICAL_LUCK_TURNS
+                    crit_chance = (dexterity + lucky_luck) / 200
+                    crit_mult = 1.5 + lucky_luck / 100
+                elif effect == "life_steal":
+                    np.minimum(max_health, health + rng.integers(3, 11, size), out=health)
+                elif effect == "stun_chance":
+                    stunned |= rng.random(size) < 0.2
+                
+                damage = np.asarray(base_damage + bonus, dtype=np.float64)
+                is_critical = rng.random(size) < crit_chance
+                is_hit = rng.random(size) >= miss_chance
+                rolled = rng.integers(np.floor(damage * 0.8).astype(np.int64),
+                                      np.floor(damage * 1.2).astype(np.int64) + 1, size)
+                damage = np.where(is_critical, np.floor(damage * crit_mult), rolled)
+                dealt = np.floor(damage * player_mult).astype(np.int64) * is_hit
+                dealt = np.where(enemy_shield_left > 0, np.maximum(0, dealt - shield_power), dealt)
+                enemy_health -= dealt
+                
+                finished = enemy_health <= 0
+                won[index[finished]] = True
+            
+            elif actor == 1:
+                acting = stunned == 0
+                uses_ability = acting & (ability > 0) & (rng.random(size) < ability_chance)
+                damage = np.where(uses_ability, ability_damage, rng.integers(enemy_low, enemy_high, size))
+                
+                shield = uses_ability & (ability == 2)
+                np.maximum(enemy_shield_left, effect_duration * shield, out=enemy_shield_left)
+                bite = uses_ability & (ability == 3)
+                np.maximum(player_poison, bite_poison * bite, out=player_poison)
+                np.maximum(player_poison_left, effect_duration * bite, out=player_poison_left)
+                acid = uses_ability & (ability == 4)
+                armor_break += acid_reduction * acid
+                np.maximum(armor_break_left, effect_duration * acid, out=armor_break_left)
+                
+                is_hit = acting & (damage > 0) & (rng.random(size) >= dodge_chance)
+                taken = np.floor(np.maximum(1, damage - defense + armor_break) / player_mult).astype(np.int64)
+                health -= taken * is_hit
+                
+                finished = health <= 0
+            
+            else:
+                # Конец раунда: тики эффектов, оглушение спадает
+                health -= player_poison * (player_poison_left > 0)
+                enemy_health -= enemy_poison * (enemy_poison_left > 0)
+                for power, left in ((player_poison, player_poison_left),
+                                    (armor_break, armor_break_left),
+                                    (enemy_poison, enemy_poison_left)):
+                    left -= left > 0
+                    power *= left > 0
+                enemy_shield_left -= enemy_shield_left > 0
+                stunned[:] = 0
+                if lucky_left:
+                    lucky_left -= 1
+                    if not lucky_left:
+                        crit_chance, crit_mult = base_crit_chance, base_crit_mult
+                
+                won[index[enemy_health <= 0]] = True
+                finished = (enemy_health <= 0) | (health <= 0)
+            
+            if finished.any():
+                rounds[index[finished]] = round_number
+                final_health[index[finished]] = health[finished]
+                state = state[:, ~finished]
+            if actor == TurnScheduler.ROUND_END:
+                round_number += 1
+        
+        final_health[state[0]] = state[2]
+        hp_lost = np.clip(start_health - final_health, 0, start_health)
+        
+        won = won.reshape(count, self.fights)
+        rounds = rounds.reshape(count, self.fights)
+        hp_lost = hp_lost.reshape(count, self.fights)
+        
+        return [
+            {
+                "win_chance": float(won[i].mean()),
+                "rounds": float(rounds[i].mean()),
+                "hp_lost": float(hp_lost[i].mean())
+            }
+            for i in range(count)
+        ]
+
+class TurnDistributionAnalyzer:
+    """Точные распределения числа ходов до победы и до гибели в бою «только атака»
+
+    Распределения урона одного удара строятся по формулам Player.roll_attack и
+    Player.receive_hit (крит, промах, разброс ±20%, уклонение, защита, сложность)
+    и сворачиваются удар за ударом; очередность ударов берется из TurnScheduler.timeline.
+    Точная модель годится только для независимых ударов. Эффект оружия с
+    состоянием (STATEFUL_EFFECTS), способность врага с эффектом состояния
+    (CombatEngine.ability_status) и враг со своей политикой (ENEMY_POLICIES)
+    делают удары зависимыми: такой бой оценивается SAMPLE_FIGHTS боями
+    CombatEngine.resolve_plan с постоянным зерном, а распределения ходов
+    остаются пустыми. Результаты кэшируются по параметрам боя и шаблону врага.
+
+    Свертка начинается со стороны, которой нужно меньше ударов, и вторая сторона
+    сворачивается только до раунда, в котором бой заведомо окончен. Без NumPy
+    точный расчет занимает до ~10 мс на бой, выборка - 5-20 мс; против врага с
+    политикой на холодном кэше политики - до ~0.2 с.
+    """
+    EPSILON = 1e-12  # Остаток вероятности, после которого свертка прекращается
+    CACHE_LIMIT = 4096
+    SAMPLE_FIGHTS = 500
+    SAMPLE_SEED = 0
+    # Эффекты оружия, которые меняют следующие ходы: яд, лечение, оглушение, удача
+    STATEFUL_EFFECTS = ("poison", "life_steal", "stun_chance", "critical_chance")
+
+    def __init__(self, max_rounds: int = 200):
+        self.max_rounds = max_rounds
+        self.cache = {}
+
+    def estimate(self, player: Player, enemies: List[Enemy]) -> List[Dict]:
+        """Как BattleEstimator.estimate, но точно и с распределениями ходов"""
+        return [self.analyze(player, enemy) for enemy in enemies]
+
+    def analyze(self, player: Player, enemy: Enemy) -> Dict:
+        """Шанс победы, ожидаемые раунды и потеря здоровья, распределения ходов"""
+        snapshot = CombatEngine.snapshot(player, enemy)
+        key = snapshot[:10] + snapshot[11:] + (enemy.template,)
+        result = self.cache.get(key)
+        if result is None:
+            if len(self.cache) >= self.CACHE_LIMIT:
+                del self.cache[next(iter(self.cache))]
+            result = self.cache[key] = self._analyze(snapshot)
+        return result
+
+    @classmethod
+    def is_exact(cls, snapshot: Tuple) -> bool:
+        """Удары боя независимы и точная модель к нему применима"""
+        return (snapshot[14] is None and snapshot[1] not in cls.STATEFUL_EFFECTS
+                and not any(CombatEngine.ability_status(ability) for ability, _ in snapshot[10]))
+
+    @staticmethod
+    def player_hit_pmf(snapshot: Tuple) -> List[float]:
+        """Вероятности урона одного удара игрока по индексу урона"""
+        base_damage, effect, dexterity, luck, _, player_mult = snapshot[:6]
+        crit_chance = (dexterity + luck) / 200
+        miss_chance = max(0, 0.05 - (dexterity / 500))
+
+        if effect == "fire_damage":
+            bonuses = [(bonus, 1 / 6) for bonus in range(3, 9)]
+        elif effect == "armor_penetration":
+            bonuses = [(5, 1.0)]
+        else:
+            bonuses = [(0, 1.0)]
+
+        pmf = {0: miss_chance}
+        for bonus, bonus_chance in bonuses:
+            damage = base_damage + bonus
+            hit_chance = bonus_chance * (1 - miss_chance)
+            crit = int(int(damage * (1.5 + luck / 100)) * player_mult)
+            pmf[crit] = pmf.get(crit, 0) + hit_chance * crit_chance
+            low, high = int(damage * 0.8), int(damage * 1.2)
+            roll_chance = hit_chance * (1 - crit_chance) / (high - low + 1)
+            for roll in range(low, high + 1):
+                value = int(roll * player_mult)
+                pmf[value] = pmf.get(value, 0) + roll_chance
+        return TurnDistributionAnalyzer._as_list(pmf)
+
+    @staticmethod
+    def enemy_hit_pmf(snapshot: Tuple) -> List[float]:
+        """Вероятности урона одного хода врага по игроку по индексу урона (способность - случайная)"""
+        dexterity, defense, player_mult = snapshot[2], snapshot[4], snapshot[5]
+        enemy_damage, abilities = snapshot[9], snapshot[10]
+        dodge_chance = dexterity / 300
+        ability_chance = CombatEngine.ENEMY_ABILITY_CHANCE if abilities else 0
+
+        raw = {}
+        for _, damage in abilities:
+            raw[damage] = raw.get(damage, 0) + ability_chance / len(abilities)
+        low, high = max(1, enemy_damage - 2), enemy_damage + 2
+        for roll in range(low, high + 1):
+            raw[roll] = raw.get(roll, 0) + (1 - ability_chance) / (high - low + 1)
+
+        pmf = {0: 0.0}
+        for damage, chance in raw.items():
+            if damage <= 0:
+                pmf[0] += chance
+                continue
+            pmf[0] += chance * dodge_chance
+            value = int(max(1, damage - defense) / player_mult)
+            pmf[value] = pmf.get(value, 0) + chance * (1 - dodge_chance)
+        return TurnDistributionAnalyzer._as_list(pmf)
+
+    @staticmethod
+    def _as_list(pmf: Dict[int, float]) -> List[float]:
+        values = [0.0] * (max(pmf) + 1)
+        for damage, chance in pmf.items():
+            values[damage] += chance
+        return values
+
+    def first_passage(self, health: int, pmf: List[float],
+                      limit: Optional[int] = None) -> Tuple[List[float], List[float]]:
+        """Свертка ударов до исчерпания здоровья
+
+        Возвращает P(здоровье кончается ровно на n-м ударе) для n = 1..N и сумму
+        здоровья выживших, взвешенную вероятностью, после n = 0..N-1 ударов.
+        N не больше limit ударов (по умолчанию max_rounds).
+        """
+        health = max(1, health)
+        limit = self.max_rounds if limit is None else min(limit, self.max_rounds)
+        finish, alive_health = [], []
+
+        if np is not None:
+            taken = np.zeros(health)
+            taken[0] = 1.0
+            pmf_array = np.asarray(pmf)
+            remaining = health - np.arange(health)
+            for _ in range(limit):
+                alive_health.append(float(taken @ remaining))
+                step = np.convolve(taken, pmf_array)
+                finish.append(float(step[health:].sum()))
+                taken = step[:health]
+                if taken.sum() < self.EPSILON:
+                    break
+            return finish, alive_health
+
+        # Вероятность добить следующим ударом при набранном уроне t: P(урон >= health - t)
+        tail = [0.0] * (health + 1)
+        tail[health] = sum(pmf[health:])
+        for damage in range(health - 1, -1, -1):
+            tail[damage] = tail[damage + 1] + (pmf[damage] if damage < len(pmf) else 0.0)
+        lethal = tail[:0:-1]
+        remaining = range(health, 0, -1)
+        hits = [(damage, chance) for damage, chance in enumerate(pmf) if chance and damage < health]
+        reach = max((damage for damage, _ in hits), default=0)
+
+        # Распределение набранного урона растет не быстрее самого сильного удара
+        taken = [1.0]
+        for _ in range(limit):
+            alive_health.append(sum(chance * left for chance, left in zip(taken, remaining)))
+            finish.append(sum(chance * kill for chance, kill in zip(taken, lethal)))
+            size = min(health, len(taken) + reach)
+            step = [0.0] * size
+            for damage, chance in hits:
+                end = min(size, damage + len(taken))
+                step[damage:end] = [value + chance * before
+                                    for value, before in zip(step[damage:end], taken)]
+            taken = step
+            if sum(taken) < self.EPSILON:
+                break
+        return finish, alive_health
+
+    @staticmethod
+    def _mean(pmf: List[float]) -> float:
+        return sum(damage * chance for damage, chance in enumerate(pmf))
+
+    @staticmethod
+    def _other_hits(timeline: Tuple[int, ...], actor: int, hits: int) -> int:
+        """Сколько ходов другой стороны нужно свернуть до конца раунда с hits-м ходом actor
+
+        На один больше, чем ходов до конца раунда: состояние после последнего из них тоже нужно.
+        """
+        done = 0
+        other = 1
+        for event in timeline:
+            if event == actor:
+                done += 1
+            elif event != TurnScheduler.ROUND_END:
+                other += 1
+            elif done >= hits:
+                return other
+        return other
+
+    def _sample(self, snapshot: Tuple) -> Dict:
+        """Оценка боя с зависимыми ударами выборкой боев"""
+        start_health = snapshot[6]
+        plan = CombatEngine.plan(snapshot, self.max_rounds)
+        rng = random.Random(self.SAMPLE_SEED)
+        wins = rounds = hp_lost = 0
+        for _ in range(self.SAMPLE_FIGHTS):
+            won, fight_rounds, lost = CombatEngine.resolve_plan(plan, rng)
+            wins += won
+            rounds += fight_rounds
+            hp_lost += min(max(lost, 0), start_health)
+        return {
+            "win_chance": wins / self.SAMPLE_FIGHTS,
+            "rounds": rounds / self.SAMPLE_FIGHTS,
+            "hp_lost": hp_lost / self.SAMPLE_FIGHTS,
+            "kill_turns": [],
+            "death_turns": []
+        }
+
+    def _analyze(self, snapshot: Tuple) -> Dict:
+        if not self.is_exact(snapshot):
+            return self._sample(snapshot)
+        start_health, enemy_health = snapshot[6], snapshot[8]
+        player_pmf, enemy_pmf = self.player_hit_pmf(snapshot), self.enemy_hit_pmf(snapshot)
+        timeline = TurnScheduler.timeline(snapshot[11:13], self.max_rounds)
+
+        # Сначала сворачивается сторона, которой нужно меньше ударов: после ее
+        # последнего удара бой окончен, и свертка другой стороны дальше не нужна
+        if enemy_health * self._mean(enemy_pmf) <= start_health * self._mean(player_pmf):
+            kill_turns, _ = self.first_passage(enemy_health, player_pmf)
+            limit = None if len(kill_turns) >= self.max_rounds else \
+                self._other_hits(timeline, 0, len(kill_turns))
+            death_turns, alive_health = self.first_passage(start_health, enemy_pmf, limit)
+        else:
+            death_turns, alive_health = self.first_passage(start_health, enemy_pmf)
+            limit = None if len(death_turns) >= self.max_rounds else \
+                self._other_hits(timeline, 1, len(death_turns))
+            kill_turns, _ = self.first_passage(enemy_health, player_pmf, limit)
+        
+        win_chance = hp_lost = 0.0
+        rounds = 1.0  # Сумма P(бой идет в начале раунда) по раундам
+        kill_left = death_left = 1.0  # P(враг жив), P(игрок жив) после сделанных ударов
+        hits = taken = 0  # Ударов игрока и врага к текущему ходу
+        round_number = 1
+        for actor in timeline:
+            if actor == 0:
+                kill = kill_turns[hits] if hits < len(kill_turns) else 0.0
+                hits += 1
+                # Враг падает на этом ударе, пока игрок пережил все taken ударов врага
+                win_chance += kill * death_left
+                if taken < len(alive_health):
+                    hp_lost += kill * (death_left * start_health - alive_health[taken])
+                kill_left -= kill
+            elif actor == 1:
+                death = death_turns[taken] if taken < len(death_turns) else 0.0
+                taken += 1
+                hp_lost += death * kill_left * start_health
+                death_left -= death
+            else:
+                round_number += 1
+                if (kill_left < self.EPSILON or death_left < self.EPSILON
+                        or round_number > self.max_rounds):
+                    break
+                rounds += kill_left * death_left
+
+        return {
+            "win_chance": win_chance,
+            "rounds": rounds,
+            "hp_lost": hp_lost,
+            "kill_turns": kill_turns,
+            "death_turns": death_turns
+        }
+
+class CombatEvent:
+    """Структурированное событие журнала боя"""
+    __slots__ = ("seq", "time", "battle", "round", "actor", "action", "enemy",
+                 "damage", "dealt", "flags", "rolls", "data")
+    
+    def __init__(self, seq: int, battle: int, round_number: int, actor: str, action: str,
+                 enemy: str = "", damage: int = 0, dealt: int = 0, flags: Tuple[str, ...] = (),
+                 rolls: Dict = None, data: Dict = None):
+        self.seq = seq
+        self.time = time.time()
+        self.battle = battle
+        self.round = round_number
+        self.actor = actor  # "player", "enemy" или "game"
+        self.action = action
+        self.enemy = enemy  # Враг, участвующий в событии
+        self.damage = damage
+        self.dealt = dealt
+        self.flags = flags  # "critical", "miss", "dodged", "failed", "enemy_dead", "player_dead"
+        self.rolls = rolls  # Случайные броски, решившие исход хода
+        self.data = data  # Эффекты, награды и прочие подробности
+    
+    def to_dict(self) -> Dict:
+        """Сериализация события"""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+class CombatLog:
+    """Кольцевой буфер событий боя: память ограничена capacity событиями"""
+    FLAGS = (("critical", "is_critical"), ("miss", "is_miss"), ("dodged", "is_dodged"),
+             ("enemy_dead", "enemy_dead"), ("player_dead", "player_dead"))
+    
+    def __init__(self, capacity: int = 2000):
+        self.events = deque(maxlen=capacity)
+        self.listeners: List[Callable[[CombatEvent], None]] = []
+        self.battle = 0  # Номер текущего боя за сессию
+        self.seq = 0
+    
+    def __len__(self) -> int:
+        return len(self.events)
+    
+    def subscribe(self, listener: Callable[[CombatEvent], None]):
+        """Подписка на новые события (например, экспортер)"""
+        self.listeners.append(listener)
+    
+    def unsubscribe(self, listener: Callable[[CombatEvent], None]):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+    
+    def record(self, actor: str, action: str, round_number: int = 0, **fields) -> CombatEvent:
+        """Запись события в буфер и рассылка подписчикам"""
+        self.seq += 1
+        event = CombatEvent(self.seq, self.battle, round_number, actor, action, **fields)
+        self.events.append(event)
+        for listener in self.listeners:
+            listener(event)
+        return event
+    
+    def begin_battle(self, enemies: List[Enemy], mode: str = "battle"):
+        """Начало нового боя"""
+        self.battle += 1
+        self.record("game", "battle_start", enemy=", ".join(enemy.name for enemy in enemies),
+                    data={"mode": mode, "enemies": len(enemies)})
+    
+    def end_battle(self, outcome: Optional[str], round_number: int):
+        """Итог боя: "victory", "defeat", "fled" или None для прерванного"""
+        self.record("game", "battle_end", round_number, data={"outcome": outcome})
+    
+    def record_turn(self, result: TurnResult, enemy: str = ""):
+        """Запись хода из CombatEngine"""
+        action = result.action.name.lower() if isinstance(result.action, BattleAction) else result.action
+        flags = tuple(name for name, attr in self.FLAGS if getattr(result, attr))
+        if not result.success:
+            flags += ("failed",)
+        
+        data = dict(result.effects) if result.effects else None
+        if result.ability:
+            data = data or {}
+            data["ability"] = result.ability
+        
+        self.record(result.actor, action, result.round, enemy=enemy, damage=result.damage,
+                    dealt=result.dealt, flags=flags, rolls=result.rolls, data=data)
+    
+    def record_reward(self, enemy: Enemy, rewards: Dict):
+        """Награда за побежденного врага"""
+        self.record("game", "victory", enemy=enemy.name,
+                    data={"xp": rewards["xp"], "gold": rewards["gold"],
+                          "loot": [loot.name for loot in rewards["loot"]]})
+    
+    def last_rounds(self, count: int) -> List[CombatEvent]:
+        """События последних count раундов (по всем боям), в хронологическом порядке"""
+        rounds = set()
+        selected = []
+        for event in reversed(self.events):
+            key = (event.battle, event.round)
+            if key not in rounds:
+                if len(rounds) == count:
+                    break
+                rounds.add(key)
+            selected.append(event)
+        selected.reverse()
+        return selected
+
+class JsonlExporter:
+    """Потоковая выгрузка журнала боя в JSONL из фонового потока
+    
+    Игровой цикл только кладет событие в ограниченную очередь; при ее
+    переполнении событие отбрасывается и учитывается в dropped.
+    """
+    def __init__(self, path: str, max_pending: int = 10000):
+        self.path = path
+        self.dropped = 0
+        self.written = 0
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.thread = threading.Thread(target=self._write_loop, name="combat-log-export", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+    
+    def __call__(self, event: CombatEvent):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+    
+    def _write_loop(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                event = self.queue.get()
+                if event is None:
+                    break
+                f.write(json.dumps(event.to_dict(), ensure_ascii=False) + "\n")
+                self.written += 1
+                if self.queue.empty():
+                    f.flush()
+    
+    def close(self):
+        """Дописать очередь и остановить поток"""
+        atexit.unregister(self.close)  # Иначе закрытый выгрузчик и его поток живут до выхода
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join(timeout=5)
+
+class BattleReplay:
+    """Компактная запись боя один на один для воспроизведения без ввода-вывода
+    
+    Хранит состояние участников на начало боя простыми данными (а не объектами),
+    зерно боевого потока, действия игрока и здоровье обоих после каждого хода.
+    Боевой поток пересевается в начале записи, поэтому бой повторяется точно.
+    """
+    __slots__ = ("seed", "player", "enemy", "actions", "trace", "outcome", "rounds")
+    VERSION = 1
+    
+    def __init__(self, seed: int, player: Dict, enemy: Dict):
+        self.seed = seed
+        self.player = player
+        self.enemy = enemy
+        self.actions = []  # [действие, индекс предмета или умение]
+        self.trace = []  # Здоровье игрока и врага после каждого хода подряд
+        self.outcome = None
+        self.rounds = 0
+    
+    @classmethod
+    def begin(cls, player: Player, enemy: Enemy) -> "BattleReplay":
+        """Начать запись: снимок участников и пересев боевого потока"""
+        seed = RNG.combat.getrandbits(64)
+        RNG.combat.seed(seed)
+        return cls(seed, cls.capture_player(player), cls.capture_enemy(enemy))
+    
+    def add_action(self, player: Player, action: BattleAction, item: Item = None, skill: str = None):
+        """Действие игрока; предмет запоминается индексом в инвентаре"""
+        if action == BattleAction.ITEM:
+            argument = player.inventory.index(item) if item in player.inventory else None
+        elif action == BattleAction.SKILL:
+            argument = skill
         else:
-            damage = random.randint(int(damage * 0.8), int(damage * 1.2))
-        
-        damage = int(damage * self.difficulty_mult)
-        
-        if special_message:
-            message += f" {special_message}"
-        
-        return damage, message
+            argument = None
+        self.actions.append([action.name, argument])
     
-    def take_damage(self, damage: int) -> bool:
-        """Получение урона"""
-        defense = self.stats["constitution"] // 3
-        
-        for slot in ["armor", "helmet", "gloves", "boots"]:
-            if self.equipped[slot]:
-                defense += self.equipped[slot].defense
-                self.equipped[slot].degrade()
-        
-        dodge_chance = self.stats["dexterity"] / 300
-        is_dodged = random.random() < dodge_chance
-        
-        if is_dodged:
-            return False
-        
-        actual_damage = max(1, damage - defense)
-        actual_damage = int(actual_damage / self.difficulty_mult)
-        
-        self.health -= actual_damage
-        
-        return self.health <= 0
+    def add_turn(self, player_health: int, enemy_health: int):
+        self.trace.append(player_health)
+        self.trace.append(enemy_health)
     
-    def heal(self, amount: int):
-        """Лечение игрока"""
-        self.health = min(self.max_health, self.health + amount)
+    def finish(self, engine: CombatEngine):
+        self.outcome = engine.outcome
+        self.rounds = engine.round
     
-    def restore_mana(self, amount: int):
-        """Восстановление маны"""
-        self.mana = min(self.max_mana, self.mana + amount)
+    @staticmethod
+    def capture_item(item: Item) -> Dict:
+        return {
+            "name": item.name,
+            "item_type": item.item_type.value,
+            "damage": item.damage,
+            "defense": item.defense,
+            "health": item.health,
+            "mana": item.mana,
+            "durability": item.durability,
+            "max_durability": item.max_durability,
+            "armor_slot": item.armor_slot,
+            "special_effect": item.special_effect
+        }
     
-    def gain_xp(self, amount: int) -> bool:
-        """Получение опыта"""
-        actual_amount = int(amount * self.difficulty_mult)
-        self.xp += actual_amount
-        
-        self.check_achievement("level_up", 0)
-        
-        if self.xp >= self.xp_to_next_level:
-            self.level_up()
-            return True
-        return False
+    @staticmethod
+    def restore_item(data: Dict) -> Item:
+        item = Item(data["name"], ItemType(data["item_type"]), damage=data["damage"],
+                    defense=data["defense"], health=data["health"], mana=data["mana"],
+                    durability=data["durability"], armor_slot=data["armor_slot"],
+                    special_effect=data["special_effect"])
+        item.max_durability = data["max_durability"]
+        return item
     
-    def level_up(self):
-        """Повышение уровня"""
-        self.level += 1
-        self.xp -= self.xp_to_next_level
-        self.xp_to_next_level = int(self.xp_to_next_level * 1.4)
-        
-        self.stats["strength"] += 2
-        self.stats["dexterity"] += 2
-        self.stats["intelligence"] += 2
-        self.stats["constitution"] += 2
-        self.stats["luck"] += 1
-        
-        class_bonus_stats = {
-            CharacterClass.WARRIOR: {"strength": 3, "constitution": 2},
-            CharacterClass.MAGE: {"intelligence": 3},
-            CharacterClass.ARCHER: {"dexterity": 3, "strength": 1},
-            CharacterClass.ROGUE: {"dexterity": 2, "luck": 2}
+    @classmethod
+    def capture_player(cls, player: Player) -> Dict:
+        return {
+            "name": player.name,
+            "difficulty": player.difficulty.value,
+            "character_class": player.character_class.value if player.character_class else None,
+            "level": player.level,
+            "xp": player.xp,
+            "xp_to_next_level": player.xp_to_next_level,
+            "health": player.health,
+            "max_health": player.max_health,
+            "mana": player.mana,
+            "max_mana": player.max_mana,
+            "stats": dict(player.stats),
+            "modifiers": player.modifiers.to_list(),
+            "inventory": [cls.capture_item(item) for item in player.inventory],
+            "equipped": {slot: cls.capture_item(item) for slot, item in player.equipped.items() if item}
         }
-        
-        bonuses = class_bonus_stats.get(self.character_class, {})
-        for stat, value in bonuses.items():
-            if stat == "max_mana":
-                self.max_mana += value
+    
+    @classmethod
+    def restore_player(cls, data: Dict) -> Player:
+        player = Player(data["name"], Difficulty(data["difficulty"]))
+        if data["character_class"]:
+            player.character_class = CharacterClass(data["character_class"])
+        for field in ("level", "xp", "xp_to_next_level", "health", "max_health", "mana", "max_mana"):
+            setattr(player, field, data[field])
+        player.set_stats(dict(data["stats"]), data.get("modifiers"))
+        player.inventory = [cls.restore_item(item) for item in data["inventory"]]
+        for slot, item in data["equipped"].items():
+            player.set_equipped(slot, cls.restore_item(item))
+        return player
+    
+    @staticmethod
+    def capture_enemy(enemy: Enemy) -> Dict:
+        return {
+            "type": enemy.type.name,
+            "level": enemy.level,
+            "difficulty": enemy.difficulty.value,
+            "health": enemy.health,
+            "max_health": enemy.max_health,
+            "damage": enemy.damage,
+            "defense": enemy.defense
+        }
+    
+    @staticmethod
+    def restore_enemy(data: Dict) -> Enemy:
+        enemy = Enemy(EnemyType[data["type"]], data["level"], Difficulty(data["difficulty"]))
+        for field in ("health", "max_health", "damage", "defense"):
+            setattr(enemy, field, data[field])
+        return enemy
+    
+    def replay(self) -> CombatEngine:
+        """Повторить бой текущим кодом; возвращает движок с записанным заново ходом боя
+        
+        Боевой поток пересевается зерном записи: вызывающий сохраняет состояние RNG сам.
+        """
+        player = self.restore_player(self.player)
+        enemy = self.restore_enemy(self.enemy)
+        engine = CombatEngine(player, enemy)
+        engine.replay = BattleReplay(self.seed, self.player, self.enemy)
+        RNG.combat.seed(self.seed)
+        
+        actions = iter(self.actions)
+        while not engine.is_over:
+            if engine.player_turn:
+                recorded = next(actions, None)
+                if recorded is None:  # Запись оборвалась вместе с боем
+                    break
+                name, argument = recorded
+                action = BattleAction[name]
+                if action == BattleAction.ITEM:
+                    item = player.inventory[argument] if argument is not None else None
+                    engine.player_action(action, item=item)
+                elif action == BattleAction.SKILL:
+                    engine.player_action(action, skill=argument)
+                else:
+                    engine.player_action(action)
             else:
-                self.stats[stat] += value
-        
-        self.update_derived_stats()
-        self.health = self.max_health
-        self.mana = self.max_mana
-        
-        print(f"{Color.YELLOW}Поздравляем! Вы достигли {self.level} уровня!{Color.END}")
-        print(f"Здоровье: {self.health}/{self.max_health}")
-        print(f"Мана: {self.mana}/{self.max_mana}")
+                engine.enemy_action()
         
-        for achievement in self.achievements:
-            if achievement.condition == "level_up":
-                achievement.update()
+        engine.replay.finish(engine)
+        return engine
     
-    def add_item(self, item: Item):
-        """Добавление предмета в инвентарь"""
-        if len(self.inventory) < 40:
-            self.inventory.append(item)
-            self.check_achievement("collect_item", 1)
-        else:
-            print(f"{Color.RED}Инвентарь полон!{Color.END}")
+    def to_dict(self) -> Dict:
+        return {"version": self.VERSION, "seed": self.seed, "player": self.player, "enemy": self.enemy,
+                "actions": self.actions, "trace": self.trace, "outcome": self.outcome, "rounds": self.rounds}
     
-    def remove_item(self, item: Item) -> bool:
-        """Удаление предмета из инвентаря"""
-        if item in self.inventory:
-            self.inventory.remove(item)
-            return True
-        return False
+    @classmethod
+    def from_dict(cls, data: Dict) -> "BattleReplay":
+        replay = cls(data["seed"], data["player"], data["enemy"])
+        replay.actions = data["actions"]
+        replay.trace = data["trace"]
+        replay.outcome = data["outcome"]
+        replay.rounds = data["rounds"]
+        return replay
+
+class ReplayVerifier:
+    """Прогон записей боев текущим кодом и поиск расхождений с записанным ходом боя"""
     
-    def equip_item(self, item: Item) -> bool:
-        """Экипировка предмета"""
-        if item not in self.inventory:
-            return False
-        
-        if not item.is_equippable(self.level):
-            print(f"{Color.RED}Ваш уровень слишком низок для этого предмета!{Color.END}")
-            return False
-        
-        slot_map = {
-            ItemType.WEAPON: "weapon",
-            ItemType.ARMOR: "armor",
-            ItemType.HELMET: "helmet",
-            ItemType.GLOVES: "gloves",
-            ItemType.BOOTS: "boots",
-            ItemType.RING: "ring",
-            ItemType.AMULET: "amulet"
-        }
-        
-        slot = slot_map.get(item.item_type)
-        
-        if item.item_type == ItemType.ARMOR and item.armor_slot:
-            slot = item.armor_slot
-        
-        if not slot:
-            return False
-        
-        if self.equipped[slot]:
-            self.inventory.append(self.equipped[slot])
-        
-        self.equipped[slot] = item
-        self.inventory.remove(item)
-        
-        return True
+    @staticmethod
+    def load(path: str) -> List[BattleReplay]:
+        """Записи из JSONL-файла, по одной на строку"""
+        with open(path, "r", encoding="utf-8") as f:
+            return [BattleReplay.from_dict(json.loads(line)) for line in f if line.strip()]
     
-    def unequip_item(self, slot: str) -> bool:
-        """Снятие предмета"""
-        if self.equipped[slot]:
-            self.inventory.append(self.equipped[slot])
-            self.equipped[slot] = None
-            return True
-        return False
+    @staticmethod
+    def save(path: str, replays: List[BattleReplay]):
+        """Дописать записи в JSONL-файл"""
+        with open(path, "a", encoding="utf-8") as f:
+            for replay in replays:
+                f.write(json.dumps(replay.to_dict(), ensure_ascii=False) + "\n")
     
-    def get_stat_bonus(self, stat: str) -> int:
-        """Получение бонуса от статов"""
-        return self.stats[stat] // 10
+    @staticmethod
+    def compare(expected: BattleReplay, actual: BattleReplay) -> Optional[Dict]:
+        """Первое расхождение двух записей или None"""
+        for turn in range(min(len(expected.trace), len(actual.trace)) // 2):
+            pair = slice(turn * 2, turn * 2 + 2)
+            if expected.trace[pair] != actual.trace[pair]:
+                return {"turn": turn + 1, "expected": expected.trace[pair], "actual": actual.trace[pair]}
+        if len(expected.trace) != len(actual.trace) or expected.outcome != actual.outcome:
+            return {"turn": min(len(expected.trace), len(actual.trace)) // 2 + 1,
+                    "expected": expected.outcome, "actual": actual.outcome}
+        return None
     
-    def check_achievement(self, condition: str, value: int = 1):
-        """Проверка и обновление достижений"""
-        for achievement in self.achievements:
-            if achievement.condition == condition and not achievement.completed:
-                if achievement.update(value):
-                    print(f"{Color.YELLOW}ДОСТИЖЕНИЕ РАЗБЛОКИРОВАНО: {achievement.name}{Color.END}")
-                    print(f"{achievement.description}")
-                    print(f"Награда: {achievement.reward_xp} опыта, {achievement.reward_gold} золота")
-                    
-                    self.xp += achievement.reward_xp
-                    self.gold += achievement.reward_gold
-                    
-                    if self.xp >= self.xp_to_next_level:
-                        self.level_up()
+    def verify(self, replays: List[BattleReplay]) -> Dict:
+        """Повторить все записи; состояние RNG игры после проверки не меняется"""
+        start_time = time.perf_counter()
+        state = RNG.getstate()
+        divergences = []
+        try:
+            for index, replay in enumerate(replays):
+                try:
+                    difference = self.compare(replay, replay.replay().replay)
+                except Exception as e:  # Код больше не может повторить запись - тоже расхождение
+                    difference = {"turn": None, "expected": replay.outcome, "actual": repr(e)}
+                if difference:
+                    difference["replay"] = index
+                    divergences.append(difference)
+        finally:
+            RNG.setstate(state)
+        return {"replays": len(replays), "divergences": divergences,
+                "seconds": time.perf_counter() - start_time}
 
 class Game:
     """Основной класс игры с улучшениями"""
-    def __init__(self):
+    GROUP_DISPLAY_LIMIT = 10  # Сколько врагов группы показывать на экране боя
+    AUTO_BATTLE_MAX_ROUNDS = 200  # Затянувшийся автобой прерывается как побег
+    COMBAT_LOG_ROUNDS = 10  # Сколько последних раундов показывает журнал боя
+    COMBAT_LOG_EXPORT_PATH = "combat_log.jsonl"
+    REPLAY_LIMIT = 100  # Сколько последних записей боев хранится в памяти
+    REPLAY_EXPORT_PATH = "replays.jsonl"
+    WORLD_LOAD_RADIUS = 1  # Чанки сгенерированного мира на таком расстоянии от игрока всегда загружены
+    WORLD_UNLOAD_RADIUS = 2  # Дальше чанки выгружаются; их состояние остается в записях WorldState
+    # Игровые часы, минуты
+    TRAVEL_MINUTES = 60
+    EXPLORE_MINUTES = 30
+    REST_MINUTES = 480
+    RESPAWN_MINUTES = 360  # Очищенная локация заселяется снова
+    SHOP_RESTOCK_MINUTES = 1440  # Завоз в магазин после первой покупки
+    SHOP_STOCK = 3  # Штук каждого предмета между завозами
+    GIRL_REST_MINUTES = 120  # Между восстановлениями сил девушки борделя
+    
+    def __init__(self, seed: Optional[int] = None, world_size: int = 0):
+        if seed is not None:
+            RNG.reseed(seed)  # До построения мира, чтобы он тоже был воспроизводим
         self.player = None
         self.is_running = True
         self.game_world = {}
+        self.world_graph = None  # WorldGraph, компилируется в initialize_world
+        self.world_generator = None  # WorldGenerator, если мир сгенерирован
+        self.world_chunks = {}  # Загруженный чанк сгенерированного мира -> имена его локаций
+        self.world_state = WorldState(self.world_chunk_key, keep_seeds=True)  # Измененные локации для сохранения
+        self.populations = PopulationTracker()  # Локации с загруженными врагами
+        self.timers = TimerWheel()  # Игровые часы: возрождения, завозы, отдых, сроки квестов
+        self.notices = []  # Сообщения сработавших таймеров для экрана локации
         self.quests_db = {}
         self.items_db = {}
         self.current_battle = None
         self.game_start_time = None
         self.difficulty = Difficulty.NORMAL
         self.version = "2.0.3"  # Обновили версию
+        self.battle_analyzer = TurnDistributionAnalyzer()
+        self.combat_log = CombatLog()
+        self.combat_log_exporter = None
+        self.replays = deque(maxlen=self.REPLAY_LIMIT)
         
         self.bordello_girls = []
         self.initialize_bordello()
         
-        self.initialize_world()
+        if world_size:
+            self.generate_world(RNG.world.getrandbits(64), world_size)
+        else:
+            self.initialize_world()
         self.initialize_items()
         self.initialize_quests()
     
     def initialize_bordello(self):
-        """Инициализация борделя"""
-        girls = [
-            BordelloGirl("Лилиана", "Массаж", 50, "Искусная массажистка, снимает усталость и напряжение"),
-            BordelloGirl("Кларисса", "Танды", 30, "Страстная танцовщица, поднимает боевой дух"),
-            BordelloGirl("Изольда", "Беседа", 20, "Умная собеседница, может дать полезные советы"),
-            BordelloGirl("Маргарита", "Особое внимание", 100, "Опытная куртизанка, оказывает полный спектр услуг"),
-            BordelloGirl("Бьянка", "Массаж", 40, "Молодая, но талантливая массажистка"),
-            BordelloGirl("Эльвира", "Танды", 25, "Гибкая и грациозная танцовщица")
-        ]
-        
-        self.bordello_girls = girls
+        """Инициализация борделя из data/bordello.json"""
+        self.bordello_girls = [BordelloGirl(girl["name"], girl["specialty"], girl["price"], girl["description"])
+                               for girl in CONTENT.bordello]
     
     def initialize_world(self):
-        """Инициализация игрового мира с улучшениями"""
+        """Инициализация игрового мира из data/world.json"""
         locations = [
-            Location("Стартовая деревня", LocationType.TOWN, (1, 3),
-                    "Тихая деревня, где начинаются многие приключения.",
-                    ["Темный лес", "Гоблинские пещеры", "Таинственное болото"],
-                    has_shop=True, has_tavern=True, has_bordello=True),
-            
-            Location("Темный лес", LocationType.FOREST, (1, 5),
-                    "Густой лес, полный опасных существ.",
-                    ["Стартовая деревня", "Забытые руины", "Лесная глушь"],
-                    special_event_chance=0.2),
-            
-            Location("Гоблинские пещеры", LocationType.CAVE, (2, 6),
-                    "Лабиринт пещер, кишащий гоблинами.",
-                    ["Стартовая деревня", "Орочьи горы", "Подземные туннели"],
-                    special_event_chance=0.15),
-            
-            Location("Забытые руины", LocationType.RUINS, (4, 8),
-                    "Древние руины, хранящие множество тайн.",
-                    ["Темный лес", "Драконье логово", "Древний храм"],
-                    special_event_chance=0.25),
-            
-            Location("Орочьи горы", LocationType.MOUNTAIN, (6, 10),
-                    "Высокие горы, где обосновались орки.",
-                    ["Гоблинские пещеры", "Долина троллей", "Горная вершина"]),
-            
-            Location("Долина троллей", LocationType.DUNGEON, (8, 12),
-                    "Глубокое ущелье, дом могущественных троллей.",
-                    ["Орочьи горы", "Логово дракона", "Подземная река"]),
-            
-            Location("Логово дракона", LocationType.DUNGEON, (15, 20),
-                    "Пылающая пещера, где обитает древний дракон.",
-                    ["Долина троллей", "Вулканические земли"]),
-            
-            Location("Таинственное болото", LocationType.SWAMP, (3, 7),
-                    "Топи, полные странных существ и ядовитых растений.",
-                    ["Стартовая деревня", "Заброшенная хижина"]),
-            
-            Location("Лесная глушь", LocationType.FOREST, (5, 9),
-                    "Самые глубины леса, куда редко ступает нога человека.",
-                    ["Темный лес"]),
-            
-            Location("Заброшенная хижина", LocationType.RUINS, (7, 11),
-                    "Старая хижина, от которой веет зловещей магией.",
-                    ["Таинственное болото"]),
-            
-            Location("Роскошный бордель", LocationType.BORDELLO, (1, 100),
-                    "Заведение с красивыми девушками и приятной атмосферой.",
-                    ["Стартовая деревня"], has_bordello=True)
+            Location(entry["name"], LocationType[entry["type"]], tuple(entry["levels"]), entry["description"],
+                     list(entry["connections"]), has_shop=entry["has_shop"], has_tavern=entry["has_tavern"],
+                     has_bordello=entry["has_bordello"], special_event_chance=entry["special_event_chance"])
+            for entry in CONTENT.world
         ]
         
         for loc in locations:
+            loc.tracker = self.populations
+            loc.state = self.world_state
             self.game_world[loc.name] = loc
         
-        self.game_world["Стартовая деревня"].discovered = True
+        self.world_graph = WorldGraph(self.game_world)
+        self.world_graph.discover("Стартовая деревня")
+    
+    def generate_world(self, seed: int, size: int):
+        """Процедурный мир size × size из зерна; строятся только чанки рядом с игроком"""
+        self.world_generator = WorldGenerator(seed, size)
+        self.world_chunks = {}
+        self.world_state = WorldState(self.world_chunk_key)
+        self.game_world = {}
+        self.populations = PopulationTracker()
+        self.world_graph = WorldGraph({}, partial=True)
+        self.load_world_around(WorldGenerator.START)
+        self.world_graph.discover(WorldGenerator.START)
+    
+    def advance_clock(self, minutes: int):
+        """Игровое время идет: срабатывают наступившие таймеры"""
+        self.timers.advance(minutes)
+    
+    def format_clock(self) -> str:
+        day, minute = divmod(self.timers.now, 24 * 60)
+        return f"день {day + 1}, {minute // 60:02d}:{minute % 60:02d}"
+    
+    def schedule_respawn(self, location: Location, deadline: int = 0):
+        """Враги вернутся в очищенную локацию через RESPAWN_MINUTES (или в минуту deadline)"""
+        location.respawn_timer = deadline or self.timers.now + self.RESPAWN_MINUTES
+        location.mark_changed()
+        self.timers.schedule_at(location.respawn_timer, self.respawn_location, location)
+    
+    def respawn_location(self, location: Location):
+        if self.game_world.get(location.name) is not location:
+            return  # Чанк выгружен: после загрузки таймер заведен заново по записи
+        location.respawn()
+        if self.player and self.player.location == location.name:
+            self.notices.append(f"В локации {location.name} появились новые враги.")
+    
+    def schedule_restock(self, location: Location, deadline: int = 0):
+        """Магазин завезет товар через SHOP_RESTOCK_MINUTES (или в минуту deadline)"""
+        location.restock_timer = deadline or self.timers.now + self.SHOP_RESTOCK_MINUTES
+        location.mark_changed()
+        self.timers.schedule_at(location.restock_timer, self.restock_shop, location)
+    
+    def restock_shop(self, location: Location):
+        if self.game_world.get(location.name) is not location:
+            return
+        location.shop_sold.clear()
+        location.restock_timer = 0
+        location.mark_changed()
+    
+    def schedule_girl_rest(self, girl: BordelloGirl):
+        if not girl.recovering:
+            girl.recovering = True
+            self.timers.schedule(self.GIRL_REST_MINUTES, self.recover_girl, girl)
+    
+    def recover_girl(self, girl: BordelloGirl):
+        girl.recovering = False
+        girl.rest()
+        if girl.stamina < 100:
+            self.schedule_girl_rest(girl)
+    
+    def schedule_quest_deadline(self, quest: Quest):
+        if quest.deadline:
+            self.timers.schedule_at(quest.deadline, self.expire_quest, quest)
+    
+    def expire_quest(self, quest: Quest):
+        if quest.check_time_limit(self.timers.now):
+            self.notices.append(f"Время на квест '{quest.name}' истекло.")
+    
+    def restore_timers(self, now: int):
+        """Новые игровые часы после загрузки: таймеры заводятся заново из состояния
+        
+        Обходятся только загруженные локации - для сгенерированного мира это
+        области, где игрок что-то менял.
+        """
+        self.timers = TimerWheel(now)
+        self.player.set_clock(self.timers)
+        for location in self.game_world.values():
+            if location.respawn_timer or location.cleared:
+                self.schedule_respawn(location, location.respawn_timer)
+            if location.shop_sold:
+                self.schedule_restock(location, location.restock_timer)
+        for girl in self.bordello_girls:
+            girl.recovering = False
+            if girl.stamina < 100:
+                self.schedule_girl_rest(girl)
+        for quest in self.player.quests:
+            if quest.status == QuestStatus.IN_PROGRESS:
+                self.schedule_quest_deadline(quest)
+    
+    def world_chunk_key(self, name: str) -> str:
+        """Имя файла чанка, в котором сохраняется состояние локации"""
+        if self.world_generator is None:
+            return "world"  # Мир по умолчанию мал и пишется одним чанком
+        cx, cy = self.world_generator.chunk_of(name)
+        return f"{cx}_{cy}"
+    
+    @staticmethod
+    def world_save_dir(slot: int) -> str:
+        return os.path.join("saves", f"save_{slot}_world")
+    
+    def load_world_chunk(self, chunk: Tuple[int, int]):
+        """Чанк строится генератором, и локации получают свои записи из world_state"""
+        if chunk in self.world_chunks:
+            return
+        locations = self.world_generator.chunk(*chunk)
+        for location in locations:
+            location.tracker = self.populations
+            location.state = self.world_state
+            record = self.world_state.lookup(location.name)
+            if record:
+                location.discovered = record.get("discovered", False)
+                location.restore(record)
+                if location.respawn_timer or location.cleared:
+                    self.schedule_respawn(location, location.respawn_timer)
+                if location.shop_sold:
+                    self.schedule_restock(location, location.restock_timer)
+            self.game_world[location.name] = location
+        self.world_graph.add_locations(locations)
+        self.world_chunks[chunk] = [location.name for location in locations]
+    
+    def unload_world_chunk(self, chunk: Tuple[int, int]):
+        names = self.world_chunks.pop(chunk)
+        self.world_graph.remove_locations(names)
+        for name in names:
+            location = self.game_world.pop(name)
+            self.world_state.unload(location)
+            location.state = None  # Таймеры выгруженной локации больше ничего не отмечают
+            self.populations.forget(location)
+    
+    def load_world_around(self, name: str):
+        """Сгенерированный мир: чанки вокруг локации загружены, далекие нетронутые выгружены
+        
+        Выгружается только чанк, все локации которого описываются записями
+        WorldState: позже он построится заново и получит их обратно.
+        """
+        generator = self.world_generator
+        if generator is None:
+            return
+        center = generator.chunk_of(name)
+        for chunk in generator.chunks_around(center, self.WORLD_LOAD_RADIUS):
+            self.load_world_chunk(chunk)
+        
+        far = [chunk for chunk in self.world_chunks
+               if max(abs(chunk[0] - center[0]), abs(chunk[1] - center[1])) > self.WORLD_UNLOAD_RADIUS]
+        for chunk in far:
+            if all(self.game_world[loc_name].is_restorable() for loc_name in self.world_chunks[chunk]):
+                self.unload_world_chunk(chunk)
     
     def initialize_items(self):
-        """Инициализация предметов - ДОБАВЛЕНЫ СПЕЦИАЛЬНЫЕ ЭФФЕКТЫ ДЛЯ ОРУЖИЯ"""
-        # Оружие для всех классов с специальными эффектами
-        weapons = [
-            # Оружие для Воина
-            Item("Деревянный меч", ItemType.WEAPON, value=10, damage=3, 
-                description="Простой деревянный меч", durability=50, required_level=1,
-                character_classes=[CharacterClass.WARRIOR]),
-            
-            Item("Стальной меч", ItemType.WEAPON, value=50, damage=8, 
-                description="Надежный стальной меч", durability=100, required_level=3,
-                character_classes=[CharacterClass.WARRIOR]),
-            
-            Item("Драконий клинок", ItemType.WEAPON, value=500, damage=25, 
-                description="Меч, выкованный из когтя дракона", durability=150, required_level=15,
-                character_classes=[CharacterClass.WARRIOR],
-                special_effect="fire_damage"),  # Огненный урон
-            
-            Item("Секира варвара", ItemType.WEAPON, value=80, damage=12,
-                description="Тяжелая, но смертоносная секира", durability=90, required_level=6,
-                character_classes=[CharacterClass.WARRIOR],
-                special_effect="armor_penetration"),  # Пробитие брони
-            
-            # Новое оружие для Воина
-            Item("Молот Света", ItemType.WEAPON, value=200, damage=15,
-                description="Благословенный молот, светящийся священным светом", 
-                durability=120, required_level=8,
-                character_classes=[CharacterClass.WARRIOR],
-                special_effect="stun_chance"),  # Шанс оглушения
-            
-            Item("Ледяной меч", ItemType.WEAPON, value=180, damage=13,
-                description="Меч, выкованный из вечного льда", 
-                durability=110, required_level=7,
-                character_classes=[CharacterClass.WARRIOR],
-                special_effect="fire_damage"),  # Ледяной урон (используем fire_damage как базовый)
-            
-            # Оружие для Мага
-            Item("Магический посох", ItemType.WEAPON, value=100, damage=5, mana=20, 
-                description="Посох, усиливающий магию", durability=80, required_level=5,
-                character_classes=[CharacterClass.MAGE]),
-            
-            Item("Жезл волшебника", ItemType.WEAPON, value=120, damage=6, mana=30,
-                description="Мощный жезл для заклинаний", durability=70, required_level=7,
-                character_classes=[CharacterClass.MAGE],
-                special_effect="mana_steal"),  # Кража маны
-            
-            Item("Кристальный скипетр", ItemType.WEAPON, value=180, damage=8, mana=40,
-                description="Скипетр с магическим кристаллом", durability=90, required_level=10,
-                character_classes=[CharacterClass.MAGE],
-                special_effect="fire_damage"),  # Магический урон
-            
-            Item("Книга заклинаний", ItemType.WEAPON, value=60, damage=3, mana=50,
-                description="Древняя книга с магическими формулами", durability=40, required_level=3,
-                character_classes=[CharacterClass.MAGE]),
-            
-            # Новое оружие для Мага
-            Item("Посох Некроманта", ItemType.WEAPON, value=220, damage=10, mana=60,
-                description="Посох, вырезанный из кости дракона", 
-                durability=100, required_level=12,
-                character_classes=[CharacterClass.MAGE],
-                special_effect="life_steal"),  # Кража жизни
-            
-            Item("Жезл Стихий", ItemType.WEAPON, value=160, damage=9, mana=45,
-                description="Жезл, контролирующий четыре стихии", 
-                durability=85, required_level=9,
-                character_classes=[CharacterClass.MAGE],
-                special_effect="critical_chance"),  # Увеличенный шанс крита
-            
-            # Оружие для Лучника
-            Item("Лук охотника", ItemType.WEAPON, value=40, damage=6, 
-                description="Точный лук лесного охотника", durability=70, required_level=2,
-                character_classes=[CharacterClass.ARCHER]),
-            
-            Item("Эльфийский лук", ItemType.WEAPON, value=150, damage=10,
-                description="Искусно изготовленный эльфийский лук", durability=120, required_level=8,
-                character_classes=[CharacterClass.ARCHER],
-                special_effect="critical_chance"),  # Увеличенный шанс крита
-            
-            Item("Арбалет снайпера", ItemType.WEAPON, value=200, damage=12,
-                description="Точный арбалет для дальних дистанций", durability=100, required_level=12,
-                character_classes=[CharacterClass.ARCHER],
-                special_effect="armor_penetration"),  # Пробитие брони
-            
-            Item("Короткий лук", ItemType.WEAPON, value=30, damage=4,
-                description="Компактный лук для быстрой стрельбы", durability=50, required_level=1,
-                character_classes=[CharacterClass.ARCHER]),
-            
-            # Новое оружие для Лучника
-            Item("Лук Призрака", ItemType.WEAPON, value=170, damage=11,
-                description="Лук, сделанный из призрачной древесины", 
-                durability=95, required_level=10,
-                character_classes=[CharacterClass.ARCHER],
-                special_effect="poison"),  # Ядовитые стрелы
-            
-            Item("Арбалет Разрушителя", ItemType.WEAPON, value=250, damage=14,
-                description="Мощный арбалет, пробивающий доспехи", 
-                durability=110, required_level=14,
-                character_classes=[CharacterClass.ARCHER],
-                special_effect="armor_penetration"),  # Сильное пробитие брони
-            
-            # Оружие для Разбойника
-            Item("Кинжалы разбойника", ItemType.WEAPON, value=60, damage=7, 
-                description="Пара острых кинжалов", durability=60, required_level=4,
-                character_classes=[CharacterClass.ROGUE]),
-            
-            Item("Теневые клинки", ItemType.WEAPON, value=140, damage=9,
-                description="Клинки, невидимые в темноте", durability=80, required_level=9,
-                character_classes=[CharacterClass.ROGUE],
-                special_effect="poison"),  # Ядовитые клинки
-            
-            Item("Отравленные кинжалы", ItemType.WEAPON, value=90, damage=6,
-                description="Кинжалы с ядом", durability=60, required_level=5,
-                character_classes=[CharacterClass.ROGUE],
-                special_effect="poison"),  # Яд
-            
-            Item("Стилет", ItemType.WEAPON, value=45, damage=5,
-                description="Тонкий кинжал для точных ударов", durability=40, required_level=2,
-                character_classes=[CharacterClass.ROGUE]),
-            
-            # Новое оружие для Разбойника
-            Item("Кинжалы Убийцы", ItemType.WEAPON, value=190, damage=11,
-                description="Клинки, созданные для бесшумных убийств", 
-                durability=75, required_level=11,
-                character_classes=[CharacterClass.ROGUE],
-                special_effect="critical_chance"),  # Высокий шанс крита
-            
-            Item("Когти Призрака", ItemType.WEAPON, value=130, damage=8,
-                description="Парные клинки, оставляющие призрачные следы", 
-                durability=65, required_level=6,
-                character_classes=[CharacterClass.ROGUE],
-                special_effect="life_steal"),  # Кража жизни
-        ]
-        
-        # Броня с указанием конкретных слотов и классов
-        armors = [
-            # Броня для воина
-            Item("Кожаная броня", ItemType.ARMOR, value=20, defense=3, 
-                description="Прочная кожаная броня", durability=60, required_level=1, 
-                armor_slot="armor", character_classes=[CharacterClass.WARRIOR, CharacterClass.ARCHER, CharacterClass.ROGUE]),
-            
-            Item("Кольчуга", ItemType.ARMOR, value=80, defense=7, 
-                description="Тяжелая, но надежная кольчуга", durability=100, required_level=4, 
-                armor_slot="armor", character_classes=[CharacterClass.WARRIOR]),
-            
-            Item("Доспех дракона", ItemType.ARMOR, value=400, defense=20, health=50, 
-                description="Доспехи из драконьей чешуи", durability=200, required_level=15, 
-                armor_slot="armor", character_classes=[CharacterClass.WARRIOR]),
-            
-            Item("Пластинчатый доспех", ItemType.ARMOR, value=120, defense=10,
-                description="Тяжелый пластинчатый доспех", durability=110, required_level=7, 
-                armor_slot="armor", character_classes=[CharacterClass.WARRIOR]),
-            
-            Item("Чешуйчатая броня", ItemType.ARMOR, value=60, defense=5,
-                description="Броня из металлических чешуек", durability=80, required_level=3,
-                armor_slot="armor", character_classes=[CharacterClass.WARRIOR]),
-            
-            # Броня для мага
-            Item("Мантия мага", ItemType.ARMOR, value=60, defense=2, mana=30, 
-                description="Мантия, усиливающая магическую силу", durability=50, required_level=3, 
-                armor_slot="armor", character_classes=[CharacterClass.MAGE]),
-            
-            Item("Роба волшебника", ItemType.ARMOR, value=100, defense=3, mana=50,
-                description="Роба, сотканная из магических нитей", durability=60, required_level=6,
-                armor_slot="armor", character_classes=[CharacterClass.MAGE]),
-            
-            Item("Плащ архимага", ItemType.ARMOR, value=250, defense=5, mana=80,
-                description="Плащ древнего архимага", durability=90, required_level=12,
-                armor_slot="armor", character_classes=[CharacterClass.MAGE]),
-            
-            # Броня для лучника
-            Item("Кожаный доспех лучника", ItemType.ARMOR, value=40, defense=4,
-                description="Легкий доспех для лучников", durability=70, required_level=2,
-                armor_slot="armor", character_classes=[CharacterClass.ARCHER]),
-            
-            Item("Камуфляжный плащ", ItemType.ARMOR, value=70, defense=3,
-                description="Плащ для маскировки в лесу", durability=60, required_level=4,
-                armor_slot="armor", character_classes=[CharacterClass.ARCHER]),
-            
-            # Броня для разбойника
-            Item("Кожаная куртка", ItemType.ARMOR, value=35, defense=3,
-                description="Прочная кожаная куртка", durability=50, required_level=2,
-                armor_slot="armor", character_classes=[CharacterClass.ROGUE]),
-            
-            Item("Теневой плащ", ItemType.ARMOR, value=90, defense=4,
-                description="Плащ, скрывающий в тенях", durability=65, required_level=5,
-                armor_slot="armor", character_classes=[CharacterClass.ROGUE]),
-        ]
-        
-        # Шлемы
-        helmets = [
-            Item("Кожаный шлем", ItemType.HELMET, value=15, defense=2,
-                description="Прочный кожаный шлем", durability=40, required_level=1,
-                character_classes=[CharacterClass.WARRIOR, CharacterClass.ARCHER, CharacterClass.ROGUE]),
-            
-            Item("Железный шлем", ItemType.HELMET, value=40, defense=4,
-                description="Надежный железный шлем", durability=70, required_level=3,
-                character_classes=[CharacterClass.WARRIOR]),
-            
-            Item("Магический капюшон", ItemType.HELMET, value=60, defense=1, mana=20,
-                description="Капюшон, усиливающий магию", durability=50, required_level=4,
-                character_classes=[CharacterClass.MAGE]),
-            
-            Item("Драконий шлем", ItemType.HELMET, value=150, defense=8, health=20,
-                description="Шлем из драконьей чешуи", durability=120, required_level=12,
-                character_classes=[CharacterClass.WARRIOR]),
-            
-            Item("Капюшон лучника", ItemType.HELMET, value=30, defense=2,
-                description="Капюшон для защиты от ветра", durability=35, required_level=2,
-                character_classes=[CharacterClass.ARCHER]),
-            
-            Item("Маска разбойника", ItemType.HELMET, value=25, defense=1,
-                description="Маска, скрывающая лицо", durability=30, required_level=1,
-                character_classes=[CharacterClass.ROGUE]),
-        ]
-        
-        # Перчатки
-        gloves = [
-            Item("Кожаные перчатки", ItemType.GLOVES, value=10, defense=1,
-                description="Прочные кожаные перчатки", durability=30, required_level=1,
-                character_classes=[CharacterClass.WARRIOR, CharacterClass.ARCHER, CharacterClass.ROGUE]),
-            
-            Item("Железные перчатки", ItemType.GLOVES, value=30, defense=2,
-                description="Железные перчатки с усилением", durability=50, required_level=3,
-                character_classes=[CharacterClass.WARRIOR]),
-            
-            Item("Перчатки ловкости", ItemType.GLOVES, value=50, defense=1, 
-                description="Перчатки, увеличивающие ловкость", durability=40, required_level=5,
-                character_classes=[CharacterClass.ARCHER, CharacterClass.ROGUE]),
-            
-            Item("Магические перчатки", ItemType.GLOVES, value=40, defense=1, mana=15,
-                description="Перчатки, усиливающие магию", durability=35, required_level=4,
-                character_classes=[CharacterClass.MAGE]),
-            
-            Item("Перчатки стрелка", ItemType.GLOVES, value=35, defense=1,
-                description="Перчатки для точной стрельбы", durability=30, required_level=3,
-                character_classes=[CharacterClass.ARCHER]),
-        ]
-        
-        # Сапоги
-        boots = [
-            Item("Кожаные сапоги", ItemType.BOOTS, value=10, defense=1,
-                description="Прочные кожаные сапоги", durability=30, required_level=1,
-                character_classes=[CharacterClass.WARRIOR, CharacterClass.ARCHER, CharacterClass.ROGUE, CharacterClass.MAGE]),
-            
-            Item("Железные сапоги", ItemType.BOOTS, value=30, defense=2,
-                description="Железные сапоги с защитой", durability=50, required_level=3,
-                character_classes=[CharacterClass.WARRIOR]),
-            
-            Item("Сапоги скорости", ItemType.BOOTS, value=40, defense=1,
-                description="Сапоги, увеличивающие скорость", durability=40, required_level=4,
-                character_classes=[CharacterClass.ARCHER, CharacterClass.ROGUE]),
-            
-            Item("Магические сапоги", ItemType.BOOTS, value=45, defense=1, mana=10,
-                description="Сапоги, усиливающие магию", durability=35, required_level=4,
-                character_classes=[CharacterClass.MAGE]),
-            
-            Item("Сапоги тишины", ItemType.BOOTS, value=55, defense=1,
-                description="Сапоги, позволяющие двигаться бесшумно", durability=40, required_level=6,
-                character_classes=[CharacterClass.ROGUE]),
-        ]
-        
-        # Кольца
-        rings = [
-            Item("Кольцо защиты", ItemType.RING, value=80, defense=3,
-                description="Кольцо, увеличивающее защиту", required_level=3,
-                character_classes=[CharacterClass.WARRIOR, CharacterClass.ARCHER, CharacterClass.ROGUE]),
-            
-            Item("Кольцо маны", ItemType.RING, value=70, mana=20,
-                description="Кольцо, увеличивающее ману", required_level=3,
-                character_classes=[CharacterClass.MAGE]),
-            
-            Item("Кольцо силы", ItemType.RING, value=90, damage=2,
-                description="Кольцо, увеличивающее силу", required_level=4,
-                character_classes=[CharacterClass.WARRIOR]),
-            
-            Item("Кольцо ловкости", ItemType.RING, value=85,
-                description="Кольцо, увеличивающее ловкость", required_level=4,
-                character_classes=[CharacterClass.ARCHER, CharacterClass.ROGUE]),
-            
-            Item("Кольцо здоровья", ItemType.RING, value=60, health=20,
-                description="Кольцо, увеличивающее здоровье", required_level=2,
-                character_classes=[CharacterClass.WARRIOR, CharacterClass.ARCHER, CharacterClass.ROGUE, CharacterClass.MAGE]),
-        ]
-        
-        # Амулеты
-        amulets = [
-            Item("Амулет защиты", ItemType.AMULET, value=100, defense=5,
-                description="Амулет, увеличивающий защиту", required_level=5,
-                character_classes=[CharacterClass.WARRIOR, CharacterClass.ARCHER, CharacterClass.ROGUE]),
-            
-            Item("Амулет магии", ItemType.AMULET, value=120, mana=30,
-                description="Амулет, усиливающий магию", required_level=6,
-                character_classes=[CharacterClass.MAGE]),
-            
-            Item("Амулет силы", ItemType.AMULET, value=110, damage=3,
-                description="Амулет, увеличивающий силу", required_level=6,
-                character_classes=[CharacterClass.WARRIOR]),
-            
-            Item("Амулет удачи", ItemType.AMULET, value=95,
-                description="Амулет, увеличивающий удачу", required_level=4,
-                character_classes=[CharacterClass.ARCHER, CharacterClass.ROGUE]),
-            
-            Item("Амулет жизни", ItemType.AMULET, value=130, health=30,
-                description="Амулет, увеличивающее здоровье", required_level=7,
-                character_classes=[CharacterClass.WARRIOR, CharacterClass.ARCHER, CharacterClass.ROGUE, CharacterClass.MAGE]),
-        ]
-        
-        # Зелья
-        potions = [
-            Item("Зелье здоровья", ItemType.POTION, value=20, health=50, 
-                description="Восстанавливает здоровье", required_level=1),
-            
-            Item("Зелье маны", ItemType.POTION, value=25, mana=30, 
-                description="Восстанавливает ману", required_level=1),
-            
-            Item("Сильное зелье здоровья", ItemType.POTION, value=50, health=100, 
-                description="Сильно восстанавливает здоровье", required_level=3),
-            
-            Item("Эликсир опыта", ItemType.POTION, value=100, 
-                description="Дает 100 опыта", required_level=5),
-            
-            Item("Зелье силы", ItemType.POTION, value=40, 
-                description="Увеличивает силу на 5 на 10 минут", required_level=4,
-                character_classes=[CharacterClass.WARRIOR, CharacterClass.ARCHER]),
-            
-            Item("Антидот", ItemType.POTION, value=30, 
-                description="Лечит от яда", required_level=2),
-            
-            Item("Эликсир удачи", ItemType.POTION, value=60,
-                description="Увеличивает удачу на 3 на 1 час", required_level=6),
-            
-            Item("Зелье ловкости", ItemType.POTION, value=45,
-                description="Увеличивает ловкость на 5 на 10 минут", required_level=4,
-                character_classes=[CharacterClass.ARCHER, CharacterClass.ROGUE]),
-            
-            Item("Зелье интеллекта", ItemType.POTION, value=55,
-                description="Увеличивает интеллект на 5 на 10 минут", required_level=4,
-                character_classes=[CharacterClass.MAGE]),
-        ]
-        
-        # Свитки
-        scrolls = [
-            Item("Свиток телепортации", ItemType.SCROLL, value=100,
-                description="Телепортирует в Стартовую деревню", required_level=1),
-            
-            Item("Свиток идентификации", ItemType.SCROLL, value=80,
-                description="Позволяет идентифицировать предметы", required_level=3),
-            
-            Item("Свиток воскрешения", ItemType.SCROLL, value=500,
-                description="Воскрешает павшего союзника", required_level=10),
-            
-            Item("Свиток щита", ItemType.SCROLL, value=120,
-                description="Создает магический щит", required_level=4,
-                character_classes=[CharacterClass.MAGE]),
-            
-            Item("Свиток огня", ItemType.SCROLL, value=150,
-                description="Вызывает огненный шар", required_level=5,
-                character_classes=[CharacterClass.MAGE]),
-        ]
-        
-        # Собираем все предметы в базу данных
-        all_items = weapons + armors + helmets + gloves + boots + rings + amulets + potions + scrolls
-        for item in all_items:
+        """Инициализация предметов из data/items.json (в порядке файла)"""
+        for entry in CONTENT.items:
+            classes = entry["classes"]
+            item = Item(entry["name"], ItemType[entry["type"]], value=entry["value"], damage=entry["damage"],
+                        defense=entry["defense"], health=entry["health"], mana=entry["mana"],
+                        description=entry["description"], durability=entry["durability"],
+                        required_level=entry["required_level"], armor_slot=entry["armor_slot"],
+                        character_classes=[CharacterClass[name] for name in classes] if classes else None,
+                        special_effect=entry["special_effect"])
             self.items_db[item.name] = item
     
     def initialize_quests(self):
-        """Инициализация квестов"""
-        main_quest = Quest(
-            "Угроза дракона",
-            "Древний дракон пробудился и угрожает королевству. Победите его!",
-            "Логово дракона",
-            1000, 500, 15, "main"
-        )
-        main_quest.add_objective("Победить дракона", "Дракон", 1)
-        main_quest.add_reward_item(self.items_db["Драконий клинок"].copy())
-        main_quest.add_reward_item(self.items_db["Доспех дракона"].copy())
-        self.quests_db[main_quest.id] = main_quest
-        
-        quest1 = Quest(
-            "Очистить лес",
-            "Темный лес кишит волками. Убейте 5 волков.",
-            "Темный лес",
-            150, 50, 2, "side"
-        )
-        quest1.add_objective("Убить волков", "Волк", 5)
-        quest1.add_reward_item(self.items_db["Зелье здоровья"].copy())
-        self.quests_db[quest1.id] = quest1
-        
-        quest2 = Quest(
-            "Гоблинская проблема",
-            "Гоблины нападают на деревню. Убейте 10 гоблинов.",
-            "Гоблинские пещеры",
-            300, 100, 3, "side"
-        )
-        quest2.add_objective("Убить гоблинов", "Гоблин", 10)
-        quest2.add_reward_item(self.items_db["Стальной меч"].copy())
-        self.quests_db[quest2.id] = quest2
-        
-        quest3 = Quest(
-            "Сокровища руин",
-            "Найдите древний артефакт в Забытых руинах.",
-            "Забытые руины",
-            500, 200, 5, "side"
-        )
-        quest3.add_objective("Найти артефакт", "Артефакт", 1)
-        quest3.add_reward_item(self.items_db["Магический посох"].copy())
-        self.quests_db[quest3.id] = quest3
-        
-        quest4 = Quest(
-            "Болотные твари",
-            "Очистите болото от пауков.",
-            "Таинственное болото",
-            250, 80, 4, "side"
-        )
-        quest4.add_objective("Убить пауков", "Паук", 8)
-        quest4.add_reward_item(self.items_db["Антидот"].copy())
-        self.quests_db[quest4.id] = quest4
-        
-        quest5 = Quest(
-            "Особое поручение",
-            "Навестите бордель и получите особую услугу.",
-            "Роскошный бордель",
-            100, 50, 3, "side"
-        )
-        quest5.add_objective("Посетить бордель", "Бордель", 1)
-        quest5.add_reward_item(self.items_db["Зелье здоровья"].copy())
-        self.quests_db[quest5.id] = quest5
+        """Инициализация квестов из data/quests.json; награды - копии предметов из items_db"""
+        # Номер квеста - его место в каталоге: одинаков в любой сессии, и сохранения его находят
+        for index, entry in enumerate(CONTENT.quests):
+            quest = Quest(entry["name"], entry["description"], entry["location"],
+                          entry["reward_xp"], entry["reward_gold"], entry["required_level"],
+                          entry["type"], entry["time_limit"], quest_id=100 + index)
+            for objective in entry["objectives"]:
+                quest.add_objective(objective["description"], objective["target"], objective["count"])
+            for name in entry["rewards"]:
+                quest.add_reward_item(self.items_db[name].copy())
+            self.quests_db[quest.id] = quest
     
     # ОПТИМИЗАЦИЯ: создадим общие методы для вывода
     def clear_screen(self):
@@ -1460,6 +5348,7 @@ class Game:
             name = input("> ").strip()
         
         self.player = Player(name, self.difficulty)
+        self.player.set_clock(self.timers)
         
         self.clear_screen()
         self.print_header("ВЫБОР КЛАССА")
@@ -1531,8 +5420,9 @@ class Game:
             "constitution": "Телосложение",
             "luck": "Удача"
         }
+        effective = self.player.effective_stats
         for stat, value in self.player.stats.items():
-            print(f"  {stat_names.get(stat, stat)}: {value}")
+            print(f"  {stat_names.get(stat, stat)}: {self.format_stat(value, effective[stat])}")
         
         input(f"\n{Color.WHITE}Нажмите Enter, чтобы начать приключение...{Color.END}")
     
@@ -1587,9 +5477,30 @@ class Game:
             "constitution": "Телосложение",
             "luck": "Удача"
         }
+        effective = self.player.effective_stats
         for stat, value in self.player.stats.items():
             bonus = self.player.get_stat_bonus(stat)
-            print(f"  {stat_names.get(stat, stat)}: {value} (бонус: +{bonus})")
+            print(f"  {stat_names.get(stat, stat)}: {self.format_stat(value, effective[stat])} (бонус: +{bonus})")
+        
+        if self.player.modifiers:
+            print(f"\n{Color.BOLD}ВРЕМЕННЫЕ ЭФФЕКТЫ:{Color.END}")
+            now = self.timers.now
+            for modifier in self.player.modifiers:
+                if modifier.expires_at is not None:
+                    left = f"еще {modifier.expires_at - now} мин."
+                elif modifier.turns is not None:
+                    left = f"еще {modifier.turns} р."
+                else:
+                    left = "постоянно"
+                print(f"  {modifier.source}: {stat_names.get(modifier.stat, modifier.stat)} "
+                      f"{modifier.value:+d} ({left})")
+        
+        print(f"\n{Color.BOLD}УМЕНИЯ:{Color.END}")
+        for skill in SKILL_BOOK.learned(self.player):
+            print(f"  {skill.name} ({skill.cost} маны): {skill.description}")
+        next_skill = SKILL_BOOK.next_skill(self.player)
+        if next_skill:
+            print(f"  {Color.CYAN}Следующее: {next_skill.name} на {next_skill.level} уровне{Color.END}")
         
         print(f"\n{Color.BOLD}ЭКИПИРОВКА:{Color.END}")
         slot_names = {
@@ -1610,16 +5521,7 @@ class Game:
                     print(f"    {Color.RED}Внимание: низкая прочность!{Color.END}")
                 # Показываем специальный эффект оружия
                 if slot == "weapon" and item.special_effect:
-                    effect_names = {
-                        "fire_damage": "Огненный урон",
-                        "mana_steal": "Кража маны",
-                        "critical_chance": "Шанс крита",
-                        "poison": "Яд",
-                        "life_steal": "Кража здоровья",
-                        "stun_chance": "Оглушение",
-                        "armor_penetration": "Пробитие брони"
-                    }
-                    effect_name = effect_names.get(item.special_effect, item.special_effect)
+                    effect_name = WEAPON_EFFECTS.title(item.special_effect)
                     print(f"    {Color.CYAN}Эффект: {effect_name}{Color.END}")
             else:
                 print(f"  {slot_name}: {Color.WHITE}Нет{Color.END}")
@@ -1694,16 +5596,7 @@ class Game:
                         
                         # Показываем специальный эффект для оружия
                         if item.special_effect:
-                            effect_names = {
-                                "fire_damage": "Огненный урон",
-                                "mana_steal": "Кража маны",
-                                "critical_chance": "Шанс крита",
-                                "poison": "Яд",
-                                "life_steal": "Кража здоровья",
-                                "stun_chance": "Оглушение",
-                                "armor_penetration": "Пробитие брони"
-                            }
-                            effect_name = effect_names.get(item.special_effect, item.special_effect)
+                            effect_name = WEAPON_EFFECTS.title(item.special_effect)
                             print(f"     {Color.CYAN}Эффект: {effect_name}{Color.END}")
                         
                         print(f"     Цена: {item.value} золота")
@@ -1866,43 +5759,13 @@ class Game:
     def use_item(self, item: Item):
         """Использовать предмет"""
         if item.item_type == ItemType.POTION:
-            if item.health > 0:
-                old_health = self.player.health
-                self.player.heal(item.health)
-                healed = self.player.health - old_health
-                print(f"{Color.GREEN}Вы восстановили {healed} здоровья!{Color.END}")
-            
-            if item.mana > 0:
-                old_mana = self.player.mana
-                self.player.restore_mana(item.mana)
-                restored = self.player.mana - old_mana
-                print(f"{Color.BLUE}Вы восстановили {restored} маны!{Color.END}")
-            
-            if item.name == "Эликсир опыта":
-                self.player.gain_xp(100)
-                print(f"{Color.YELLOW}Вы получили 100 опыта!{Color.END}")
-            
-            if item.name == "Зелье силы":
-                self.player.stats["strength"] += 5
-                print(f"{Color.GREEN}Ваша сила увеличена на 5 на 10 минут!{Color.END}")
-            
-            elif item.name == "Эликсир удачи":
-                self.player.stats["luck"] += 3
-                print(f"{Color.GREEN}Ваша удача увеличена на 3 на 1 час!{Color.END}")
-            
-            elif item.name == "Зелье ловкости":
-                self.player.stats["dexterity"] += 5
-                print(f"{Color.GREEN}Ваша ловкость увеличена на 5 на 10 минут!{Color.END}")
-            
-            elif item.name == "Зелье интеллекта":
-                self.player.stats["intelligence"] += 5
-                print(f"{Color.GREEN}Ваш интеллект увеличена на 5 на 10 минут!{Color.END}")
-            
-            self.player.remove_item(item)
+            effects = self.player.drink_potion(item)
+            self.print_potion_effects(effects)
         
         elif item.item_type == ItemType.SCROLL:
             if item.name == "Свиток телепортации":
                 self.player.location = "Стартовая деревня"
+                self.load_world_around(self.player.location)
                 print(f"{Color.YELLOW}Вы телепортируетесь в Стартовую деревню!{Color.END}")
             elif item.name == "Свиток идентификации":
                 print(f"{Color.YELLOW}Вы использовали свиток идентификации.{Color.END}")
@@ -1916,6 +5779,30 @@ class Game:
         
         time.sleep(2)
     
+    @staticmethod
+    def format_stat(base: int, effective: int) -> str:
+        """Значение характеристики с временной прибавкой, если она есть"""
+        if effective == base:
+            return str(base)
+        return f"{Color.GREEN if effective > base else Color.RED}{effective}{Color.END} ({base}{effective - base:+d})"
+    
+    def print_potion_effects(self, effects: Dict[str, int]):
+        """Вывод эффектов выпитого зелья"""
+        if "health" in effects:
+            print(f"{Color.GREEN}Вы восстановили {effects['health']} здоровья!{Color.END}")
+        if "mana" in effects:
+            print(f"{Color.BLUE}Вы восстановили {effects['mana']} маны!{Color.END}")
+        if "xp" in effects:
+            print(f"{Color.YELLOW}Вы получили {effects['xp']} опыта!{Color.END}")
+        if "strength" in effects:
+            print(f"{Color.GREEN}Ваша сила увеличена на {effects['strength']} на 10 минут!{Color.END}")
+        if "luck" in effects:
+            print(f"{Color.GREEN}Ваша удача увеличена на {effects['luck']} на 1 час!{Color.END}")
+        if "dexterity" in effects:
+            print(f"{Color.GREEN}Ваша ловкость увеличена на {effects['dexterity']} на 10 минут!{Color.END}")
+        if "intelligence" in effects:
+            print(f"{Color.GREEN}Ваш интеллект увеличен на {effects['intelligence']} на 10 минут!{Color.END}")
+    
     def show_quests(self):
         """Показать квесты"""
         self.clear_screen()
@@ -1962,10 +5849,9 @@ class Game:
         if quest.location:
             print(f"Локация: {quest.location}")
         
-        if quest.time_limit > 0 and quest.start_time:
-            elapsed = (datetime.now() - quest.start_time).seconds / 60
-            remaining = max(0, quest.time_limit - elapsed)
-            print(f"Осталось времени: {int(remaining)} минут")
+        if quest.deadline and quest.status == QuestStatus.IN_PROGRESS:
+            remaining = max(0, quest.deadline - self.timers.now)
+            print(f"Осталось времени: {remaining // 60} ч {remaining % 60} мин")
         
         print(f"Награда: {quest.reward_xp} опыта, {quest.reward_gold} золота")
         
@@ -2010,7 +5896,7 @@ class Game:
                 else:
                     print(f"  Всего врагов: {len(location.enemies)}")
             
-            if random.random() < location.special_event_chance:
+            if RNG.events.random() < location.special_event_chance:
                 event = location.add_special_event()
                 print(f"\n{Color.PURPLE}✨ {event}{Color.END}")
             
@@ -2057,6 +5943,7 @@ class Game:
         """Дальнейшее исследование локации"""
         self.clear_screen()
         self.print_header(f"ГЛУБЖЕ В {location.name}")
+        self.advance_clock(self.EXPLORE_MINUTES)
         
         events = [
             "Вы нашли заброшенную хижину",
@@ -2071,24 +5958,24 @@ class Game:
             "Вы обнаружили поляну с редкими растениями"
         ]
         
-        event = random.choice(events)
+        event = RNG.events.choice(events)
         print(f"{Color.YELLOW}{event}{Color.END}")
         
         luck_bonus = self.player.get_stat_bonus("luck") * 0.05
         find_chance = 0.4 + luck_bonus
         
-        if random.random() < find_chance:
+        if RNG.loot.random() < find_chance:
             found_items = []
             
-            gold_found = random.randint(5, 50) + (self.player.level * 2)
+            gold_found = RNG.loot.randint(5, 50) + (self.player.level * 2)
             self.player.gold += gold_found
             found_items.append(f"{Color.YELLOW}{gold_found} золота{Color.END}")
             
-            if random.random() < 0.3:
+            if RNG.loot.random() < 0.3:
                 available_items = [item for item in self.items_db.values() 
                                   if item.value <= 100 + (self.player.level * 20)]
                 if available_items:
-                    item = random.choice(available_items).copy()
+                    item = RNG.loot.choice(available_items).copy()
                     self.player.add_item(item)
                     found_items.append(f"{item.get_colored_name()}")
             
@@ -2096,12 +5983,12 @@ class Game:
                 print(f"{Color.GREEN}Вы нашли: {', '.join(found_items)}!{Color.END}")
         
         encounter_chance = 0.3 - (self.player.get_stat_bonus("dexterity") * 0.02)
-        if random.random() < encounter_chance and location.enemies:
+        if RNG.events.random() < encounter_chance and location.enemies:
             print(f"\n{Color.RED}Вас атаковал враг!{Color.END}")
             time.sleep(1)
             self.start_battle(location)
         else:
-            if random.random() < 0.2 and self.player.quests:
+            if RNG.events.random() < 0.2 and self.player.quests:
                 print(f"\n{Color.CYAN}Вы нашли подсказку, связанную с одним из ваших квестов!{Color.END}")
             
             input(f"\n{Color.WHITE}Нажмите Enter, чтобы продолжить...{Color.END}")
@@ -2110,6 +5997,7 @@ class Game:
         """Поиск сокровищ"""
         self.clear_screen()
         self.print_header("ПОИСК СОКРОВИЩ")
+        self.advance_clock(self.EXPLORE_MINUTES)
         
         print(f"{Color.YELLOW}Вы тщательно обыскиваете местность...{Color.END}")
         time.sleep(1)
@@ -2127,7 +6015,7 @@ class Game:
         
         success_chance += difficulty_penalty
         
-        if random.random() < success_chance:
+        if RNG.loot.random() < success_chance:
             treasures = [
                 ("небольшой сундук с золотом", "gold", (20, 50)),
                 ("магический артефакт", "item", None),
@@ -2138,13 +6026,13 @@ class Game:
                 ("тайник с ресурсами", "resources", None)
             ]
             
-            treasure = random.choice(treasures)
+            treasure = RNG.loot.choice(treasures)
             name, treasure_type, gold_range = treasure
             
             print(f"{Color.GREEN}Вы нашли {name}!{Color.END}")
             
             if treasure_type == "gold":
-                gold = random.randint(gold_range[0], gold_range[1])
+                gold = RNG.loot.randint(gold_range[0], gold_range[1])
                 gold += self.player.level * 5
                 self.player.gold += gold
                 print(f"{Color.YELLOW}+{gold} золота{Color.END}")
@@ -2154,7 +6042,7 @@ class Game:
                 available_items = [item for item in self.items_db.values() 
                                   if item.value <= 100 + (self.player.level * 20)]
                 if available_items:
-                    item = random.choice(available_items).copy()
+                    item = RNG.loot.choice(available_items).copy()
                     self.player.add_item(item)
                     print(f"{Color.CYAN}Вы нашли: {item.get_colored_name()}{Color.END}")
             
@@ -2162,7 +6050,7 @@ class Game:
                 scrolls = [item for item in self.items_db.values() 
                           if item.item_type == ItemType.SCROLL]
                 if scrolls:
-                    scroll = random.choice(scrolls).copy()
+                    scroll = RNG.loot.choice(scrolls).copy()
                     self.player.add_item(scroll)
                     print(f"{Color.BLUE}Вы нашли: {scroll.get_colored_name()}{Color.END}")
             
@@ -2172,7 +6060,7 @@ class Game:
                                                        ItemType.HELMET, ItemType.GLOVES, ItemType.BOOTS]
                                   and item.value <= 200]
                 if available_items:
-                    item = random.choice(available_items).copy()
+                    item = RNG.loot.choice(available_items).copy()
                     item.damage = int(item.damage * 1.5) if item.damage > 0 else 0
                     item.defense = int(item.defense * 1.5) if item.defense > 0 else 0
                     item.value = int(item.value * 2)
@@ -2183,9 +6071,9 @@ class Game:
             
             elif treasure_type == "resources":
                 resources = ["Железная руда", "Магический кристалл", "Кожа", "Ткань", "Дерево"]
-                resource = random.choice(resources)
+                resource = RNG.loot.choice(resources)
                 resource_item = Item(resource, ItemType.MATERIAL, 
-                                    value=random.randint(10, 50),
+                                    value=RNG.loot.randint(10, 50),
                                     description=f"Ценный ресурс: {resource}")
                 self.player.add_item(resource_item)
                 print(f"{Color.GREEN}Вы нашли: {resource}{Color.END}")
@@ -2200,11 +6088,11 @@ class Game:
                 "Вы чуть не провалились в яму"
             ]
             
-            failure = random.choice(failures)
+            failure = RNG.loot.choice(failures)
             print(f"{Color.RED}{failure}{Color.END}")
             
             if "урон" in failure:
-                damage = random.randint(5, 25)
+                damage = RNG.loot.randint(5, 25)
                 self.player.take_damage(damage)
                 print(f"{Color.RED}-{damage} здоровья{Color.END}")
             
@@ -2231,16 +6119,16 @@ class Game:
             ("Жрица", "Боги наблюдают за тобой. Не подведи их.")
         ]
         
-        npc = random.choice(npcs)
+        npc = RNG.events.choice(npcs)
         name, dialogue = npc
         
         print(f"{Color.YELLOW}{name}:{Color.END}")
         print(f'"{dialogue}"')
         
-        if random.random() < 0.3:
+        if RNG.events.random() < 0.3:
             print(f"\n{Color.GREEN}{name} дает вам полезный совет!{Color.END}")
             
-            if random.random() < 0.5:
+            if RNG.events.random() < 0.5:
                 tips = [
                     "Не забывайте использовать зелья в бою",
                     "Исследуйте каждую локацию тщательно",
@@ -2248,7 +6136,7 @@ class Game:
                     "Экипируйте лучшее оружие и броню",
                     "Выполняйте квесты для получения опыта"
                 ]
-                print(f"Совет: {random.choice(tips)}")
+                print(f"Совет: {RNG.events.choice(tips)}")
             else:
                 enemy_info = [
                     "Гоблины слабы, но атакуют толпой",
@@ -2257,7 +6145,7 @@ class Game:
                     "Драконы используют огненное дыхание",
                     "Некроманты могут воскрешать мертвых"
                 ]
-                print(f"Знание о врагах: {random.choice(enemy_info)}")
+                print(f"Знание о врагах: {RNG.events.choice(enemy_info)}")
         
         input(f"\n{Color.WHITE}Нажмите Enter, чтобы продолжить...{Color.END}")
     
@@ -2278,11 +6166,15 @@ class Game:
             
             min_item_level = max(1, min(self.player.level - 2, location_min_level))
             max_item_level = self.player.level + 2
+            sold = current_location.shop_sold if current_location else {}
             
             print(f"Доступные уровни предметов: {min_item_level}-{max_item_level}")
             
             shop_items = []
             for item in self.items_db.values():
+                if sold.get(item.name, 0) >= self.SHOP_STOCK:
+                    continue  # Распродано до следующего завоза
+                
                 if hasattr(item, 'character_classes') and item.character_classes:
                     if self.player.character_class not in item.character_classes:
                         continue
@@ -2342,19 +6234,11 @@ class Game:
                         
                         # Показываем специальный эффект оружия
                         if item.special_effect:
-                            effect_names = {
-                                "fire_damage": "Огненный урон",
-                                "mana_steal": "Кража маны",
-                                "critical_chance": "Шанс крита",
-                                "poison": "Яд",
-                                "life_steal": "Кража здоровья",
-                                "stun_chance": "Оглушение",
-                                "armor_penetration": "Пробитие брони"
-                            }
-                            effect_name = effect_names.get(item.special_effect, item.special_effect)
+                            effect_name = WEAPON_EFFECTS.title(item.special_effect)
                             print(f"     {Color.CYAN}Эффект: {effect_name}{Color.END}")
                         
-                        print(f"     Цена: {Color.YELLOW}{item.value} золота{Color.END}")
+                        print(f"     Цена: {Color.YELLOW}{item.value} золота{Color.END}"
+                              f" (в наличии: {self.SHOP_STOCK - sold.get(item.name, 0)})")
                         item_map[item_index] = item
                         item_index += 1
             
@@ -2393,6 +6277,11 @@ class Game:
                         self.player.gold -= item.value
                         bought_item = item.copy()
                         self.player.add_item(bought_item)
+                        if current_location:
+                            if not sold:  # Первая покупка после завоза
+                                self.schedule_restock(current_location)
+                            sold[item.name] = sold.get(item.name, 0) + 1
+                            current_location.mark_changed()
                         print(f"{Color.GREEN}Вы купили {item.name}!{Color.END}")
                         time.sleep(1)
                 else:
@@ -2504,6 +6393,17 @@ class Game:
             
             time.sleep(1)
     
+    def difficulty_label(self, estimate: Dict) -> Tuple[str, str]:
+        """Метка сложности боя по точной оценке шанса победы и потери здоровья"""
+        win_chance = estimate["win_chance"]
+        if win_chance < 0.3:
+            return "Очень сложно", Color.RED
+        if win_chance < 0.7:
+            return "Сложно", Color.YELLOW
+        if win_chance >= 0.95 and estimate["hp_lost"] < self.player.health * 0.25:
+            return "Легко", Color.GREEN
+        return "Нормально", Color.CYAN
+    
     def start_battle(self, location: Location):
         """Начало битвы"""
         if not location.enemies:
@@ -2517,57 +6417,70 @@ class Game:
         print(f"{Color.RED}Выберите противника:{Color.END}")
         
         sorted_enemies = sorted(location.enemies, key=lambda x: x.level)
+        estimates = self.battle_analyzer.estimate(self.player, sorted_enemies[:7])
         
         # Показываем врагов
-        for i, enemy in enumerate(sorted_enemies[:7], 1):
+        for i, (enemy, estimate) in enumerate(zip(sorted_enemies[:7], estimates), 1):
             health_percent = (enemy.health / enemy.max_health) * 100
             health_color = Color.GREEN if health_percent > 50 else Color.YELLOW if health_percent > 20 else Color.RED
             
-            difficulty_indicator = ""
-            if enemy.level > self.player.level + 2:
-                difficulty_indicator = f" {Color.RED}(Очень сложно){Color.END}"
-            elif enemy.level > self.player.level:
-                difficulty_indicator = f" {Color.YELLOW}(Сложно){Color.END}"
-            elif enemy.level < self.player.level - 2:
-                difficulty_indicator = f" {Color.GREEN}(Легко){Color.END}"
+            win_chance = estimate["win_chance"]
+            label, label_color = self.difficulty_label(estimate)
+            difficulty_indicator = f" {label_color}({label}){Color.END}" if label != "Нормально" else ""
+            
+            chance_color = Color.GREEN if win_chance >= 0.7 else Color.YELLOW if win_chance >= 0.3 else Color.RED
             
             print(f"{i}. {enemy.name}{difficulty_indicator}")
             print(f"   Здоровье: {health_color}{enemy.health}/{enemy.max_health}{Color.END}")
             print(f"   Урон: {enemy.damage}, Защита: {enemy.defense}")
+            print(f"   Шанс победы: {chance_color}{win_chance:.0%}{Color.END}, "
+                  f"~{estimate['rounds']:.1f} раунда, -{estimate['hp_lost']:.0f} здоровья")
             
             if enemy.special_abilities:
                 print(f"   Способности: {', '.join(enemy.special_abilities)}")
         
         # Добавляем дополнительные опции
         print(f"\n{len(sorted_enemies[:7]) + 1}. Сражаться со случайным врагом")
-        print(f"{len(sorted_enemies[:7]) + 2}. Вернуться")
+        print(f"{len(sorted_enemies[:7]) + 2}. Напасть на группу врагов")
+        print(f"{len(sorted_enemies[:7]) + 3}. Автобой")
+        print(f"{len(sorted_enemies[:7]) + 4}. Вернуться")
         
-        max_choice = len(sorted_enemies[:7]) + 2
+        max_choice = len(sorted_enemies[:7]) + 4
         choice = self.get_choice(1, max_choice)
         
         if choice <= len(sorted_enemies[:7]):
             enemy = sorted_enemies[choice - 1]
             self.battle(enemy, location)
         elif choice == len(sorted_enemies[:7]) + 1:
-            enemy = random.choice(location.enemies)
+            enemy = RNG.combat.choice(location.enemies)
             self.battle(enemy, location)
+        elif choice == len(sorted_enemies[:7]) + 2:
+            self.group_battle(location.pick_group(), location)
+        elif choice == len(sorted_enemies[:7]) + 3:
+            self.auto_battle_menu(location)
         # choice == max_choice - вернуться
     
     def battle(self, enemy: Enemy, location: Location):
-        """Битва с врагом - ДОБАВЛЕН ФУНКЦИОНАЛ СПЕЦИАЛЬНЫХ ЭФФЕКТОВ"""
+        """Битва с врагом - отрисовка поверх CombatEngine"""
+        location.mark_changed()  # Бой меняет состав врагов локации
+        engine = CombatEngine(self.player, enemy)
+        engine.replay = BattleReplay.begin(self.player, enemy)
+        self.replays.append(engine.replay)
         self.current_battle = {
             "enemy": enemy,
             "location": location,
             "player_turn": True,
-            "round": 1
+            "round": 1,
+            "engine": engine
         }
         
+        self.combat_log.begin_battle([enemy])
         print(f"\n{Color.RED}Начинается битва с {enemy.name}!{Color.END}")
         time.sleep(1)
         
-        while enemy.health > 0 and self.player.health > 0:
+        while not engine.is_over:
             self.clear_screen()
-            self.print_header(f"БИТВА - РАУНД {self.current_battle['round']}")
+            self.print_header(f"БИТВА - РАУНД {engine.round}")
             
             print(f"{Color.GREEN}{self.player.name} (Ур.{self.player.level}){Color.END}")
             health_bar = self.create_bar(self.player.health, self.player.max_health, 30)
@@ -2582,9 +6495,11 @@ class Game:
             if enemy.special_abilities:
                 print(f"Способности: {', '.join(enemy.special_abilities)}")
             
-            print(f"\n{Color.CYAN}{'-'*70}{Color.END}")
+            print()
+            self.render_turn_order(engine)
+            print(f"{Color.CYAN}{'-'*70}{Color.END}")
             
-            if self.current_battle["player_turn"]:
+            if engine.player_turn:
                 print(f"{Color.YELLOW}Ваш ход:{Color.END}")
                 print("1. Атаковать")
                 print("2. Использовать предмет")
@@ -2594,78 +6509,482 @@ class Game:
                 
                 choice = self.get_choice(1, 5)
                 
-                if choice == 1:
-                    # ИСПРАВЛЕНИЕ: передаем врага в атаку для применения специальных эффектов
-                    damage, message = self.player.attack(enemy)
-                    if damage > 0:
-                        enemy.health -= damage
-                        print(f"\n{message}")
-                        print(f"{Color.GREEN}Вы нанесли {damage} урона!{Color.END}")
-                    else:
-                        print(f"\n{message}")
-                    self.current_battle["player_turn"] = False
-                
-                elif choice == 2:
-                    self.use_item_in_battle()
-                    self.current_battle["player_turn"] = False
-                
+                if choice == 2:
+                    result = engine.player_action(BattleAction.ITEM, item=self.use_item_in_battle())
                 elif choice == 3:
-                    self.use_skill_in_battle(enemy)
-                    self.current_battle["player_turn"] = False
-                
-                elif choice == 4:
-                    defense_bonus = self.player.get_stat_bonus("constitution") // 2
-                    print(f"\n{Color.GREEN}Вы принимаете защитную стойку! (+{defense_bonus} к защите на 1 ход){Color.END}")
-                    self.current_battle["player_turn"] = False
-                
-                elif choice == 5:
-                    escape_chance = 0.5 + self.player.get_stat_bonus("dexterity") * 0.1
-                    if random.random() < escape_chance:
-                        print(f"\n{Color.GREEN}Вы успешно сбежали!{Color.END}")
-                        time.sleep(1)
-                        return
-                    else:
-                        print(f"\n{Color.RED}Вам не удалось сбежать!{Color.END}")
-                        self.current_battle["player_turn"] = False
-                
+                    result = engine.player_action(BattleAction.SKILL, skill=self.use_skill_in_battle(engine))
+                else:
+                    action = {1: BattleAction.ATTACK, 4: BattleAction.DEFEND, 5: BattleAction.FLEE}[choice]
+                    result = engine.player_action(action)
             else:
                 print(f"\n{Color.YELLOW}Ход противника...{Color.END}")
                 time.sleep(1)
+                result = engine.enemy_action()
+            
+            self.render_turn(result, enemy)
+            self.combat_log.record_turn(result, enemy.name)
+            self.current_battle["player_turn"] = engine.player_turn
+            self.current_battle["round"] = engine.round
+            
+            if engine.outcome == "fled":
+                self.combat_log.end_battle(engine.outcome, engine.round)
+                engine.replay.finish(engine)
+                time.sleep(1)
+                return
+            
+            time.sleep(1.5)
+        
+        self.combat_log.end_battle(engine.outcome, engine.round)
+        engine.replay.finish(engine)
+        if engine.outcome == "victory":
+            self.victory(enemy, location)
+        else:
+            print(f"\n{Color.RED}Вы погибли!{Color.END}")
+            self.game_over()
+    
+    def auto_battle_menu(self, location: Location):
+        """Автобой: выбор стратегии и целей, вывод только итогов"""
+        self.clear_screen()
+        self.print_header("АВТОБОЙ")
+        
+        policies = AutoBattlePolicy.presets()
+        print(f"{Color.YELLOW}Выберите стратегию:{Color.END}")
+        for i, policy in enumerate(policies, 1):
+            print(f"{i}. {policy.name}")
+        policy = policies[self.get_choice(1, len(policies)) - 1]
+        
+        print(f"\n{Color.YELLOW}Цель:{Color.END}")
+        print("1. Случайный враг")
+        print(f"2. Очистить локацию ({len(location.enemies)} врагов, от слабых к сильным)")
+        print("3. Вернуться")
+        choice = self.get_choice(1, 3)
+        
+        if choice == 1:
+            enemies = [RNG.combat.choice(location.enemies)]
+        elif choice == 2:
+            enemies = sorted(location.enemies, key=lambda x: x.level)
+        else:
+            return
+        
+        summary = self.auto_battle(enemies, location, policy)
+        self.print_auto_battle_summary(summary, location)
+        
+        if summary["defeat"]:
+            self.game_over()
+    
+    def auto_battle(self, enemies: List[Enemy], location: Location,
+                    policy: AutoBattlePolicy) -> Dict:
+        """Бои без вывода и пауз до поражения, побега или конца списка врагов"""
+        location.mark_changed()  # Бой меняет состав врагов локации
+        player = self.player
+        start_health = player.health
+        start_level = player.level
+        start_time = time.perf_counter()
+        summary = {"fights": 0, "victories": 0, "fled": False, "defeat": False,
+                   "rounds": 0, "xp": 0, "gold": 0, "loot": [], "inventory_full": False,
+                   "potions": 0, "quests": [], "achievements": [], "skills": []}
+        
+        # Повышения уровня, достижения и квесты не печатаются, а попадают в итоги
+        player.quiet = True
+        player.quiet_achievements = []
+        try:
+            self._auto_battles(enemies, location, policy, summary)
+        finally:
+            player.quiet = False
+        
+        summary["achievements"] = player.quiet_achievements
+        player.quiet_achievements = []
+        for level in range(start_level + 1, player.level + 1):
+            summary["skills"].extend(skill.name
+                                     for skill in SKILL_BOOK.learned_at(player.character_class, level))
+        summary["start_health"] = start_health
+        summary["levels"] = player.level - start_level
+        summary["seconds"] = time.perf_counter() - start_time
+        return summary
+    
+    def _auto_battles(self, enemies: List[Enemy], location: Location, policy: AutoBattlePolicy, summary: Dict):
+        """Цикл автобоя: итоги каждого боя складываются в summary"""
+        player = self.player
+        log = self.combat_log
+        for enemy in enemies:
+            engine = CombatEngine(player, enemy)
+            log.begin_battle([enemy], "auto")
+            results = engine.run(policy, self.AUTO_BATTLE_MAX_ROUNDS)
+            
+            summary["fights"] += 1
+            for result in results:
+                log.record_turn(result, enemy.name)
+                if result.actor == "player":
+                    summary["rounds"] += 1
+                    if result.action == BattleAction.ITEM and result.success:
+                        summary["potions"] += 1
+            log.end_battle(engine.outcome, engine.round)
+            
+            if engine.outcome == "victory":
+                rewards = self.grant_rewards(enemy, location, quiet=True)
+                summary["victories"] += 1
+                summary["xp"] += rewards["xp"]
+                summary["gold"] += rewards["gold"]
+                summary["loot"].extend(rewards["loot"])
+                summary["inventory_full"] |= rewards["inventory_full"]
+                for quest in rewards["quests"]:
+                    summary["quests"].append(quest)
+                    summary["inventory_full"] |= quest["inventory_full"]
+            elif engine.outcome == "defeat":
+                summary["defeat"] = True
+                break
+            else:
+                summary["fled"] = True
+                break
+    
+    def print_auto_battle_summary(self, summary: Dict, location: Location):
+        """Итоги автобоя"""
+        self.clear_screen()
+        self.print_header("ИТОГИ АВТОБОЯ")
+        
+        print(f"Боев: {summary['fights']}, побед: {Color.GREEN}{summary['victories']}{Color.END}, "
+              f"раундов: {summary['rounds']} ({summary['seconds'] * 1000:.1f} мс)")
+        print(f"Опыт: +{summary['xp']}, золото: {Color.YELLOW}+{summary['gold']}{Color.END}")
+        if summary["levels"]:
+            print(f"{Color.YELLOW}Новых уровней: {summary['levels']} (теперь {self.player.level}){Color.END}")
+        for skill in summary["skills"]:
+            print(f"{Color.CYAN}Новое умение: {skill}{Color.END}")
+        print(f"Здоровье: {summary['start_health']} -> {self.player.health}/{self.player.max_health}, "
+              f"выпито зелий: {summary['potions']}")
+        
+        if summary["loot"]:
+            print(f"\n{Color.CYAN}Добыча:{Color.END}")
+            for loot in summary["loot"]:
+                print(f"  - {loot.get_colored_name()}")
+        for quest in summary["quests"]:
+            print(f"\n{Color.GREEN}Квест завершен: {quest['name']}{Color.END} "
+                  f"(+{quest['xp']} опыта, +{quest['gold']} золота)")
+            for item in quest["items"]:
+                print(f"  - {item.get_colored_name()}")
+            if quest["game_won"]:
+                print(f"{Color.YELLOW}✧ ✧ ✧ ПОБЕДА В ИГРЕ! ✧ ✧ ✧{Color.END}")
+        for name in summary["achievements"]:
+            print(f"{Color.YELLOW}Достижение: {name}{Color.END}")
+        if summary["inventory_full"]:
+            print(f"{Color.RED}Инвентарь полон - часть добычи осталась на поле боя{Color.END}")
+        
+        if summary["defeat"]:
+            print(f"\n{Color.RED}Вы погибли!{Color.END}")
+        elif summary["fled"]:
+            print(f"\n{Color.YELLOW}Автобой прерван: вы отступили.{Color.END}")
+        elif location.cleared:
+            print(f"\n{Color.GREEN}Локация '{location.name}' очищена!{Color.END}")
+        
+        if not summary["defeat"]:
+            input(f"\n{Color.WHITE}Нажмите Enter, чтобы продолжить...{Color.END}")
+    
+    def group_battle(self, enemies: List[Enemy], location: Location):
+        """Групповой бой - отрисовка поверх GroupCombatEngine"""
+        if len(enemies) == 1:
+            self.battle(enemies[0], location)
+            return
+        
+        location.mark_changed()  # Бой меняет состав врагов локации
+        engine = GroupCombatEngine(self.player, enemies)
+        group = engine.group
+        self.current_battle = {
+            "enemy": engine.enemy,
+            "enemies": group.enemies,
+            "location": location,
+            "player_turn": True,
+            "round": 1,
+            "engine": engine
+        }
+        
+        self.combat_log.begin_battle(enemies, "group")
+        print(f"\n{Color.RED}На вас нападает группа из {len(enemies)} врагов!{Color.END}")
+        time.sleep(1)
+        
+        while not engine.is_over:
+            self.clear_screen()
+            self.print_header(f"ГРУППОВАЯ БИТВА - РАУНД {engine.round}")
+            
+            print(f"{Color.GREEN}{self.player.name} (Ур.{self.player.level}){Color.END}")
+            health_bar = self.create_bar(self.player.health, self.player.max_health, 30)
+            mana_bar = self.create_bar(self.player.mana, self.player.max_mana, 30, Color.BLUE, Color.BLUE, Color.PURPLE)
+            print(f"Здоровье: {health_bar}")
+            print(f"Мана:     {mana_bar}")
+            
+            print(f"\n{Color.RED}Противники ({len(group)}/{len(group.enemies)}):{Color.END}")
+            for index in group.living[:self.GROUP_DISPLAY_LIMIT]:
+                enemy = group.enemies[index]
+                marker = f"{Color.YELLOW}>{Color.END}" if index == engine.target else " "
+                enemy_health_bar = self.create_bar(enemy.health, enemy.max_health, 15)
+                print(f"{marker} {enemy.name:<16} {enemy_health_bar}")
+            if len(group) > self.GROUP_DISPLAY_LIMIT:
+                print(f"  ... и еще {len(group) - self.GROUP_DISPLAY_LIMIT}")
+            
+            print()
+            self.render_turn_order(engine)
+            print(f"{Color.CYAN}{'-'*70}{Color.END}")
+            
+            if engine.player_turn:
+                print(f"{Color.YELLOW}Ваш ход (цель: {engine.enemy.name}):{Color.END}")
+                print("1. Атаковать")
+                print("2. Использовать предмет")
+                print("3. Использовать умение")
+                print("4. Защищаться (увеличивает защиту на 1 ход)")
+                print("5. Попытаться убежать")
+                print("6. Сменить цель")
                 
-                if enemy.special_abilities and random.random() < 0.3:
-                    special_damage, special_message = enemy.use_special_ability()
-                    if special_message:
-                        print(f"\n{special_message}")
-                    
-                    if special_damage > 0:
-                        is_dead = self.player.take_damage(special_damage)
-                        print(f"{enemy.name} наносит {special_damage} урона!")
-                else:
-                    enemy_damage = random.randint(
-                        max(1, enemy.damage - 2),
-                        enemy.damage + 2
-                    )
-                    
-                    is_dead = self.player.take_damage(enemy_damage)
-                    print(f"{enemy.name} атакует и наносит {enemy_damage} урона!")
+                choice = self.get_choice(1, 6)
+                target = engine.enemy
                 
-                if is_dead:
-                    print(f"\n{Color.RED}Вы погибли!{Color.END}")
-                    self.game_over()
-                    return
+                if choice == 6:
+                    self.choose_target(engine)
+                    continue
+                elif choice == 2:
+                    result = engine.player_action(BattleAction.ITEM, item=self.use_item_in_battle())
+                elif choice == 3:
+                    result = engine.player_action(BattleAction.SKILL, skill=self.use_skill_in_battle(engine))
+                else:
+                    action = {1: BattleAction.ATTACK, 4: BattleAction.DEFEND, 5: BattleAction.FLEE}[choice]
+                    result = engine.player_action(action)
                 
-                self.current_battle["player_turn"] = True
-                self.current_battle["round"] += 1
+                self.render_turn(result, target, group)
+                self.combat_log.record_turn(result, target.name)
+                if result.enemy_dead:
+                    print(f"{Color.GREEN}{target.name} повержен!{Color.END}")
+            else:
+                print(f"\n{Color.YELLOW}Ход противников...{Color.END}")
+                time.sleep(1)
+                result = engine.enemy_action()
+                self.render_volley(result, group)
+                self.combat_log.record_turn(result, f"группа ({len(group)})")
+            
+            self.current_battle["enemy"] = engine.enemy
+            self.current_battle["player_turn"] = engine.player_turn
+            self.current_battle["round"] = engine.round
+            
+            if engine.outcome == "fled":
+                self.combat_log.end_battle(engine.outcome, engine.round)
+                time.sleep(1)
+                defeated = group.defeated()
+                if defeated:
+                    self.group_victory(defeated, location, "ТРОФЕИ")
+                return
             
             time.sleep(1.5)
         
-        if enemy.health <= 0:
-            self.victory(enemy, location)
-        elif self.player.health <= 0:
+        self.combat_log.end_battle(engine.outcome, engine.round)
+        if engine.outcome == "victory":
+            self.group_victory(group.enemies, location)
+        else:
+            print(f"\n{Color.RED}Вы погибли!{Color.END}")
             self.game_over()
     
-    def use_item_in_battle(self):
-        """Использовать предмет в бою"""
+    def choose_target(self, engine: GroupCombatEngine):
+        """Выбор цели в групповом бою"""
+        group = engine.group
+        print(f"\n{Color.YELLOW}Выберите цель:{Color.END}")
+        for number, index in enumerate(group.living, 1):
+            enemy = group.enemies[index]
+            print(f"{number}. {enemy.name} ({enemy.health}/{enemy.max_health})")
+        
+        choice = self.get_choice(1, len(group.living))
+        engine.set_target(group.living[choice - 1])
+    
+    def render_volley(self, result: TurnResult, group: EnemyGroup):
+        """Вывод залпа противников в групповом бою"""
+        if result.message:
+            print(f"\n{result.message}")
+        
+        effects = result.effects
+        if effects["stunned"]:
+            print(f"{Color.YELLOW}Оглушено врагов: {effects['stunned']}{Color.END}")
+        if effects["hits"]:
+            print(f"\n{effects['attackers']} врагов атакуют: {effects['hits']} ударов, "
+                  f"{Color.GREEN}{effects['dodged']} уклонений{Color.END}")
+            print(f"{Color.RED}Вы получаете {result.dealt} урона!{Color.END}")
+        self.render_round_end(effects, "противникам", group)
+    
+    def show_combat_log(self):
+        """Журнал последних раундов и управление экспортом в JSONL"""
+        while True:
+            self.clear_screen()
+            self.print_header("ЖУРНАЛ БОЯ")
+            
+            events = self.combat_log.last_rounds(self.COMBAT_LOG_ROUNDS)
+            if not events:
+                print(f"{Color.YELLOW}Журнал пуст{Color.END}")
+            for event in events:
+                print(self.format_combat_event(event))
+            
+            exporter = self.combat_log_exporter
+            print(f"\n{Color.CYAN}{'-'*70}{Color.END}")
+            if exporter:
+                print(f"Экспорт: {Color.GREEN}{exporter.path}{Color.END} "
+                      f"(записано {exporter.written}, пропущено {exporter.dropped})")
+                print("1. Остановить экспорт в JSONL")
+            else:
+                print(f"1. Начать экспорт в JSONL ({self.COMBAT_LOG_EXPORT_PATH})")
+            print(f"2. Сохранить записи боев ({len(self.replays)}) в {self.REPLAY_EXPORT_PATH}")
+            print("3. Проверить записи боев")
+            print("4. Вернуться")
+            
+            choice = self.get_choice(1, 4)
+            if choice == 4:
+                return
+            
+            if choice == 2:
+                ReplayVerifier.save(self.REPLAY_EXPORT_PATH, self.replays)
+                print(f"{Color.GREEN}Сохранено записей: {len(self.replays)}{Color.END}")
+                time.sleep(1)
+            elif choice == 3:
+                self.print_replay_report(ReplayVerifier().verify(list(self.replays)))
+                input("\nНажмите Enter чтобы продолжить...")
+            elif exporter:
+                self.combat_log.unsubscribe(exporter)
+                exporter.close()
+                self.combat_log_exporter = None
+            else:
+                self.combat_log_exporter = JsonlExporter(self.COMBAT_LOG_EXPORT_PATH)
+                self.combat_log.subscribe(self.combat_log_exporter)
+    
+    def format_combat_event(self, event: CombatEvent) -> str:
+        """Строка журнала для события боя"""
+        if event.action == "battle_start":
+            return f"\n{Color.CYAN}Бой #{event.battle}: {event.enemy}{Color.END}"
+        if event.action == "battle_end":
+            outcome = event.data["outcome"]
+            outcomes = {"victory": "победа", "defeat": "поражение", "fled": "побег"}
+            return f"{Color.CYAN}Итог боя #{event.battle}: {outcomes.get(outcome, 'прерван')}{Color.END}"
+        if event.action == "victory":
+            return (f"{Color.YELLOW}Награда за {event.enemy}: +{event.data['xp']} опыта, "
+                    f"+{event.data['gold']} золота{Color.END}")
+        
+        actions = {"attack": "атакует", "item": "использует предмет", "skill": "применяет умение",
+                   "defend": "защищается", "flee": "пытается убежать", "ability": "применяет способность",
+                   "stunned": "оглушен", "volley": "атакует залпом"}
+        flags = {"critical": "крит", "miss": "промах", "dodged": "уклонение", "failed": "неудача",
+                 "enemy_dead": "враг повержен", "player_dead": "игрок погиб"}
+        
+        if event.actor == "player":
+            line = f"  р.{event.round} {Color.GREEN}{self.player.name}{Color.END} {actions.get(event.action, event.action)}"
+        else:
+            line = f"  р.{event.round} {Color.RED}{event.enemy}{Color.END} {actions.get(event.action, event.action)}"
+        if event.data and "ability" in event.data:
+            line += f" «{event.data['ability']}»"
+        if event.dealt:
+            line += f": {event.dealt} урона"
+        if event.flags:
+            line += f" ({', '.join(flags.get(flag, flag) for flag in event.flags)})"
+        return line
+    
+    @staticmethod
+    def print_replay_report(report: Dict):
+        """Итог проверки записей боев"""
+        rate = report["replays"] / report["seconds"] if report["seconds"] else 0
+        print(f"\n{Color.CYAN}Проверено записей: {report['replays']} "
+              f"за {report['seconds']:.2f} с ({rate:.0f}/с){Color.END}")
+        if not report["divergences"]:
+            print(f"{Color.GREEN}Расхождений нет{Color.END}")
+            return
+        print(f"{Color.RED}Расхождений: {len(report['divergences'])}{Color.END}")
+        for difference in report["divergences"]:
+            print(f"  запись #{difference['replay'] + 1}, ход {difference['turn']}: "
+                  f"ожидалось {difference['expected']}, получено {difference['actual']}")
+    
+    def render_turn(self, result: TurnResult, enemy: Enemy, group: EnemyGroup = None):
+        """Вывод результата хода и тиков эффектов, если на нем закончился раунд"""
+        if result.actor == "enemy":
+            if result.action == "stunned":
+                print(f"\n{Color.YELLOW}{enemy.name} оглушен и пропускает ход!{Color.END}")
+            if result.message:
+                print(f"\n{result.message}")
+            if result.damage > 0:
+                if result.action == "ability":
+                    print(f"{enemy.name} наносит {result.damage} урона!")
+                else:
+                    print(f"{enemy.name} атакует и наносит {result.damage} урона!")
+                if result.is_dodged:
+                    print(f"{Color.GREEN}Вы уклонились от удара!{Color.END}")
+        else:
+            self.render_player_action(result)
+        self.render_round_end(result.effects, enemy.name if group is None else "противникам", group)
+    
+    def render_round_end(self, effects: Dict, target: str, group: EnemyGroup = None):
+        """Вывод тиков эффектов конца раунда"""
+        if "poison_player" in effects:
+            print(f"{Color.RED}Яд наносит вам {effects['poison_player']} урона!{Color.END}")
+        if "poison_enemy" in effects:
+            print(f"{Color.GREEN}Яд наносит {target} {effects['poison_enemy']} урона!{Color.END}")
+        if group is not None:
+            for index in effects.get("killed", []):
+                print(f"{Color.GREEN}{group.enemies[index].name} погибает от яда!{Color.END}")
+    
+    def render_turn_order(self, engine: CombatEngine, count: int = 6):
+        """Строка очереди инициативы: кто ходит следующим"""
+        names = []
+        for actor in engine.turn_order(count):
+            if actor == "player":
+                names.append(f"{Color.GREEN}Вы{Color.END}")
+            else:
+                enemy = engine.enemy if actor == "enemy" else engine.group.enemies[actor]
+                names.append(f"{Color.RED}{enemy.type.value}{Color.END}")
+        print(f"Очередь ходов: {' > '.join(names)}")
+    
+    def render_player_action(self, result: TurnResult):
+        """Вывод хода игрока"""
+        action = result.action
+        
+        if action == BattleAction.ATTACK:
+            if result.is_miss:
+                print(f"\n{self.player.name} промахивается!")
+                return
+            message = f"{self.player.name} атакует"
+            if result.is_critical:
+                message += f" {Color.RED}КРИТИЧЕСКИ{Color.END}!"
+            if result.message:
+                message += f" {result.message}"
+            print(f"\n{message}")
+            if result.damage > 0:
+                print(f"{Color.GREEN}Вы нанесли {result.dealt} урона!{Color.END}")
+                if result.dealt < result.damage:
+                    print(f"{Color.BLUE}Магический щит поглощает {result.damage - result.dealt} урона!{Color.END}")
+        
+        elif action == BattleAction.ITEM:
+            self.print_potion_effects(result.effects)
+        
+        elif action == BattleAction.SKILL:
+            if result.ability is None:
+                return
+            if not result.success:
+                if "cooldown" in result.effects:
+                    print(f"{Color.RED}{result.ability} перезаряжается: еще {result.effects['cooldown']} х.{Color.END}")
+                else:
+                    print(f"{Color.RED}Недостаточно маны!{Color.END}")
+                return
+            print(f"\n{Color.GREEN}Вы используете {result.ability}!{Color.END}")
+            if result.message:
+                print(result.message)
+            if result.damage > 0:
+                print(f"{Color.GREEN}Вы нанесли {result.dealt} урона!{Color.END}")
+            if "self_damage" in result.effects:
+                print(f"{Color.RED}Вы теряете {result.effects['self_damage']} здоровья!{Color.END}")
+            if "health" in result.effects:
+                print(f"{Color.GREEN}Вы восстановили {result.effects['health']} здоровья!{Color.END}")
+            if "dodge" in result.effects:
+                print(f"{Color.GREEN}Ваш шанс уклонения увеличен!{Color.END}")
+            if "haste" in result.effects:
+                print(f"{Color.GREEN}Ваши ходы ускорены!{Color.END}")
+        
+        elif action == BattleAction.DEFEND:
+            print(f"\n{Color.GREEN}Вы принимаете защитную стойку! (+{result.effects['defense']} к защите на 1 ход){Color.END}")
+        
+        elif action == BattleAction.FLEE:
+            if result.success:
+                print(f"\n{Color.GREEN}Вы успешно сбежали!{Color.END}")
+            else:
+                print(f"\n{Color.RED}Вам не удалось сбежать!{Color.END}")
+    
+    def use_item_in_battle(self) -> Optional[Item]:
+        """Выбор предмета для использования в бою"""
         self.clear_screen()
         self.print_header("ИСПОЛЬЗОВАНИЕ ПРЕДМЕТА В БОЮ")
         
@@ -2679,7 +6998,7 @@ class Game:
         if not usable_items:
             print(f"{Color.YELLOW}У вас нет предметов для использования в бою{Color.END}")
             time.sleep(1)
-            return
+            return None
         
         print(f"{Color.GREEN}Доступные предметы:{Color.END}")
         for i, item in enumerate(usable_items, 1):
@@ -2698,91 +7017,90 @@ class Game:
         choice = self.get_choice(1, len(usable_items) + 1)
         
         if choice <= len(usable_items):
-            item = usable_items[choice - 1]
-            self.use_item(item)
+            return usable_items[choice - 1]
+        return None
     
-    def use_skill_in_battle(self, enemy: Enemy):
-        """Использовать умение в бою"""
+    def use_skill_in_battle(self, engine: CombatEngine) -> Optional[str]:
+        """Выбор умения для использования в бою"""
         self.clear_screen()
         self.print_header("ИСПОЛЬЗОВАНИЕ УМЕНИЯ")
         
-        skills = {
-            "Сильный удар": {"cost": 10, "damage_mult": 1.5, "class": CharacterClass.WARRIOR, "description": "Мощный удар, наносящий увеличенный урон"},
-            "Огненный шар": {"cost": 20, "damage_mult": 2.0, "class": CharacterClass.MAGE, "description": "Шар огня, поджигающий врага"},
-            "Стрела снайпера": {"cost": 15, "damage_mult": 1.8, "class": CharacterClass.ARCHER, "description": "Точный выстрел в уязвимое место"},
-            "Скрытый удар": {"cost": 12, "damage_mult": 1.7, "class": CharacterClass.ROGUE, "description": "Внезапная атака из укрытия"},
-            "Лечение": {"cost": 15, "heal": 30, "class": CharacterClass.MAGE, "description": "Восстанавливает здоровье"},
-            "Уклонение": {"cost": 8, "dodge": 0.5, "class": CharacterClass.ROGUE, "description": "Увеличивает шанс уклонения"},
-            "Берсерк": {"cost": 25, "damage_mult": 2.5, "self_damage": 10, "class": CharacterClass.WARRIOR, "description": "Мощная атака ценой здоровья"}
-        }
-        
-        available_skills = []
-        for skill_name, skill_info in skills.items():
-            if skill_info["class"] == self.player.character_class:
-                available_skills.append((skill_name, skill_info))
+        available_skills = engine.available_skills()
         
         if not available_skills:
             print(f"{Color.YELLOW}У вас нет доступных умений{Color.END}")
             time.sleep(1)
-            return
+            return None
         
         print(f"{Color.CYAN}Доступные умения:{Color.END}")
-        for i, (skill_name, skill_info) in enumerate(available_skills, 1):
-            print(f"{i}. {skill_name} (Стоимость: {skill_info['cost']} маны)")
-            print(f"   {skill_info['description']}")
+        for i, skill in enumerate(available_skills, 1):
+            cooldown = engine.cooldown_left(skill.name)
+            status = f" {Color.RED}[перезарядка: {cooldown} х.]{Color.END}" if cooldown else ""
+            recharge = f", перезарядка {skill.cooldown} х." if skill.cooldown else ""
+            print(f"{i}. {skill.name} (Стоимость: {skill.cost} маны{recharge}){status}")
+            print(f"   {skill.description}")
         
         print(f"\n{len(available_skills) + 1}. Отмена")
         
         choice = self.get_choice(1, len(available_skills) + 1)
         
         if choice <= len(available_skills):
-            skill_name, skill_info = available_skills[choice - 1]
-            
-            if self.player.mana >= skill_info["cost"]:
-                self.player.mana -= skill_info["cost"]
-                
-                if "damage_mult" in skill_info:
-                    base_damage = self.player.stats["strength"] // 2
-                    if self.player.equipped["weapon"]:
-                        base_damage += self.player.equipped["weapon"].damage
-                    
-                    damage = int(base_damage * skill_info["damage_mult"])
-                    enemy.health -= damage
-                    
-                    print(f"\n{Color.GREEN}Вы используете {skill_name}!{Color.END}")
-                    print(f"{Color.GREEN}Вы нанесли {damage} урона!{Color.END}")
-                    
-                    if skill_name == "Берсерк" and "self_damage" in skill_info:
-                        self.player.health -= skill_info["self_damage"]
-                        print(f"{Color.RED}Вы теряете {skill_info['self_damage']} здоровья!{Color.END}")
-                
-                elif "heal" in skill_info:
-                    self.player.heal(skill_info["heal"])
-                    print(f"\n{Color.GREEN}Вы используете {skill_name}!{Color.END}")
-                    print(f"{Color.GREEN}Вы восстановили {skill_info['heal']} здоровья!{Color.END}")
-                
-                elif "dodge" in skill_info:
-                    print(f"\n{Color.GREEN}Вы используете {skill_name}!{Color.END}")
-                    print(f"{Color.GREEN}Ваш шанс уклонения увеличен!{Color.END}")
-            else:
-                print(f"{Color.RED}Недостаточно маны!{Color.END}")
-            
-            time.sleep(1.5)
+            return available_skills[choice - 1].name
+        return None
     
     def victory(self, enemy: Enemy, location: Location):
         """Победа над врагом"""
         self.clear_screen()
         self.print_header("ПОБЕДА!")
         
-        xp_gained = enemy.xp_reward
-        gold_gained = enemy.gold_reward
+        self.claim_rewards(enemy, location)
+        
+        input(f"\n{Color.WHITE}Нажмите Enter, чтобы продолжить...{Color.END}")
+    
+    def group_victory(self, enemies: List[Enemy], location: Location, title: str = "ПОБЕДА!"):
+        """Награды за всех побежденных врагов группы"""
+        self.clear_screen()
+        self.print_header(title)
         
+        for enemy in enemies:
+            self.claim_rewards(enemy, location)
+        
+        input(f"\n{Color.WHITE}Нажмите Enter, чтобы продолжить...{Color.END}")
+    
+    def claim_rewards(self, enemy: Enemy, location: Location):
+        """Опыт, золото, квесты и добыча за побежденного врага"""
         print(f"{Color.GREEN}Вы победили {enemy.name}!{Color.END}")
         print(f"\n{Color.YELLOW}НАГРАДЫ:{Color.END}")
-        print(f"+{xp_gained} опыта")
-        print(f"+{gold_gained} золота")
+        print(f"+{enemy.xp_reward} опыта")
+        print(f"+{enemy.gold_reward} золота")
+        
+        rewards = self.grant_rewards(enemy, location)
+        
+        for loot in rewards["loot"]:
+            print(f"\n{Color.CYAN}Вы нашли: {loot.get_colored_name()}{Color.END}")
+        if rewards["inventory_full"]:
+            print(f"{Color.RED}Инвентарь полон!{Color.END}")
         
-        leveled_up = self.player.gain_xp(xp_gained)
+        if rewards["leveled_up"]:
+            print(f"\n{Color.YELLOW}ПОЗДРАВЛЯЕМ! Вы достигли {self.player.level} уровня!{Color.END}")
+        
+        if rewards["cleared"]:
+            print(f"\n{Color.GREEN}Локация '{location.name}' очищена!{Color.END}")
+            hours = (location.respawn_timer - self.timers.now) // 60
+            print(f"{Color.YELLOW}Враги вернутся примерно через {hours} ч.{Color.END}")
+    
+    def grant_rewards(self, enemy: Enemy, location: Location, quiet: bool = False) -> Dict:
+        """Начисление наград: опыт, золото, квесты, добыча, очистка локации
+        
+        Сами награды не выводятся; завершенные квесты объявляются complete_quest,
+        а при quiet только попадают в rewards["quests"].
+        """
+        xp_gained = enemy.xp_reward
+        gold_gained = enemy.gold_reward
+        rewards = {"xp": xp_gained, "gold": gold_gained, "loot": [], "inventory_full": False,
+                   "leveled_up": False, "cleared": False, "quests": []}
+        
+        rewards["leveled_up"] = self.player.gain_xp(xp_gained)
         self.player.gold += gold_gained
         
         enemy_type_name = enemy.type.value
@@ -2801,17 +7119,17 @@ class Game:
                 if enemy_type_name in quest.objectives:
                     completed = quest.update_objective(enemy_type_name)
                     if completed:
-                        self.complete_quest(quest)
+                        rewards["quests"].append(self.complete_quest(quest, quiet))
                 else:
                     for obj in quest.objectives:
                         if "убить" in obj.lower() and enemy_type_name.lower() in obj.lower():
                             completed = quest.update_objective(obj)
                             if completed:
-                                self.complete_quest(quest)
+                                rewards["quests"].append(self.complete_quest(quest, quiet))
                             break
         
         loot_chance = enemy.loot_chance + (self.player.get_stat_bonus("luck") * 0.05)
-        if random.random() < loot_chance:
+        if RNG.loot.random() < loot_chance:
             loot_pool = []
             
             for item_name, item in self.items_db.items():
@@ -2819,55 +7137,64 @@ class Game:
                     loot_pool.append(item)
             
             if loot_pool:
-                num_loot = random.randint(1, min(3, enemy.level // 5 + 1))
+                num_loot = RNG.loot.randint(1, min(3, enemy.level // 5 + 1))
                 for _ in range(num_loot):
-                    if random.random() < 0.7:
-                        loot = random.choice(loot_pool).copy()
+                    if RNG.loot.random() < 0.7:
+                        loot = RNG.loot.choice(loot_pool).copy()
+                        if len(self.player.inventory) >= self.player.INVENTORY_LIMIT:
+                            rewards["inventory_full"] = True
+                            continue
                         self.player.add_item(loot)
-                        print(f"\n{Color.CYAN}Вы нашли: {loot.get_colored_name()}{Color.END}")
-        
-        if leveled_up:
-            print(f"\n{Color.YELLOW}ПОЗДРАВЛЯЕМ! Вы достигли {self.player.level} уровня!{Color.END}")
+                        rewards["loot"].append(loot)
         
         if enemy in location.enemies:
             location.enemies.remove(enemy)
         
-        if not location.enemies:
+        if not location.enemies and not location.cleared:
             location.cleared = True
-            print(f"\n{Color.GREEN}Локация '{location.name}' очищена!{Color.END}")
+            self.schedule_respawn(location)
+            rewards["cleared"] = True
         
-        if not location.enemies and location.respawn_timer >= 3:
-            location.generate_enemies()
-            location.cleared = False
-            print(f"{Color.YELLOW}В локации появились новые враги.{Color.END}")
-        
-        input(f"\n{Color.WHITE}Нажмите Enter, чтобы продолжить...{Color.END}")
+        self.combat_log.record_reward(enemy, rewards)
+        return rewards
     
-    def complete_quest(self, quest: Quest):
-        """Завершение квеста"""
-        print(f"\n{Color.GREEN}✧ ✧ ✧ КВЕСТ ЗАВЕРШЕН: {quest.name} ✧ ✧ ✧{Color.END}")
-        print(f"Награда: {quest.reward_xp} опыта, {quest.reward_gold} золота")
+    def complete_quest(self, quest: Quest, quiet: bool = False) -> Dict:
+        """Завершение квеста; при quiet без вывода и паузы - только итог для сводки"""
+        if not quiet:
+            print(f"\n{Color.GREEN}✧ ✧ ✧ КВЕСТ ЗАВЕРШЕН: {quest.name} ✧ ✧ ✧{Color.END}")
+            print(f"Награда: {quest.reward_xp} опыта, {quest.reward_gold} золота")
+        result = {"name": quest.name, "xp": quest.reward_xp, "gold": quest.reward_gold, "items": [],
+                  "inventory_full": False, "game_won": quest.name == "Угроза дракона"}
         
         self.player.gain_xp(quest.reward_xp)
         self.player.gold += quest.reward_gold
         
         if quest.reward_items:
-            print(f"\n{Color.YELLOW}Дополнительные награды:{Color.END}")
+            if not quiet:
+                print(f"\n{Color.YELLOW}Дополнительные награды:{Color.END}")
             for item in quest.reward_items:
                 item_copy = item.copy()
+                if quiet and len(self.player.inventory) >= self.player.INVENTORY_LIMIT:
+                    result["inventory_full"] = True
+                    continue
                 self.player.add_item(item_copy)
-                print(f"  - {item_copy.get_colored_name()}")
+                result["items"].append(item_copy)
+                if not quiet:
+                    print(f"  - {item_copy.get_colored_name()}")
         
         quest.status = QuestStatus.COMPLETED
         self.player.check_achievement("complete_quest", 1)
         
-        if quest.name == "Угроза дракона":
+        if result["game_won"]:
             self.player.check_achievement("complete_game", 1)
-            print(f"\n{Color.YELLOW}✧ ✧ ✧ ПОБЕДА В ИГРЕ! ✧ ✧ ✧{Color.END}")
-            print("Вы победили дракона и спасли королевство!")
-            print("Игра завершена, но вы можете продолжать исследовать мир.")
+            if not quiet:
+                print(f"\n{Color.YELLOW}✧ ✧ ✧ ПОБЕДА В ИГРЕ! ✧ ✧ ✧{Color.END}")
+                print("Вы победили дракона и спасли королевство!")
+                print("Игра завершена, но вы можете продолжать исследовать мир.")
         
-        time.sleep(2)
+        if not quiet:
+            time.sleep(2)
+        return result
     
     def game_over(self):
         """Конец игры"""
@@ -2937,17 +7264,17 @@ class Game:
             "Вы чувствуете легкую дрожь земли"
         ]
         
-        observation = random.choice(observations)
+        observation = RNG.events.choice(observations)
         print(f"{Color.CYAN}{observation}{Color.END}")
         
-        if random.random() < 0.4:
+        if RNG.events.random() < 0.4:
             info_types = [
                 "Вы понимаете, что здесь недавно прошла группа искателей приключений",
                 "Вы определяете направление к ближайшему поселению",
                 "Вы находите безопасный путь через эту местность",
                 "Вы замечаете уязвимое место в обороне врагов"
             ]
-            print(f"\n{Color.GREEN}{random.choice(info_types)}{Color.END}")
+            print(f"\n{Color.GREEN}{RNG.events.choice(info_types)}{Color.END}")
         
         input(f"\n{Color.WHITE}Нажмите Enter, чтобы продолжить...{Color.END}")
     
@@ -3014,14 +7341,15 @@ class Game:
                                    and q.id not in [q.id for q in self.player.quests]]
                 
                 if available_quests:
-                    quest = random.choice(available_quests)
+                    quest = RNG.events.choice(available_quests)
                     print(f"\n{Color.CYAN}Бармен предлагает квест: {quest.name}{Color.END}")
                     print(f"{quest.description}")
                     print(f"Награда: {quest.reward_xp} опыта, {quest.reward_gold} золота")
                     
                     accept = input(f"\nПринять квест? (y/n): ")
                     if accept.lower() == 'y':
-                        quest.status = QuestStatus.IN_PROGRESS
+                        quest.start(self.timers.now)
+                        self.schedule_quest_deadline(quest)
                         self.player.quests.append(quest)
                         print(f"{Color.GREEN}Квест принят!{Color.END}")
                 else:
@@ -3043,7 +7371,7 @@ class Game:
                 
                 print(f"\n{Color.YELLOW}Вы подслушиваете разговоры:{Color.END}")
                 for _ in range(3):
-                    print(f"  - {random.choice(rumors)}")
+                    print(f"  - {RNG.events.choice(rumors)}")
                 time.sleep(2)
             
             elif choice == 6:
@@ -3053,8 +7381,8 @@ class Game:
                     
                     input("Нажмите Enter, чтобы бросить кости...")
                     
-                    dice1 = random.randint(1, 6)
-                    dice2 = random.randint(1, 6)
+                    dice1 = RNG.casino.randint(1, 6)
+                    dice2 = RNG.casino.randint(1, 6)
                     total = dice1 + dice2
                     
                     print(f"Выпало: {dice1} + {dice2} = {total}")
@@ -3078,6 +7406,7 @@ class Game:
                     self.player.gold -= 30
                     self.player.health = self.player.max_health
                     self.player.mana = self.player.max_mana
+                    self.advance_clock(self.REST_MINUTES)
                     print(f"{Color.GREEN}Вы арендовали комнату и полностью восстановили здоровье и ману!{Color.END}")
                     
                     for slot in ["weapon", "armor", "helmet", "gloves", "boots"]:
@@ -3294,6 +7623,7 @@ class Game:
                     time.sleep(1)
                     
                     result, effects = selected_girl.provide_service()
+                    self.schedule_girl_rest(selected_girl)
                     print(f"\n{Color.CYAN}{result}{Color.END}")
                     
                     self.player.gold -= selected_girl.price
@@ -3315,7 +7645,7 @@ class Game:
                         print(f"{Color.GREEN}+{effects['stamina_recovery']} выносливости{Color.END}")
                     
                     if "quest_hint" in effects and self.player.quests:
-                        quest = random.choice(self.player.quests)
+                        quest = RNG.events.choice(self.player.quests)
                         print(f"{Color.CYAN}Вы узнали полезную информацию о квесте '{quest.name}'{Color.END}")
                     
                     for quest in self.player.quests:
@@ -3415,6 +7745,7 @@ class Game:
                         
                         for girl in self.bordello_girls:
                             girl.rest()
+                        self.advance_clock(self.REST_MINUTES)
                         
                         print(f"{Color.GREEN}Вы полностью отдохнули!{Color.END}")
                         print(f"{Color.CYAN}Все девушки восстановили силы.{Color.END}")
@@ -3424,9 +7755,6 @@ class Game:
                 time.sleep(2)
             
             elif choice == 5:
-                for girl in self.bordello_girls:
-                    if random.random() < 0.3:
-                        girl.rest()
                 break
     
     def travel(self):
@@ -3449,119 +7777,191 @@ class Game:
             
             print(f"\n{Color.CYAN}Доступные направления:{Color.END}")
             
-            available_locations = []
-            for i, loc_name in enumerate(current_loc.connections, 1):
-                location = self.game_world.get(loc_name)
-                if location:
-                    status = "✓" if location.discovered else "?"
-                    
-                    if self.player.level < location.level_range[0]:
-                        difficulty_warning = f" {Color.RED}(сложно){Color.END}"
-                    elif self.player.level < location.level_range[0] + 2:
-                        difficulty_warning = f" {Color.YELLOW}(нормально){Color.END}"
-                    else:
-                        difficulty_warning = f" {Color.GREEN}(легко){Color.END}"
-                    
-                    print(f"{i}. {loc_name} {status}{difficulty_warning}")
-                    available_locations.append(loc_name)
+            available_locations = self.world_graph.neighbors(self.player.location)
+            for i, location in enumerate(available_locations, 1):
+                status = "✓" if location.discovered else "?"
+                
+                difficulty_warning = ""
+                if location.enemies:
+                    estimates = self.battle_analyzer.estimate(self.player, location.enemies)
+                    label, label_color = self.difficulty_label({
+                        "win_chance": sum(e["win_chance"] for e in estimates) / len(estimates),
+                        "hp_lost": sum(e["hp_lost"] for e in estimates) / len(estimates)
+                    })
+                    difficulty_warning = f" {label_color}({label.lower()}){Color.END}"
+                
+                print(f"{i}. {location.name} {status}{difficulty_warning}")
             
-            print(f"\n{len(available_locations) + 1}. Отмена")
+            route_choice = len(available_locations) + 1
+            print(f"\n{route_choice}. Отправиться в открытую локацию")
+            print(f"{route_choice + 1}. Отмена")
             
-            choice = self.get_choice(1, len(available_locations) + 1)
+            choice = self.get_choice(1, route_choice + 1)
             
             if choice <= len(available_locations):
-                target_loc_name = available_locations[choice - 1]
-                target_loc = self.game_world[target_loc_name]
-                
-                difficulty_mult = {
-                    Difficulty.EASY: 0.8,
-                    Difficulty.NORMAL: 1.0,
-                    Difficulty.HARD: 1.2,
-                    Difficulty.INSANE: 1.5
-                }.get(self.player.difficulty, 1.0)
-                
-                required_level = int(target_loc.level_range[0] * difficulty_mult)
-                
-                if self.player.level < required_level:
-                    print(f"\n{Color.RED}Ваш уровень слишком низок для этой локации!{Color.END}")
-                    print(f"Ваш уровень: {self.player.level}")
-                    print(f"Требуется уровень: {required_level}")
-                    print(f"Рекомендуется сначала повысить уровень.")
-                    
-                    confirm = input("Всё равно отправиться? (y/n): ")
-                    if confirm.lower() != 'y':
-                        continue
-                
-                print(f"\n{Color.YELLOW}Вы отправляетесь в {target_loc_name}...{Color.END}")
-                time.sleep(1)
-                
-                events = [
-                    ("Вы безопасно добрались до места", 0.5),
-                    ("В пути вы нашли немного золота", 0.15),
-                    ("На вас напали разбойники!", 0.1),
-                    ("Вы заблудились и вернулись назад", 0.05),
-                    ("Вы нашли короткий путь", 0.05),
-                    ("Вы встретили странного торговца", 0.05),
-                    ("Вы наткнулись на лагерь искателей приключений", 0.05),
-                    ("Вы обнаружили тайник с припасами", 0.05)
-                ]
-                
-                event = random.choices(
-                    [e[0] for e in events],
-                    weights=[e[1] for e in events]
-                )[0]
-                
-                print(f"{Color.CYAN}{event}{Color.END}")
-                
-                if "золота" in event:
-                    gold = random.randint(10, 50) + (self.player.level * 2)
-                    self.player.gold += gold
-                    print(f"{Color.YELLOW}+{gold} золота{Color.END}")
-                
-                elif "разбойники" in event:
-                    time.sleep(1)
-                    bandit_level = min(self.player.level + 1, target_loc.level_range[1])
-                    bandit = Enemy(EnemyType.BANDIT, bandit_level, self.player.difficulty)
-                    print(f"\n{Color.RED}На вас напали разбойники уровня {bandit_level}!{Color.END}")
-                    self.battle(bandit, target_loc)
-                    if self.player.health <= 0:
-                        return
-                
-                elif "вернулись" in event:
-                    print(f"{Color.YELLOW}Вы возвращаетесь в {self.player.location}.{Color.END}")
-                    time.sleep(1)
+                target_loc = available_locations[choice - 1]
+                if not self.confirm_travel_level(target_loc):
                     continue
                 
-                elif "торговца" in event:
-                    print(f"{Color.GREEN}Странный торговец предлагает вам товары по низким ценам!{Color.END}")
-                
-                elif "лагерь" in event:
-                    print(f"{Color.CYAN}Искатели приключений делятся с вами припасами.{Color.END}")
-                    self.player.heal(30)
-                    print(f"{Color.GREEN}+30 здоровья{Color.END}")
-                
-                elif "тайник" in event:
-                    print(f"{Color.GREEN}Вы нашли тайник с припасами!{Color.END}")
-                    potions = ["Зелье здоровья", "Зелье маны"]
-                    for potion_name in random.sample(potions, random.randint(1, 2)):
-                        if potion_name in self.items_db:
-                            potion = self.items_db[potion_name].copy()
-                            self.player.add_item(potion)
-                            print(f"{Color.CYAN}+ {potion.name}{Color.END}")
-                
-                self.player.location = target_loc_name
-                target_loc.discovered = True
-                
-                if target_loc.should_respawn():
-                    print(f"{Color.YELLOW}В локации появились новые враги.{Color.END}")
-                
-                print(f"\n{Color.GREEN}Вы прибыли в {target_loc_name}!{Color.END}")
-                time.sleep(1)
+                outcome = self.travel_step(target_loc)
+                if outcome == "dead":
+                    return
+                if outcome == "lost":
+                    continue
                 break
             
+            elif choice == route_choice:
+                if self.travel_route():
+                    break
+            
             else:
                 break
     
+    def required_travel_level(self, location: Location) -> int:
+        """Рекомендуемый уровень для локации с учетом сложности"""
+        difficulty_mult = {
+            Difficulty.EASY: 0.8,
+            Difficulty.NORMAL: 1.0,
+            Difficulty.HARD: 1.2,
+            Difficulty.INSANE: 1.5
+        }.get(self.player.difficulty, 1.0)
+        
+        return int(location.level_range[0] * difficulty_mult)
+    
+    def confirm_travel_level(self, location: Location) -> bool:
+        """Предупреждение о слишком сложной локации; False - игрок передумал"""
+        required_level = self.required_travel_level(location)
+        
+        if self.player.level < required_level:
+            print(f"\n{Color.RED}Ваш уровень слишком низок для локации {location.name}!{Color.END}")
+            print(f"Ваш уровень: {self.player.level}")
+            print(f"Требуется уровень: {required_level}")
+            print(f"Рекомендуется сначала повысить уровень.")
+            
+            confirm = input("Всё равно отправиться? (y/n): ")
+            if confirm.lower() != 'y':
+                return False
+        return True
+    
+    def travel_route(self) -> bool:
+        """Выбор открытой локации и переход к ней по кратчайшему маршруту через открытые
+        
+        Возвращает True, если путешествие состоялось (даже прерванное в пути).
+        """
+        graph = self.world_graph
+        current = self.player.location
+        
+        self.clear_screen()
+        self.print_header("МАРШРУТ")
+        
+        targets = [name for name in graph.discovered if name != current]
+        hops = graph.distances(current, targets, discovered_only=True)
+        destinations = sorted(hops, key=lambda name: (hops[name], name))
+        
+        if not destinations:
+            print(f"{Color.YELLOW}Нет открытых локаций, куда можно добраться известными дорогами{Color.END}")
+            time.sleep(1)
+            return False
+        
+        for i, name in enumerate(destinations, 1):
+            print(f"{i}. {name} ({hops[name]} перех.)")
+        print(f"\n{len(destinations) + 1}. Отмена")
+        
+        choice = self.get_choice(1, len(destinations) + 1)
+        if choice > len(destinations):
+            return False
+        
+        route = graph.route(current, destinations[choice - 1], discovered_only=True)
+        stops = [self.game_world[name] for name in route[1:]]
+        hardest = max(stops, key=lambda location: location.level_range[0])
+        if not self.confirm_travel_level(hardest):
+            return False
+        
+        print(f"\n{Color.CYAN}Маршрут: {' -> '.join(route)}{Color.END}")
+        for step, location in enumerate(stops, 1):
+            print(f"\n{Color.BOLD}Переход {step}/{len(stops)}{Color.END}")
+            outcome = self.travel_step(location)
+            if outcome == "dead":
+                return True
+            if outcome == "lost":
+                print(f"{Color.YELLOW}Путешествие прервано в {self.player.location}.{Color.END}")
+                time.sleep(1)
+                return True
+        return True
+    
+    def travel_step(self, target_loc: Location) -> str:
+        """Один переход в соседнюю локацию с дорожным событием
+        
+        Возвращает "arrived", "lost" (игрок остался на месте) или "dead".
+        """
+        target_loc_name = target_loc.name
+        print(f"\n{Color.YELLOW}Вы отправляетесь в {target_loc_name}...{Color.END}")
+        time.sleep(1)
+        self.advance_clock(self.TRAVEL_MINUTES)
+        
+        events = [
+            ("Вы безопасно добрались до места", 0.5),
+            ("В пути вы нашли немного золота", 0.15),
+            ("На вас напали разбойники!", 0.1),
+            ("Вы заблудились и вернулись назад", 0.05),
+            ("Вы нашли короткий путь", 0.05),
+            ("Вы встретили странного торговца", 0.05),
+            ("Вы наткнулись на лагерь искателей приключений", 0.05),
+            ("Вы обнаружили тайник с припасами", 0.05)
+        ]
+        
+        event = RNG.events.choices(
+            [e[0] for e in events],
+            weights=[e[1] for e in events]
+        )[0]
+        
+        print(f"{Color.CYAN}{event}{Color.END}")
+        
+        if "золота" in event:
+            gold = RNG.loot.randint(10, 50) + (self.player.level * 2)
+            self.player.gold += gold
+            print(f"{Color.YELLOW}+{gold} золота{Color.END}")
+        
+        elif "разбойники" in event:
+            time.sleep(1)
+            bandit_level = min(self.player.level + 1, target_loc.level_range[1])
+            bandit = Enemy(EnemyType.BANDIT, bandit_level, self.player.difficulty)
+            print(f"\n{Color.RED}На вас напали разбойники уровня {bandit_level}!{Color.END}")
+            self.battle(bandit, target_loc)
+            if self.player.health <= 0:
+                return "dead"
+        
+        elif "вернулись" in event:
+            print(f"{Color.YELLOW}Вы возвращаетесь в {self.player.location}.{Color.END}")
+            time.sleep(1)
+            return "lost"
+        
+        elif "торговца" in event:
+            print(f"{Color.GREEN}Странный торговец предлагает вам товары по низким ценам!{Color.END}")
+        
+        elif "лагерь" in event:
+            print(f"{Color.CYAN}Искатели приключений делятся с вами припасами.{Color.END}")
+            self.player.heal(30)
+            print(f"{Color.GREEN}+30 здоровья{Color.END}")
+        
+        elif "тайник" in event:
+            print(f"{Color.GREEN}Вы нашли тайник с припасами!{Color.END}")
+            potions = ["Зелье здоровья", "Зелье маны"]
+            for potion_name in RNG.loot.sample(potions, RNG.loot.randint(1, 2)):
+                if potion_name in self.items_db:
+                    potion = self.items_db[potion_name].copy()
+                    self.player.add_item(potion)
+                    print(f"{Color.CYAN}+ {potion.name}{Color.END}")
+        
+        self.player.location = target_loc_name
+        self.load_world_around(target_loc_name)
+        self.world_graph.discover(target_loc_name)
+        self.populations.visit(target_loc, self.world_graph.neighbors(target_loc_name))
+        
+        print(f"\n{Color.GREEN}Вы прибыли в {target_loc_name}!{Color.END}")
+        time.sleep(1)
+        return "arrived"
+    
     # ОПТИМИЗАЦИЯ: методы сохранения/загрузки
     def save_game(self):
         """Сохранение игры"""
@@ -3573,6 +7973,7 @@ class Game:
         save_data = {
             "version": self.version,
             "difficulty": self.player.difficulty.value,
+            "clock": self.timers.now,
             "player": {
                 "name": self.player.name,
                 "level": self.player.level,
@@ -3585,6 +7986,7 @@ class Game:
                 "gold": self.player.gold,
                 "character_class": self.player.character_class.value if self.player.character_class else None,
                 "stats": self.player.stats,
+                "modifiers": self.player.modifiers.to_list(),
                 "location": self.player.location,
                 "killed_enemies": self.player.killed_enemies,
                 "play_time": self.player.play_time + (datetime.now() - self.game_start_time).seconds if self.game_start_time else 0,
@@ -3626,6 +8028,7 @@ class Game:
                     "id": quest.id,
                     "status": quest.status.value,
                     "start_time": quest.start_time.isoformat() if quest.start_time else None,
+                    "deadline": quest.deadline,
                     "completed_objectives": quest.completed_objectives,
                     "objectives": quest.objectives
                 }
@@ -3642,16 +8045,10 @@ class Game:
                     "completion_date": achievement.completion_date.isoformat() if achievement.completion_date else None
                 }
                 for achievement in self.player.achievements
-            ],
-            "game_world": {
-                loc_name: {
-                    "discovered": loc.discovered,
-                    "cleared": loc.cleared,
-                    "respawn_timer": loc.respawn_timer
-                }
-                for loc_name, loc in self.game_world.items()
-            }
+            ]
         }
+        if self.world_generator is not None:
+            save_data["world"] = {"seed": self.world_generator.seed, "size": self.world_generator.size}
         
         save_dir = "saves"
         os.makedirs(save_dir, exist_ok=True)
@@ -3659,6 +8056,8 @@ class Game:
         save_file = os.path.join(save_dir, f"save_{self.player.save_slot}.json")
         
         try:
+            # Состояние мира - отдельными файлами чанков, переписываются только измененные
+            self.world_state.save(self.world_save_dir(self.player.save_slot))
             with open(save_file, 'w', encoding='utf-8') as f:
                 json.dump(save_data, f, ensure_ascii=False, indent=2)
             
@@ -3820,7 +8219,7 @@ class Game:
             }
             self.player.character_class = class_map.get(player_data["character_class"])
             
-            self.player.stats = player_data["stats"]
+            self.player.set_stats(player_data["stats"], player_data.get("modifiers"), save_data.get("clock", 0))
             self.player.location = player_data["location"]
             self.player.killed_enemies = player_data.get("killed_enemies", {})
             self.player.save_slot = player_data.get("save_slot", slot)
@@ -3860,7 +8259,7 @@ class Game:
                             if "special_effect" in item_data:
                                 item.special_effect = item_data["special_effect"]
                             
-                            self.player.equipped[slot_name] = item
+                            self.player.set_equipped(slot_name, item)
                             self.player.inventory.remove(item)
                             break
             
@@ -3875,6 +8274,7 @@ class Game:
                     if start_time_str:
                         quest.start_time = datetime.fromisoformat(start_time_str)
                     
+                    quest.deadline = quest_data.get("deadline", 0)
                     quest.completed_objectives = quest_data.get("completed_objectives", {})
                     quest.objectives = quest_data.get("objectives", {})
                     self.player.quests.append(quest)
@@ -3898,11 +8298,42 @@ class Game:
                 
                 self.player.achievements.append(achievement)
             
-            for loc_name, loc_data in save_data.get("game_world", {}).items():
-                if loc_name in self.game_world:
-                    self.game_world[loc_name].discovered = loc_data.get("discovered", False)
-                    self.game_world[loc_name].cleared = loc_data.get("cleared", False)
-                    self.game_world[loc_name].respawn_timer = loc_data.get("respawn_timer", 0)
+            world = save_data.get("world")
+            generator = self.world_generator
+            if world and (generator is None or (generator.seed, generator.size) != (world["seed"], world["size"])):
+                self.generate_world(world["seed"], world["size"])
+            elif not world and generator is not None:
+                self.world_generator = None
+                self.world_chunks = {}
+                self.world_state = WorldState(self.world_chunk_key, keep_seeds=True)
+                self.game_world = {}
+                self.populations = PopulationTracker()
+                self.initialize_world()
+            
+            # Читаются только записанные чанки - области, где игрок что-то изменил
+            world_data = self.world_state.load(self.world_save_dir(slot))
+            legacy = save_data.get("game_world")  # Сохранения, где мир записан целиком
+            if legacy is not None:
+                world_data = legacy
+            
+            if self.world_generator is not None:
+                for loc_name in world_data:
+                    if self.world_generator.position_of(loc_name) is not None:
+                        self.load_world_chunk(self.world_generator.chunk_of(loc_name))
+            if world_data:
+                self.world_graph.reset_discovered([loc_name for loc_name, loc_data in world_data.items()
+                                                   if loc_data.get("discovered", False)])
+            for loc_name, loc in self.game_world.items():
+                loc.restore(world_data.get(loc_name, {}))
+            
+            self.world_state.dirty.clear()  # Загруженное состояние совпадает с файлами чанков
+            if legacy is not None:
+                self.world_state.directory = None  # Следующее сохранение запишет все чанки
+                for loc_name in legacy:
+                    if loc_name in self.game_world:
+                        self.game_world[loc_name].mark_changed()
+            self.load_world_around(self.player.location)
+            self.restore_timers(save_data.get("clock", 0))
             
             self.game_start_time = datetime.now()
             
@@ -4022,6 +8453,7 @@ class Game:
                 save_file = os.path.join(save_dir, f"save_{save_slot}.json")
                 try:
                     os.remove(save_file)
+                    shutil.rmtree(self.world_save_dir(save_slot), ignore_errors=True)
                     print(f"{Color.GREEN}Сохранение удалено!{Color.END}")
                     
                     if self.player and self.player.save_slot == save_slot:
@@ -4042,6 +8474,7 @@ class Game:
                     if os.path.exists(save_file):
                         try:
                             os.remove(save_file)
+                            shutil.rmtree(self.world_save_dir(slot), ignore_errors=True)
                             deleted += 1
                         except:
                             pass
@@ -4138,6 +8571,11 @@ class Game:
                         with open(target_file, 'w', encoding='utf-8') as f:
                             json.dump(save_data, f, ensure_ascii=False, indent=2)
                         
+                        target_world = self.world_save_dir(target_slot)
+                        shutil.rmtree(target_world, ignore_errors=True)
+                        if os.path.isdir(self.world_save_dir(source_slot)):
+                            shutil.copytree(self.world_save_dir(source_slot), target_world)
+                        
                         print(f"{Color.GREEN}Сохранение успешно скопировано!{Color.END}")
                     except Exception as e:
                         print(f"{Color.RED}Ошибка при копировании: {e}{Color.END}")
@@ -4230,13 +8668,14 @@ class Game:
         
         print(f"\n{Color.YELLOW}ХАРАКТЕРИСТИКИ ПЕРСОНАЖА:{Color.END}")
         print("• Сила - увеличивает урон в ближнем бою")
-        print("• Ловкость - увеличивает шанс крита и уклонения")
+        print("• Ловкость - увеличивает шанс крита, уклонения и скорость ходов")
         print("• Интеллект - увеличивает ману и эффективность магии")
         print("• Телосложение - увеличивает здоровье и защиту")
         print("• Удача - увеличивает шанс на редкий лут и крит")
         
         print(f"\n{Color.YELLOW}СИСТЕМА БОЯ:{Color.END}")
         print("• Каждый ход вы можете атаковать, использовать предмет или умение")
+        print("• Очередность ходов зависит от скорости: быстрые ходят чаще медленных")
         print("• У каждого класса есть уникальные умения")
         print("• Некоторые враги имеют особые способности")
         print("• Вы можете попытаться сбежать из боя")
@@ -4391,6 +8830,13 @@ class Game:
             print(f"Здоровье: {health_bar}")
             print(f"Мана:     {mana_bar}")
             print(f"Золото: {Color.YELLOW}{self.player.gold}{Color.END}")
+            print(f"Время: {self.format_clock()}")
+            
+            for modifier in self.player.expire_modifiers():
+                print(f"{Color.YELLOW}Действие \"{modifier.source}\" закончилось{Color.END}")
+            for notice in self.notices:
+                print(f"{Color.YELLOW}{notice}{Color.END}")
+            self.notices.clear()
             
             if current_loc.cleared:
                 print(f"{Color.GREEN}✓ Локация очищена{Color.END}")
@@ -4424,6 +8870,7 @@ class Game:
             menu_actions.append(("Инвентарь", self.show_inventory, []))
             menu_actions.append(("Квесты", self.show_quests, []))
             menu_actions.append(("Достижения", self.show_achievements, []))
+            menu_actions.append(("Журнал боя", self.show_combat_log, []))
             menu_actions.append(("Сохранить игру", self.save_game_menu, []))
             menu_actions.append(("Выйти в главное меню", None, []))
             
@@ -4464,11 +8911,28 @@ class Game:
             input("Нажмите Enter для выхода...")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Драконовое заклинание")
+    parser.add_argument("--seed", type=int, default=None, help="зерно генераторов случайных чисел")
+    parser.add_argument("--world-size", type=int, default=0,
+                        help="сторона сгенерированного мира в локациях (0 - мир по умолчанию)")
+    parser.add_argument("--verify-replays", metavar="PATH", help="проверить записи боев из JSONL и выйти")
+    parser.add_argument("--compile-content", action="store_true",
+                        help="проверить data/*.json, пересобрать кэш каталога и выйти")
+    args = parser.parse_args()
+    if args.compile_content:
+        catalog = ContentCatalog.compile()
+        print(f"Каталог {catalog.digest[:12]}: предметов {len(catalog.items)}, локаций {len(catalog.world)}, "
+              f"квестов {len(catalog.quests)}, врагов {len(catalog.enemies)}")
+        sys.exit(0)
+    if args.verify_replays:
+        report = ReplayVerifier().verify(ReplayVerifier.load(args.verify_replays))
+        Game.print_replay_report(report)
+        sys.exit(1 if report["divergences"] else 0)
     try:
         print(f"{Color.CYAN}Загрузка игры 'Драконовое заклинание - Улучшенная версия 2.0.3'...{Color.END}")
         time.sleep(1)
         
-        game = Game()
+        game = Game(seed=args.seed, world_size=args.world_size)
         game.run()
         
         print(f"\n{Color.YELLOW}Игра завершена. До свидания!{Color.END}")
@@ -0,0 +1,103 @@
+"""Микробенчмарк диспетчеризации эффектов оружия и способностей врагов
+
+Сравнивает стоимость одной атаки при прежней цепочке if/elif по строке эффекта
+и при обработчике, разрешенном из реестра при создании предмета или врага.
+Ветки цепочки вызывают те же функции эффектов, что и реестр, поэтому разница -
+только цена выбора обработчика.
+
+Запуск: python benchmarks/bench_dispatch.py [--calls N]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from GAME import (RNG, Enemy, EnemyType, Item, ItemType, Player,  # noqa: E402
+                  WEAPON_EFFECTS)
+
+# Тела веток - те же функции, что зарегистрированы в реестре (с нынешними
+# бросками и модификатором удачи на время): сравнивается только диспетчеризация
+(FIRE_DAMAGE, MANA_STEAL, CRITICAL_CHANCE, POISON, LIFE_STEAL, STUN_CHANCE,
+ ARMOR_PENETRATION) = (WEAPON_EFFECTS.handlers[key].apply for key in (
+    "fire_damage", "mana_steal", "critical_chance", "poison", "life_steal", "stun_chance",
+    "armor_penetration"))
+
+def legacy_apply_special_effect(item, player, enemy=None):
+    """Прежняя цепочка сравнений строк из Item.apply_special_effect"""
+    if not item.special_effect:
+        return 0, ""
+
+    effect = item.special_effect
+    if effect == "fire_damage":
+        return FIRE_DAMAGE(item, player, enemy)
+    elif effect == "mana_steal":
+        return MANA_STEAL(item, player, enemy)
+    elif effect == "critical_chance":
+        return CRITICAL_CHANCE(item, player, enemy)
+    elif effect == "poison":
+        return POISON(item, player, enemy)
+    elif effect == "life_steal":
+        return LIFE_STEAL(item, player, enemy)
+    elif effect == "stun_chance":
+        return STUN_CHANCE(item, player, enemy)
+    elif effect == "armor_penetration":
+        return ARMOR_PENETRATION(item, player, enemy)
+
+    return 0, ""
+
+def registry_apply_special_effect(item, player, enemy=None):
+    """Путь Player.roll_attack: функция обработчика, связанная с предметом при создании"""
+    apply = item.effect_apply
+    if apply is None:
+        return 0, ""
+    return apply(item, player, enemy)
+
+def legacy_get_special_abilities(enemy):
+    """Прежнее построение списка способностей на каждый экземпляр"""
+    abilities = []
+    if enemy.type == EnemyType.DRAGON:
+        abilities.append("Огненное дыхание")
+    elif enemy.type == EnemyType.WITCH:
+        abilities.append("Магический щит")
+    elif enemy.type == EnemyType.NECROMANCER:
+        abilities.append("Воскрешение скелетов")
+    elif enemy.type == EnemyType.SPIDER:
+        abilities.append("Ядовитый укус")
+    elif enemy.type == EnemyType.SLIME:
+        abilities.append("Кислотная атака")
+    return abilities
+
+def per_call_ns(func, calls: int) -> float:
+    """Лучшее из трех измерений в наносекундах на вызов"""
+    return min(timeit.repeat(func, number=calls, repeat=3)) / calls * 1e9
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк диспетчеризации эффектов")
+    parser.add_argument("--calls", type=int, default=100000, help="вызовов на измерение")
+    args = parser.parse_args()
+
+    RNG.reseed(1)
+    player = Player("Бенчмарк")
+    player.stats["luck"] = 0
+    enemy = Enemy(EnemyType.NECROMANCER, 3)
+
+    print(f"{'эффект':<20}{'if/elif, нс':>14}{'реестр, нс':>14}{'ускорение':>12}")
+    for effect in WEAPON_EFFECTS.handlers:
+        weapon = Item("Тестовое оружие", ItemType.WEAPON, damage=10, special_effect=effect)
+        before = per_call_ns(lambda: legacy_apply_special_effect(weapon, player, enemy), args.calls)
+        after = per_call_ns(lambda: registry_apply_special_effect(weapon, player, enemy), args.calls)
+        enemy.active_effects.clear()
+        print(f"{effect:<20}{before:>14.0f}{after:>14.0f}{before / after:>11.2f}x")
+
+    print()
+    print(f"{'способности врага':<20}{'if/elif, нс':>14}{'реестр, нс':>14}{'ускорение':>12}")
+    for enemy_type in (EnemyType.GOBLIN, EnemyType.SLIME):
+        sample = Enemy(enemy_type)
+        before = per_call_ns(lambda: legacy_get_special_abilities(sample), args.calls)
+        after = per_call_ns(sample.get_special_abilities, args.calls)
+        print(f"{enemy_type.name:<20}{before:>14.0f}{after:>14.0f}{before / after:>11.2f}x")
+
+if __name__ == "__main__":
+    main()
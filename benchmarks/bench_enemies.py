@@ -0,0 +1,59 @@
+"""Бенчмарк создания врагов из кэшированных шаблонов
+
+Сравнивает поштучное создание Enemy(...) и пакетное Enemy.spawn(...) и
+показывает память на одного врага.
+
+Запуск: python benchmarks/bench_enemies.py [--count N]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from GAME import RNG, Enemy, EnemyType  # noqa: E402
+
+LEVELS = range(1, 11)
+
+def per_enemy_us(build, count: int) -> float:
+    """Время создания count врагов в микросекундах на врага"""
+    start = time.perf_counter()
+    build(count)
+    return (time.perf_counter() - start) / count * 1e6
+
+def build_single(count: int):
+    types = list(EnemyType)
+    return [Enemy(types[i % len(types)], LEVELS[i % len(LEVELS)]) for i in range(count)]
+
+def build_spawn(count: int):
+    combos = [(enemy_type, level) for enemy_type in EnemyType for level in LEVELS]
+    batch = count // len(combos)
+    enemies = []
+    for enemy_type, level in combos:
+        enemies.extend(Enemy.spawn(enemy_type, level, count=batch))
+    return enemies
+
+def bytes_per_enemy(count: int) -> int:
+    tracemalloc.start()
+    enemies = build_single(count)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current // len(enemies)
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк создания врагов")
+    parser.add_argument("--count", type=int, default=1000000, help="врагов на измерение")
+    args = parser.parse_args()
+
+    RNG.reseed(1)
+    single = per_enemy_us(build_single, args.count)
+    spawn = per_enemy_us(build_spawn, args.count)
+    print(f"{'способ':<20}{'мкс/враг':>12}{'всего, с':>12}")
+    print(f"{'Enemy(...)':<20}{single:>12.2f}{single * args.count / 1e6:>12.2f}")
+    print(f"{'Enemy.spawn(...)':<20}{spawn:>12.2f}{spawn * args.count / 1e6:>12.2f}")
+    print(f"\nпамять: {bytes_per_enemy(min(args.count, 100000))} байт/враг")
+
+if __name__ == "__main__":
+    main()
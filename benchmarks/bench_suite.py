@@ -0,0 +1,431 @@
+"""Набор бенчмарков горячих путей игры с базовой линией и порогом регрессии
+
+Каждый сценарий измеряется отдельно: операций в секунду (лучший из повторов) и
+пик памяти на операцию по tracemalloc. Перед каждым повтором RNG пересевается и
+состояние строится заново, поэтому все повторы и прогоны выполняют одну и ту же
+работу. Ввод, очистка экрана и паузы time.sleep отключены, вывод игры
+подавлен - терминал не нужен.
+
+Базовая линия зависит от машины и в репозиторий не входит: сохраните ее через
+--save до изменений, затем сравнивайте. Код выхода 1, если какая-то метрика
+ухудшилась больше чем на --threshold.
+
+--check N вместо замеров сверяет быстрый CombatEngine.simulate с полным
+CombatEngine.run на N боях с одного зерна (политики врагов включены); код
+выхода 1 при любом расхождении. --check-analyzer N так же сверяет оценки
+TurnDistributionAnalyzer с N боями resolve_plan для каждого эффекта оружия и
+каждой способности врага; код выхода 1, если разница больше статистического допуска.
+
+Запуск: python benchmarks/bench_suite.py [--save] [--baseline PATH] [--threshold 0.1]
+                                       [--only NAME ...] [--scale K] [--repeat N]
+        python benchmarks/bench_suite.py --check 3000
+        python benchmarks/bench_suite.py --check-analyzer 2000
+"""
+import argparse
+import builtins
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from GAME import (ENCOUNTER_TABLES, RNG, CharacterClass, CombatEngine, Enemy,  # noqa: E402
+                  EnemyType, Game, Item, ItemType, Location, LocationType, Player,
+                  TurnDistributionAnalyzer, WEAPON_EFFECTS, WorldGenerator, WorldGraph)
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+SEED = 1
+MEMORY_OPS = 200  # Операций в проходе с tracemalloc: он замедляет код в разы
+ALLOC_SLACK = 256  # Байт на операцию, которые не считаются регрессией памяти
+
+@contextlib.contextmanager
+def headless():
+    """Без терминала: паузы, очистка экрана и ввод отключены, вывод подавлен"""
+    saved = time.sleep, os.system, builtins.input
+    time.sleep = lambda *args: None
+    os.system = lambda *args: 0
+    builtins.input = lambda *args: ""
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        time.sleep, os.system, builtins.input = saved
+
+def make_player(level: int = 10, character_class: CharacterClass = CharacterClass.WARRIOR) -> Player:
+    player = Player("Бенчмарк")
+    player.set_class(character_class)
+    for _ in range(level - 1):
+        player.level_up()
+    return player
+
+# Сценарий: функция (ops) -> op, которая готовит состояние вне замера
+# и возвращает вызываемую ops раз операцию без аргументов
+
+def case_enemy_construction(ops: int):
+    combos = [(enemy_type, level) for enemy_type in EnemyType for level in range(1, 11)]
+    index = iter(range(ops * 2))
+    def op():
+        enemy_type, level = combos[next(index) % len(combos)]
+        Enemy(enemy_type, level)
+    return op
+
+def case_player_attack(ops: int):
+    player = make_player()
+    weapon = Item("Меч", ItemType.WEAPON, damage=12)
+    player.add_item(weapon)
+    player.equip_item(weapon)
+    enemy = Enemy(EnemyType.ORC, 10)
+    def op():
+        player.attack(enemy)
+    return op
+
+def case_player_take_damage(ops: int):
+    player = make_player()
+    armor = Item("Броня", ItemType.ARMOR, defense=8)
+    player.add_item(armor)
+    player.equip_item(armor)
+    def op():
+        player.health = player.max_health
+        player.take_damage(25)
+    return op
+
+def case_special_effect(ops: int):
+    player = make_player()
+    enemy = Enemy(EnemyType.NECROMANCER, 10)
+    weapons = [Item("Оружие", ItemType.WEAPON, damage=10, special_effect=effect)
+               for effect in WEAPON_EFFECTS.handlers]
+    index = iter(range(ops * 2))
+    def op():
+        weapons[next(index) % len(weapons)].apply_special_effect(player, enemy)
+        enemy.active_effects.clear()
+    return op
+
+def case_headless_battle(ops: int):
+    player = make_player()
+    types = list(EnemyType)
+    index = iter(range(ops * 2))
+    def op():
+        player.health = player.max_health
+        player.mana = player.max_mana
+        CombatEngine(player, Enemy(types[next(index) % len(types)], 8)).run(max_rounds=200)
+    return op
+
+def case_combat_resolve(ops: int):
+    # Бои «только атака» по готовым планам: классы, уровни и враги вперемешку
+    plans = []
+    for character_class in CharacterClass:
+        for level in (1, 5, 10, 20):
+            player = make_player(level, character_class)
+            plans.extend(CombatEngine.plan(CombatEngine.snapshot(player, Enemy(enemy_type, level)), 200)
+                         for enemy_type in EnemyType)
+    rng = RNG.analysis
+    index = iter(range(ops * 2))
+    def op():
+        CombatEngine.resolve_plan(plans[next(index) % len(plans)], rng)
+    return op
+
+def case_victory_loot(ops: int):
+    game = Game()
+    game.player = make_player()
+    location = game.game_world["Темный лес"]
+    types = list(EnemyType)
+    index = iter(range(ops * 2))
+    def op():
+        player = game.player
+        player.inventory.clear()
+        player.xp = 0
+        enemy = Enemy(types[next(index) % len(types)], 10)
+        location.enemies.append(enemy)
+        game.victory(enemy, location)
+    return op
+
+def case_generate_enemies(ops: int):
+    location = Location("Поле", LocationType.FOREST, (1, 10), "Бенчмарк")
+    def op():
+        location.enemies.clear()
+        location.generate_enemies()
+    return op
+
+def case_encounter_sample(ops: int):
+    types = list(LocationType)
+    rng = RNG.world
+    index = iter(range(ops * 2))
+    def op():
+        step = next(index)
+        ENCOUNTER_TABLES.sample(types[step % len(types)], 1 + step % 20, rng)
+    return op
+
+def case_encounter_bulk(ops: int):
+    def op():
+        ENCOUNTER_TABLES.sample_many(LocationType.FOREST, 5, 1000)
+    return op
+
+def case_world_chunk(ops: int):
+    generator = WorldGenerator(SEED, 8192)
+    index = iter(range(ops * 2))
+    def op():
+        generator.chunk(next(index), 1)
+    return op
+
+def case_world_route(ops: int):
+    # Меню маршрута (Game.travel_route) с холодным кэшем: расстояния до всех открытых
+    # локаций и маршрут к одной из них. Загружено больше всего чанков, сколько держит
+    # игра (WORLD_UNLOAD_RADIUS вокруг игрока), и все они открыты - худший случай
+    generator = WorldGenerator(SEED, 120)
+    graph = WorldGraph({}, partial=True)
+    graph.add_locations([location for chunk in generator.chunks_around((0, 0), Game.WORLD_UNLOAD_RADIUS)
+                         for location in generator.chunk(*chunk)])
+    names = list(graph.index)
+    graph.reset_discovered(names)
+    rng = RNG.analysis
+    pairs = [(rng.choice(names), rng.choice(names)) for _ in range(ops)]
+    index = iter(range(ops))
+    def op():
+        current, target = pairs[next(index)]
+        graph.forget_routes(discovered_only=True)  # Каждое меню строится заново
+        graph.distances(current, names, discovered_only=True)
+        graph.route(current, target, discovered_only=True)
+    return op
+
+# Имя -> (сценарий, операций в повторе при --scale 1)
+CASES = {
+    "enemy_construction": (case_enemy_construction, 20000),
+    "player_attack": (case_player_attack, 20000),
+    "player_take_damage": (case_player_take_damage, 20000),
+    "apply_special_effect": (case_special_effect, 20000),
+    "headless_battle": (case_headless_battle, 1000),
+    "combat_resolve": (case_combat_resolve, 20000),
+    "victory_loot": (case_victory_loot, 1000),
+    "generate_enemies": (case_generate_enemies, 2000),
+    "encounter_sample": (case_encounter_sample, 20000),
+    "encounter_bulk": (case_encounter_bulk, 200),
+    "world_chunk": (case_world_chunk, 200),
+    "world_route": (case_world_route, 400)
+}
+
+def ops_per_sec(case, ops: int, repeat: int) -> float:
+    """Лучшая скорость из repeat повторов; каждый с нового зерна и состояния"""
+    best = 0.0
+    for _ in range(repeat):
+        RNG.reseed(SEED)
+        op = case(ops)
+        start = time.perf_counter()
+        for _ in range(ops):
+            op()
+        best = max(best, ops / (time.perf_counter() - start))
+    return best
+
+def bytes_per_op(case, ops: int) -> float:
+    """Средний пик памяти одной операции сверх уже занятой"""
+    RNG.reseed(SEED)
+    op = case(ops)
+    total = 0
+    tracemalloc.start()
+    try:
+        for _ in range(ops):
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            op()
+            total += tracemalloc.get_traced_memory()[1] - current
+    finally:
+        tracemalloc.stop()
+    return total / ops
+
+def measure(names, scale: float, repeat: int) -> dict:
+    results = {}
+    with headless():
+        for name in names:
+            case, ops = CASES[name]
+            ops = max(1, int(ops * scale))
+            results[name] = {
+                "ops_per_sec": ops_per_sec(case, ops, repeat),
+                "bytes_per_op": bytes_per_op(case, min(ops, MEMORY_OPS))
+            }
+    return results
+
+def regressions(results: dict, baseline: dict, threshold: float) -> list:
+    """Метрики, ухудшившиеся больше чем на threshold относительно базовой линии"""
+    found = []
+    for name, metrics in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if metrics["ops_per_sec"] < base["ops_per_sec"] * (1 - threshold):
+            found.append((name, "ops_per_sec", base["ops_per_sec"], metrics["ops_per_sec"]))
+        limit = base["bytes_per_op"] * (1 + threshold) + ALLOC_SLACK
+        if metrics["bytes_per_op"] > limit:
+            found.append((name, "bytes_per_op", base["bytes_per_op"], metrics["bytes_per_op"]))
+    return found
+
+def load_baseline(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["cases"]
+
+def save_baseline(path: str, results: dict, merge: dict):
+    data = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cases": {**merge, **results}
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+def print_report(results: dict, baseline: dict):
+    print(f"{'сценарий':<22}{'опер/с':>12}{'база':>12}{'изм.':>8}{'байт/опер':>12}{'база':>10}")
+    for name, metrics in results.items():
+        base = baseline.get(name)
+        line = f"{name:<22}{metrics['ops_per_sec']:>12.0f}"
+        if base:
+            change = metrics["ops_per_sec"] / base["ops_per_sec"] - 1
+            line += f"{base['ops_per_sec']:>12.0f}{change:>+8.1%}"
+        else:
+            line += f"{'-':>12}{'-':>8}"
+        line += f"{metrics['bytes_per_op']:>12.0f}"
+        line += f"{base['bytes_per_op']:>10.0f}" if base else f"{'-':>10}"
+        print(line)
+
+def check_equivalence(fights: int) -> list:
+    """Бои «только атака» через CombatEngine.run и CombatEngine.simulate с одного зерна
+    
+    Классы, уровни, ловкость, эффекты оружия и типы врагов перебираются по номеру
+    боя. Возвращает расхождения: (номер, эффект, враг, simulate, run).
+    """
+    effects = [None] + list(WEAPON_EFFECTS.handlers)
+    classes = list(CharacterClass)
+    types = list(EnemyType)
+    mismatches = []
+    with headless():
+        for seed in range(fights):
+            RNG.reseed(seed)
+            player = make_player(1 + seed % 10, classes[seed % len(classes)])
+            player.stats["dexterity"] += 5 * (seed % 12)
+            player.update_derived_stats()
+            player.health = player.max_health
+            weapon = Item("Проверка", ItemType.WEAPON, damage=8 + seed % 17,
+                          special_effect=effects[seed % len(effects)])
+            player.add_item(weapon)
+            player.equip_item(weapon)
+            enemy = Enemy(types[seed % len(types)], 1 + seed % 10)
+            start_health = player.health
+            
+            RNG.reseed(seed * 7)
+            expected = CombatEngine.simulate(player, enemy)
+            RNG.reseed(seed * 7)
+            engine = CombatEngine(player, enemy)
+            engine.run()
+            actual = (engine.outcome == "victory", engine.round, start_health - player.health)
+            if actual != expected:
+                mismatches.append((seed, weapon.special_effect, enemy.type.name, expected, actual))
+    return mismatches
+
+def check_analyzer(fights: int) -> list:
+    """Оценки TurnDistributionAnalyzer против fights боев CombatEngine.resolve_plan
+    
+    Перебираются воин и маг первого уровня, оружие с каждым эффектом (и без
+    эффекта) и все типы врагов на трех уровнях, то есть каждая способность.
+    Допуск - четыре стандартные ошибки разности: выборки resolve_plan и, если
+    анализатор сам оценивает бой выборкой, его SAMPLE_FIGHTS боев. Возвращает
+    расхождения: (класс, эффект, враг, уровень, метрика, анализатор, resolve_plan).
+    """
+    effects = [None] + list(WEAPON_EFFECTS.handlers)
+    mismatches = []
+    with headless():
+        for character_class in (CharacterClass.WARRIOR, CharacterClass.MAGE):
+            for effect in effects:
+                for enemy_type in EnemyType:
+                    for level in (2, 8, 16):
+                        RNG.reseed(level)
+                        player = make_player(1, character_class)
+                        weapon = Item("Проверка", ItemType.WEAPON, damage=6, special_effect=effect)
+                        player.add_item(weapon)
+                        player.equip_item(weapon)
+                        snapshot = CombatEngine.snapshot(player, Enemy(enemy_type, level))
+                        
+                        analyzer = TurnDistributionAnalyzer()
+                        estimate = analyzer._analyze(snapshot)
+                        plan = CombatEngine.plan(snapshot, analyzer.max_rounds)
+                        rng = random.Random(level + 1)
+                        samples = [CombatEngine.resolve_plan(plan, rng) for _ in range(fights)]
+                        weight = 1 / fights
+                        if not analyzer.is_exact(snapshot):
+                            weight += 1 / analyzer.SAMPLE_FIGHTS
+                        
+                        start_health = snapshot[6]
+                        for metric, values, floor in (
+                                ("win_chance", [float(won) for won, _, _ in samples], 0.01),
+                                ("hp_lost", [min(max(lost, 0), start_health) for _, _, lost in samples], 0.5)):
+                            mean = sum(values) / fights
+                            spread = (sum((value - mean) ** 2 for value in values) / fights) ** 0.5
+                            if abs(estimate[metric] - mean) > 4 * spread * weight ** 0.5 + floor:
+                                mismatches.append((character_class.name, effect, enemy_type.name, level,
+                                                   metric, estimate[metric], mean))
+    return mismatches
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки горячих путей с проверкой регрессий")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="JSON с базовой линией")
+    parser.add_argument("--save", action="store_true", help="записать результаты как базовую линию")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="допустимое ухудшение метрики, доля (0.1 = 10%%)")
+    parser.add_argument("--only", nargs="+", choices=list(CASES), default=list(CASES),
+                        help="запустить только эти сценарии")
+    parser.add_argument("--scale", type=float, default=1.0, help="множитель числа операций")
+    parser.add_argument("--repeat", type=int, default=3, help="повторов замера скорости")
+    parser.add_argument("--check", type=int, metavar="N",
+                        help="вместо замеров сверить CombatEngine.run и simulate на N боях")
+    parser.add_argument("--check-analyzer", type=int, metavar="N",
+                        help="вместо замеров сверить TurnDistributionAnalyzer с N боями resolve_plan на матчап")
+    args = parser.parse_args()
+
+    if args.check_analyzer is not None:
+        mismatches = check_analyzer(args.check_analyzer)
+        for character_class, effect, enemy_type, level, metric, expected, actual in mismatches[:20]:
+            print(f"  {character_class} ({effect}) против {enemy_type} ур. {level}, {metric}: "
+                  f"анализатор {expected:.3f}, resolve_plan {actual:.3f}")
+        if mismatches:
+            print(f"расхождений анализатора и resolve_plan: {len(mismatches)}")
+            sys.exit(1)
+        print("анализатор совпал с resolve_plan для всех эффектов и способностей")
+        return
+
+    if args.check is not None:
+        mismatches = check_equivalence(args.check)
+        for seed, effect, enemy_type, expected, actual in mismatches[:20]:
+            print(f"  бой {seed} ({effect}, {enemy_type}): simulate {expected}, run {actual}")
+        if mismatches:
+            print(f"расхождений run и simulate: {len(mismatches)} из {args.check}")
+            sys.exit(1)
+        print(f"run и simulate совпали на {args.check} боях")
+        return
+
+    baseline = load_baseline(args.baseline)
+    results = measure(args.only, args.scale, args.repeat)
+    print_report(results, baseline)
+
+    if args.save:
+        save_baseline(args.baseline, results, baseline)
+        print(f"\nбазовая линия сохранена: {args.baseline}")
+        return
+
+    if not baseline:
+        print(f"\nбазовой линии нет ({args.baseline}), сравнение пропущено; создайте ее через --save")
+        return
+
+    found = regressions(results, baseline, args.threshold)
+    if found:
+        print(f"\nрегрессии больше {args.threshold:.0%}:")
+        for name, metric, before, after in found:
+            print(f"  {name}.{metric}: {before:.1f} -> {after:.1f}")
+        sys.exit(1)
+    print(f"\nрегрессий больше {args.threshold:.0%} нет")
+
+if __name__ == "__main__":
+    main()
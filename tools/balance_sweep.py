@@ -0,0 +1,131 @@
+"""Баланс-прогон: класс × сложность × тип врага × уровень без интерфейса
+
+Для каждой клетки сетки собирается персонаж нужного уровня в лучшем доступном
+ему снаряжении из items_db и проводится серия боев «только атака» против врага
+того же уровня через BattleEstimator. Клетки (класс, сложность, уровень)
+раздаются пулу процессов; у каждой свое зерно, выведенное из --seed, поэтому
+результат не зависит от числа процессов и порядка выполнения. Бои всегда идут
+последовательно через CombatEngine.resolve_plan, без векторного пути NumPy:
+векторные бои тянут броски из другого потока, и CSV с тем же --seed зависел бы
+от того, установлен ли NumPy.
+
+Запуск: python tools/balance_sweep.py [--seed N] [--fights N] [--levels A-B]
+                                      [--workers N] [--output balance.csv]
+"""
+import argparse
+import contextlib
+import csv
+import io
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from GAME import (BattleEstimator, CharacterClass, Difficulty, EnemyType,  # noqa: E402
+                  Enemy, Game, ItemType, Player)
+
+GEAR_TYPES = (ItemType.WEAPON, ItemType.ARMOR, ItemType.HELMET, ItemType.GLOVES, ItemType.BOOTS)
+FIELDS = ["class", "difficulty", "level", "enemy", "win_rate", "avg_rounds", "avg_hp_lost", "gear"]
+
+_items = None  # items_db процесса-исполнителя
+
+def _load_items():
+    """Один каталог предметов на процесс"""
+    global _items
+    with contextlib.redirect_stdout(io.StringIO()):
+        _items = Game().items_db
+
+def best_gear(items: dict, character_class: CharacterClass, level: int) -> list:
+    """Сильнейшее оружие и самая крепкая вещь каждого слота, доступные классу на уровне"""
+    best = {}
+    for item in items.values():
+        if (item.item_type not in GEAR_TYPES or item.required_level > level
+                or not item.is_suitable_for_class(character_class)):
+            continue
+        power = item.damage if item.item_type == ItemType.WEAPON else item.defense
+        current = best.get(item.item_type)
+        if current is None or power > current[0]:
+            best[item.item_type] = (power, item)
+    return [item for _, item in best.values()]
+
+def build_player(items: dict, character_class: CharacterClass, difficulty: Difficulty, level: int) -> Player:
+    """Персонаж, прокачанный обычными повышениями уровня и одетый в best_gear"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        player = Player("Баланс", difficulty)
+        player.set_class(character_class)
+        for _ in range(level - 1):
+            player.level_up()
+        for item in best_gear(items, character_class, level):
+            item = item.copy()
+            player.add_item(item)
+            player.equip_item(item)
+    return player
+
+def cell_seed(seed: int, character_class: CharacterClass, difficulty: Difficulty, level: int) -> int:
+    """Зерно клетки сетки, не зависящее от порядка выполнения"""
+    return random.Random(f"{seed}:{character_class.name}:{difficulty.name}:{level}").getrandbits(64)
+
+def run_cell(task: tuple) -> list:
+    """Все типы врагов для одной тройки (класс, сложность, уровень)"""
+    seed, fights, character_class, difficulty, level = task
+    if _items is None:
+        _load_items()
+    player = build_player(_items, character_class, difficulty, level)
+    gear = "; ".join(item.name for item in player.equipped.values() if item)
+
+    estimator = BattleEstimator(fights=fights, seed=cell_seed(seed, character_class, difficulty, level),
+                                vectorized=False)
+    estimator.fallback_fights = fights
+    enemies = [Enemy(enemy_type, level, difficulty) for enemy_type in EnemyType]
+    estimates = estimator.estimate(player, enemies)
+
+    return [
+        {
+            "class": character_class.name,
+            "difficulty": difficulty.name,
+            "level": level,
+            "enemy": enemy.type.name,
+            "win_rate": f"{estimate['win_chance']:.4f}",
+            "avg_rounds": f"{estimate['rounds']:.2f}",
+            "avg_hp_lost": f"{estimate['hp_lost']:.1f}",
+            "gear": gear
+        }
+        for enemy, estimate in zip(enemies, estimates)
+    ]
+
+def parse_levels(text: str) -> range:
+    low, _, high = text.partition("-")
+    return range(int(low), int(high or low) + 1)
+
+def main():
+    parser = argparse.ArgumentParser(description="Баланс-прогон боев по всей сетке параметров")
+    parser.add_argument("--seed", type=int, default=1, help="зерно прогона")
+    parser.add_argument("--fights", type=int, default=2000, help="боев на клетку")
+    parser.add_argument("--levels", type=parse_levels, default=range(1, 21), help="уровни, например 1-20")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="процессов в пуле")
+    parser.add_argument("--output", default="balance.csv", help="CSV с результатами")
+    args = parser.parse_args()
+
+    tasks = [(args.seed, args.fights, character_class, difficulty, level)
+             for character_class in CharacterClass
+             for difficulty in Difficulty
+             for level in args.levels]
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_load_items) as pool:
+        cells = list(pool.map(run_cell, tasks, chunksize=max(1, len(tasks) // (args.workers * 4))))
+
+    with open(args.output, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        for rows in cells:
+            writer.writerows(rows)
+
+    rows = sum(len(rows) for rows in cells)
+    print(f"{rows} строк, {rows * args.fights} боев за {time.perf_counter() - start:.1f} с -> {args.output}")
+
+if __name__ == "__main__":
+    main()